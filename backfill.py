@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Script to reprocess the documents under a bucket prefix without re-uploading them.
+It starts, inspects and resumes executions of the backfill state machine, or runs the backfill locally.
+"""
+
+import argparse
+import json
+import sys
+
+import boto3
+
+from stitch_worker.backfill import DEFAULT_SUFFIX, LocalBackfill
+
+
+def state_machine_arn(sfn_client, prefix, suffix):
+    """Find the backfill state machine of the stack"""
+    name = f"{prefix}-{suffix}-backfill"
+    for page in sfn_client.get_paginator("list_state_machines").paginate():
+        for state_machine in page["stateMachines"]:
+            if state_machine["name"] == name:
+                return state_machine["stateMachineArn"]
+    print(f"State machine {name} not found; deploy with BACKFILL_ENABLED=true")
+    sys.exit(1)
+
+
+def upload_queue_urls(sqs_client, prefix, suffix):
+    """Get the queues of the processes triggered by S3 uploads"""
+    from stitch_worker.processes_loader import load_all_processes
+
+    return [
+        sqs_client.get_queue_url(QueueName=f"{prefix}-{suffix}-{process.name}")["QueueUrl"]
+        for process in load_all_processes()
+        if process.enabled and process.is_upload_triggered()
+    ]
+
+
+def start(args):
+    sfn_client = boto3.client("stepfunctions")
+    execution_input = {"bucket": args.bucket, "prefix": args.key_prefix, "suffix": args.key_suffix}
+    response = sfn_client.start_execution(
+        stateMachineArn=state_machine_arn(sfn_client, args.prefix, args.suffix), input=json.dumps(execution_input)
+    )
+    print(f"🚀 Started backfill of s3://{args.bucket}/{args.key_prefix}")
+    print(f"   Execution: {response['executionArn']}")
+
+
+def status(args):
+    sfn_client = boto3.client("stepfunctions")
+    execution = sfn_client.describe_execution(executionArn=args.execution_arn)
+    print(f"📋 Execution {execution['name']}: {execution['status']}")
+
+    for map_run in sfn_client.list_map_runs(executionArn=args.execution_arn)["mapRuns"]:
+        counts = sfn_client.describe_map_run(mapRunArn=map_run["mapRunArn"])["itemCounts"]
+        print(f"📊 Batches: {counts['succeeded']} succeeded, {counts['running']} running, {counts['pending']} pending")
+        print(f"   {counts['failed']} failed, {counts['timedOut']} timed out, {counts['aborted']} aborted")
+    if execution["status"] in ("FAILED", "TIMED_OUT", "ABORTED"):
+        print("🔁 Resume it with: backfill.py resume --execution-arn " + args.execution_arn)
+
+
+def resume(args):
+    sfn_client = boto3.client("stepfunctions")
+    # Redriving only reruns the batches that did not succeed
+    sfn_client.redrive_execution(executionArn=args.execution_arn)
+    print(f"🔁 Resumed {args.execution_arn}")
+
+
+def local(args):
+    queue_urls = args.queue_url or upload_queue_urls(boto3.client("sqs"), args.prefix, args.suffix)
+    backfill = LocalBackfill(
+        boto3.client("s3"),
+        boto3.client("sqs"),
+        queue_urls,
+        batch_size=args.batch_size,
+        documents_per_minute=args.documents_per_minute,
+        max_backlog=args.max_backlog,
+    )
+    sent = backfill.run(args.bucket, args.key_prefix, args.key_suffix, args.checkpoint)
+    print(f"✅ Sent {sent} documents from s3://{args.bucket}/{args.key_prefix} to {len(queue_urls)} queues")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess the documents under a bucket prefix")
+    parser.add_argument("--prefix", default="stitch", help="Resource name prefix")
+    parser.add_argument("--suffix", default="dev", help="Resource name suffix")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    start_parser = commands.add_parser("start", help="Start a backfill execution")
+    local_parser = commands.add_parser("local", help="Run the backfill from this machine")
+    for command_parser in (start_parser, local_parser):
+        command_parser.add_argument("--bucket", required=True, help="Bucket of the documents")
+        command_parser.add_argument("--key-prefix", required=True, help="Key prefix of the documents")
+        command_parser.add_argument("--key-suffix", default=DEFAULT_SUFFIX, help="Only send keys with this suffix")
+    start_parser.set_defaults(handler=start)
+
+    local_parser.add_argument("--queue-url", action="append", help="Target queue (default: the upload queues)")
+    local_parser.add_argument("--batch-size", type=int, default=10, help="Documents per batch (1-10)")
+    local_parser.add_argument("--documents-per-minute", type=int, default=60, help="Target rate")
+    local_parser.add_argument("--max-backlog", type=int, default=100, help="Wait while a queue holds more messages")
+    local_parser.add_argument("--checkpoint", default="backfill-checkpoint.json", help="Progress file for resuming")
+    local_parser.set_defaults(handler=local)
+
+    for name, handler, description in (
+        ("status", status, "Show the progress of an execution"),
+        ("resume", resume, "Rerun the failed batches of an execution"),
+    ):
+        command_parser = commands.add_parser(name, help=description)
+        command_parser.add_argument("--execution-arn", required=True, help="Backfill execution ARN")
+        command_parser.set_defaults(handler=handler)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark the EventBridge pattern matcher with a large number of per-tenant rules.
+Compares the indexed rule lookup with matching every rule and checks that both find the same rules.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from stitch_worker.event_patterns import CompiledPattern, RuleIndex
+from stitch_worker.process_graph import WORKER_EVENT_SOURCE
+from stitch_worker.processes_loader import PROCESSES_YAML_PATH, load_all_processes
+
+
+def build_rules(processes, rule_count):
+    """Copy the process patterns once per tenant, each restricted to the tenant ID"""
+    patterns = [
+        process.event_pattern.to_event_pattern_kwargs() for process in processes if process.event_pattern is not None
+    ]
+    rules = {}
+    for index in range(rule_count):
+        pattern = dict(patterns[index % len(patterns)])
+        tenant_id = f"tenant-{index // len(patterns)}"
+        detail = dict(pattern.get("detail") or {})
+        detail["metadata"] = {**detail.get("metadata", {}), "tenant_id": [tenant_id]}
+        pattern["detail"] = detail
+        rules[f"{tenant_id}/{index % len(patterns)}"] = pattern
+    return rules
+
+
+def build_events(processes, tenant_count, event_count, seed):
+    """Build completion and upload events for random tenants"""
+    rng = random.Random(seed)
+    detail_types = [event for process in processes for event in process.emits]
+    events = []
+    for index in range(event_count):
+        metadata = {"tenant_id": f"tenant-{rng.randrange(tenant_count)}", "feature_types_count": rng.randint(0, 3)}
+        if index % 4 == 0:
+            events.append(
+                {
+                    "source": "aws.s3",
+                    "detail-type": "Object Created",
+                    "detail": {"object": {"key": f"jdtest/{index}.pdf"}, "metadata": metadata},
+                }
+            )
+        else:
+            events.append(
+                {
+                    "source": WORKER_EVENT_SOURCE,
+                    "detail-type": rng.choice(detail_types),
+                    "detail": {"document_id": f"document-{index}", "metadata": metadata},
+                }
+            )
+    return events
+
+
+def measure(match, events, min_seconds):
+    """Run match over the events until min_seconds have passed and return the matches per second"""
+    matched = 0
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for event in events:
+            matched += len(match(event))
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return rounds * len(events) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the EventBridge pattern matcher")
+    parser.add_argument("--rules", type=int, default=10000, help="Number of per-tenant rules")
+    parser.add_argument("--events", type=int, default=1000, help="Number of events to match")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Minimum duration of each measurement")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--yaml-path", default=PROCESSES_YAML_PATH, help="Path to the processes YAML file")
+    args = parser.parse_args()
+
+    processes = load_all_processes(args.yaml_path)
+    rules = build_rules(processes, args.rules)
+    tenant_count = max(1, args.rules // max(1, sum(process.event_pattern is not None for process in processes)))
+    events = build_events(processes, tenant_count, args.events, args.seed)
+
+    print(f"🔧 Compiling {len(rules)} rules...")
+    start = time.perf_counter()
+    index = RuleIndex()
+    for rule_id, pattern in rules.items():
+        index.add(rule_id, pattern)
+    index.candidates(events[0])
+    print(f"⏱️  Indexed in {time.perf_counter() - start:.2f}s")
+
+    compiled = [(rule_id, CompiledPattern(pattern)) for rule_id, pattern in rules.items()]
+
+    def linear_match(event):
+        return [rule_id for rule_id, pattern in compiled if pattern.matches(event)]
+
+    mismatches = sum(index.match(event) != linear_match(event) for event in events)
+    if mismatches:
+        print(f"❌ Indexed and linear matching differ for {mismatches} events")
+        sys.exit(1)
+    print(f"✅ Indexed and linear matching agree on {len(events)} events")
+
+    indexed_rate = measure(index.match, events, args.seconds)
+    linear_rate = measure(linear_match, events, args.seconds)
+    candidates = sum(len(index.candidates(event)) for event in events) / len(events)
+
+    # Summary
+    print("\n📊 Summary:")
+    print(f"📋 Rules: {len(rules)} ({tenant_count} tenants)")
+    print(f"🎯 Candidate rules per event: {candidates:.1f}")
+    print(f"🚀 Indexed: {indexed_rate:,.0f} events/s")
+    print(f"🐢 Linear: {linear_rate:,.0f} events/s")
+    print(f"📈 Speedup: {indexed_rate / linear_rate:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
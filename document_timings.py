@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Script to show the stage timings of a document from the checkpoint ledger.
+Use it to find where a document spent its time, including the wait between stages.
+"""
+
+import argparse
+import sys
+from datetime import datetime, timezone
+
+import boto3
+
+from stitch_worker.runtime.checkpoints import CheckpointLedger, DynamoDBCheckpointStore
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the stage timings of a document")
+    parser.add_argument("--document-id", required=True, help="Document ID")
+    parser.add_argument("--content-hash", help="Only show the runs for this input hash")
+    parser.add_argument("--prefix", default="stitch", help="Table name prefix")
+    parser.add_argument("--suffix", default="dev", help="Table name suffix")
+
+    args = parser.parse_args()
+
+    table_name = f"{args.prefix}-{args.suffix}-checkpoints"
+    ledger = CheckpointLedger(DynamoDBCheckpointStore(table_name, boto3.client("dynamodb")))
+    runs = [
+        checkpoint
+        for checkpoint in ledger.timings(args.document_id)
+        if args.content_hash is None or checkpoint.content_hash == args.content_hash
+    ]
+    if not runs:
+        print(f"No checkpoints found for document {args.document_id} in {table_name}")
+        sys.exit(1)
+
+    print(f"📄 Document {args.document_id}")
+    print(f"{'stage':<28}{'input':<14}{'started (UTC)':<22}{'wait':>9}{'duration':>10}  status")
+    previous_end = None
+    for checkpoint in runs:
+        wait = f"{checkpoint.started_at - previous_end:.1f}s" if previous_end is not None else "-"
+        duration = f"{checkpoint.duration:.1f}s" if checkpoint.duration is not None else "-"
+        print(
+            f"{checkpoint.stage:<28}{checkpoint.content_hash[:12]:<14}{format_time(checkpoint.started_at):<22}"
+            f"{wait:>9}{duration:>10}  {checkpoint.status}"
+        )
+        if checkpoint.completed_at is not None:
+            previous_end = max(previous_end or 0, checkpoint.completed_at)
+
+    # Summary
+    completed = [checkpoint for checkpoint in runs if checkpoint.completed_at is not None]
+    print("\n📊 Summary:")
+    print(f"✅ Completed stages: {len(completed)} of {len(runs)}")
+    if completed:
+        busy = sum(checkpoint.duration for checkpoint in completed)
+        elapsed = max(checkpoint.completed_at for checkpoint in completed) - runs[0].started_at
+        print(f"⏱️  End to end: {elapsed:.1f}s ({busy:.1f}s in stages, {elapsed - busy:.1f}s queued or in parallel)")
+
+
+if __name__ == "__main__":
+    main()
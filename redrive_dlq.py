@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Script to move messages from a process dead-letter queue back to its source queue.
+Run this script after fixing the cause of the failures to reprocess the failed documents. Processes with priority
+lanes share one dead-letter queue; each message is sent back to the queue of its lane.
+"""
+
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from stitch_worker.runtime.priority import HIGH_PRIORITY, HIGH_PRIORITY_QUEUE_SUFFIX, LOW_PRIORITY
+
+# SQS limit for ReceiveMessage, SendMessageBatch, DeleteMessageBatch and ChangeMessageVisibilityBatch
+SQS_MAX_BATCH_SIZE = 10
+
+
+def extract_document_id(body):
+    """Get the document ID from an EventBridge event delivered to a process queue"""
+    try:
+        event = json.loads(body)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(event, dict):
+        return None
+
+    detail = event.get("detail") or {}
+    metadata = detail.get("metadata") or {}
+    for candidate in (detail.get("document_id"), metadata.get("document_id")):
+        if candidate:
+            return str(candidate)
+
+    # S3 Object Created events only carry the object key
+    return (detail.get("object") or {}).get("key")
+
+
+def extract_lane(body):
+    """Get the priority lane of an EventBridge event from detail.metadata.priority, the field the lane rules match"""
+    try:
+        event = json.loads(body)
+    except (TypeError, ValueError):
+        return LOW_PRIORITY
+    if not isinstance(event, dict):
+        return LOW_PRIORITY
+    metadata = (event.get("detail") or {}).get("metadata") or {}
+    return HIGH_PRIORITY if metadata.get("priority") == HIGH_PRIORITY else LOW_PRIORITY
+
+
+class RedriveStats:
+    """Thread-safe counters for a redrive run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.redriven = 0
+        self.skipped = 0
+        self.failed = 0
+        self.reserved = 0
+        self.held_receipt_handles = []
+
+    def add(self, received=0, redriven=0, skipped=0, failed=0):
+        with self.lock:
+            self.received += received
+            self.redriven += redriven
+            self.skipped += skipped
+            self.failed += failed
+
+
+def redrive_batch(sqs_client, dlq_url, target_urls, messages, document_ids, dry_run, stats, lane=None):
+    """
+    Send the matching messages of one batch to the queue of their lane and delete them from the dead-letter queue.
+
+    target_urls maps the lanes to their queue URLs; a process without priority lanes only has LOW_PRIORITY. The lane of
+    a message is read from the message unless lane is given.
+    """
+    matched = []
+    for message in messages:
+        if document_ids is None or extract_document_id(message["Body"]) in document_ids:
+            matched.append(message)
+        else:
+            with stats.lock:
+                stats.held_receipt_handles.append(message["ReceiptHandle"])
+
+    stats.add(received=len(messages), skipped=len(messages) - len(matched))
+    if not matched:
+        return
+
+    lanes = {}
+    for message in matched:
+        message_lane = lane or extract_lane(message["Body"])
+        lanes.setdefault(message_lane if message_lane in target_urls else LOW_PRIORITY, []).append(message)
+
+    if dry_run:
+        for message_lane, lane_messages in lanes.items():
+            for message in lane_messages:
+                print(
+                    f"🔍 Would redrive {message['MessageId']} to the {message_lane} priority lane "
+                    f"(document: {extract_document_id(message['Body'])})"
+                )
+        with stats.lock:
+            stats.held_receipt_handles.extend(message["ReceiptHandle"] for message in matched)
+        stats.add(redriven=len(matched))
+        return
+
+    sent = 0
+    for message_lane, lane_messages in lanes.items():
+        sent += send_and_delete(sqs_client, dlq_url, target_urls[message_lane], lane_messages)
+    stats.add(redriven=sent, failed=len(matched) - sent)
+
+
+def send_and_delete(sqs_client, dlq_url, target_url, matched):
+    """Send messages to a queue and delete the sent ones from the dead-letter queue, returning how many were sent"""
+    entries = [
+        {"Id": str(index), "MessageBody": message["Body"], "MessageAttributes": message.get("MessageAttributes", {})}
+        for index, message in enumerate(matched)
+    ]
+    response = sqs_client.send_message_batch(QueueUrl=target_url, Entries=entries)
+
+    sent = [matched[int(entry["Id"])] for entry in response.get("Successful", [])]
+    for entry in response.get("Failed", []):
+        print(f"❌ Error sending {matched[int(entry['Id'])]['MessageId']}: {entry.get('Message', entry['Code'])}")
+
+    if sent:
+        response = sqs_client.delete_message_batch(
+            QueueUrl=dlq_url,
+            Entries=[
+                {"Id": str(index), "ReceiptHandle": message["ReceiptHandle"]} for index, message in enumerate(sent)
+            ],
+        )
+        for entry in response.get("Failed", []):
+            # The message was already sent, so it will be processed twice if it is redriven again
+            print(f"⚠️  Error deleting {sent[int(entry['Id'])]['MessageId']}: {entry.get('Message', entry['Code'])}")
+
+    return len(sent)
+
+
+def redrive_worker(
+    sqs_client, dlq_url, target_urls, document_ids, max_messages, visibility_timeout, dry_run, stats, lane=None
+):
+    """Receive batches from the dead-letter queue until it is empty or the message limit is reached"""
+    while True:
+        # Reserve the batch up front so concurrent workers never receive more than max_messages in total
+        with stats.lock:
+            batch_size = min(SQS_MAX_BATCH_SIZE, max_messages - stats.reserved) if max_messages else SQS_MAX_BATCH_SIZE
+            stats.reserved += batch_size
+        if batch_size <= 0:
+            return
+
+        response = sqs_client.receive_message(
+            QueueUrl=dlq_url,
+            MaxNumberOfMessages=batch_size,
+            VisibilityTimeout=visibility_timeout,
+            WaitTimeSeconds=1,
+            MessageAttributeNames=["All"],
+        )
+        messages = response.get("Messages", [])
+        with stats.lock:
+            stats.reserved -= batch_size - len(messages)
+        if not messages:
+            return
+
+        redrive_batch(sqs_client, dlq_url, target_urls, messages, document_ids, dry_run, stats, lane)
+
+
+def release_messages(sqs_client, dlq_url, receipt_handles):
+    """Make the skipped messages visible again in the dead-letter queue"""
+    for start in range(0, len(receipt_handles), SQS_MAX_BATCH_SIZE):
+        batch = receipt_handles[start : start + SQS_MAX_BATCH_SIZE]
+        sqs_client.change_message_visibility_batch(
+            QueueUrl=dlq_url,
+            Entries=[
+                {"Id": str(index), "ReceiptHandle": receipt_handle, "VisibilityTimeout": 0}
+                for index, receipt_handle in enumerate(batch)
+            ],
+        )
+
+
+def redrive(
+    sqs_client,
+    dlq_url,
+    target_urls,
+    document_ids=None,
+    concurrency=4,
+    max_messages=0,
+    visibility_timeout=300,
+    dry_run=False,
+    lane=None,
+):
+    """Redrive messages from a dead-letter queue to the queues of their lanes with concurrent batched calls"""
+    stats = RedriveStats()
+    document_ids = set(document_ids) if document_ids else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                redrive_worker,
+                sqs_client,
+                dlq_url,
+                target_urls,
+                document_ids,
+                max_messages,
+                visibility_timeout,
+                dry_run,
+                stats,
+                lane,
+            )
+            for _ in range(concurrency)
+        ]
+        for future in futures:
+            future.result()
+
+    # Messages of other documents (and all messages of a dry run) stay hidden until the scan is done so they are
+    # only read once
+    release_messages(sqs_client, dlq_url, stats.held_receipt_handles)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move messages from a process dead-letter queue to its queue")
+    parser.add_argument("--process", required=True, help="Process name, e.g. block-summarization")
+    parser.add_argument("--prefix", default="stitch", help="Queue name prefix")
+    parser.add_argument("--suffix", default="dev", help="Queue name suffix")
+    parser.add_argument(
+        "--document-id", action="append", dest="document_ids", help="Only redrive messages of this document"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of concurrent receive/send workers")
+    parser.add_argument("--max-messages", type=int, default=0, help="Stop after receiving this many messages")
+    parser.add_argument(
+        "--visibility-timeout", type=int, default=300, help="Seconds received messages stay hidden during the run"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="List the matching messages without moving them")
+    parser.add_argument(
+        "--lane",
+        choices=[HIGH_PRIORITY, LOW_PRIORITY],
+        help="Send every message to this priority lane instead of the lane of its detail.metadata.priority, e.g. for "
+        "uploads of a high priority ingestion route",
+    )
+
+    args = parser.parse_args()
+
+    sqs_client = boto3.client("sqs")
+    queue_name = f"{args.prefix}-{args.suffix}-{args.process}"
+    try:
+        target_urls = {LOW_PRIORITY: sqs_client.get_queue_url(QueueName=queue_name)["QueueUrl"]}
+        dlq_url = sqs_client.get_queue_url(QueueName=f"{queue_name}-dlq")["QueueUrl"]
+    except sqs_client.exceptions.QueueDoesNotExist as e:
+        print(f"Error finding queues for process {args.process}: {e}")
+        sys.exit(1)
+    # The process queue is the low priority lane; the high priority lane only exists with priority_lanes
+    try:
+        high_priority_queue_name = f"{queue_name}{HIGH_PRIORITY_QUEUE_SUFFIX}"
+        target_urls[HIGH_PRIORITY] = sqs_client.get_queue_url(QueueName=high_priority_queue_name)["QueueUrl"]
+    except sqs_client.exceptions.QueueDoesNotExist:
+        if args.lane == HIGH_PRIORITY:
+            print(f"Error: process {args.process} has no high priority lane")
+            sys.exit(1)
+
+    lanes = f"{queue_name} / {high_priority_queue_name}" if HIGH_PRIORITY in target_urls else queue_name
+    print(f"🔧 Redriving {queue_name}-dlq -> {lanes}...")
+    stats = redrive(
+        sqs_client,
+        dlq_url,
+        target_urls,
+        document_ids=args.document_ids,
+        concurrency=args.concurrency,
+        max_messages=args.max_messages,
+        visibility_timeout=args.visibility_timeout,
+        dry_run=args.dry_run,
+        lane=args.lane,
+    )
+
+    # Summary
+    print("\n📊 Summary:")
+    print(f"📥 Received: {stats.received} messages")
+    print(f"{'🔍 Matched' if args.dry_run else '✅ Redriven'}: {stats.redriven} messages")
+    print(f"⏭️  Skipped: {stats.skipped} messages")
+    print(f"❌ Errors: {stats.failed} messages")
+
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,27 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict, PydanticBaseSettingsSource
 
 
+class ModelQuota(BaseModel):
+    """Request and token quota of a model (or other rate-limited API) shared by all stages"""
+
+    requests_per_minute: int = Field(ge=1)
+    tokens_per_minute: int | None = Field(default=None, ge=1)
+
+
+class IngestionRoute(BaseModel):
+    """Uploads that start the pipeline: objects under a key prefix with a key suffix and a size in range"""
+
+    prefix: str = ""
+    suffix: str = ""
+    min_size: int = Field(default=0, ge=0)
+    max_size: int | None = Field(default=None, ge=1)
+    pipeline: str = "default"
+    priority: Literal["high", "low"] = "low"
+
+
 class StitchWorkerSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -16,23 +37,63 @@ class StitchWorkerSettings(BaseSettings):
     lambda_feature_extraction: bool = True
     lambda_document_extraction: bool = True
     lambda_split_file: bool = True
+    lambda_document_completion: bool = False
+    text_extraction_notification_handler: Literal["image", "repo"] = "image"
     openai_api_key: str | None = None
     pinecone_api_key: str | None = None
     pinecone_index_name: str | None = None
+    pinecone_upsert_batch_size: int = Field(default=100, ge=1, le=1000)
+    pinecone_upsert_concurrency: int = Field(default=4, ge=1)
+    pinecone_namespace_concurrency: int = Field(default=4, ge=1)
     create_hub_instance: bool = False
+    provisioned_concurrency: bool = False
     system_admin_api_key: str | None = None
     hub_url: str | None = None
+    hub_endpoint_ttl_seconds: int = Field(default=60, ge=1)
     database_host: str | None = None
     database_port: str | None = None
     database_name: str | None = None
     database_user: str | None = None
     database_password: str | None = None
+    database_pooler: Literal["disabled", "pgbouncer", "rds_proxy"] = "disabled"
+    pgbouncer_port: int = Field(default=6432, ge=1, le=65535)
+    pgbouncer_pool_size: int = Field(default=20, ge=1)
+    pgbouncer_max_client_connections: int = Field(default=1000, ge=1)
+    rds_proxy_vpc_id: str | None = None
+    rds_proxy_db_instance_identifier: str | None = None
+    rds_proxy_db_cluster_identifier: str | None = None
+    rds_proxy_secret_name: str | None = None
+    rds_proxy_database_security_group_id: str | None = None
+    rds_proxy_max_connections_percent: int = Field(default=90, ge=1, le=100)
+    block_insert_mode: Literal["row", "copy"] = "row"
     embedding_batch_size: str = "100"
     document_summary_max_tokens: str = "1000"
     openai_chat_completion_model: str = "gpt-4o"
     openai_embedding_model: str = "text-embedding-3-small"
     chat_completion_temperature: str = "0"
     document_context_separator: str = "\n* "
+    rate_limiter_enabled: bool = False
+    llm_cache_backend: Literal["dynamodb", "s3", "disabled"] = "disabled"
+    llm_cache_ttl_days: int = Field(default=30, ge=1)
+    embedding_cache_enabled: bool = False
+    embedding_cache_ttl_days: int = Field(default=90, ge=1)
+    checkpoint_ledger_enabled: bool = False
+    checkpoint_retention_days: int = Field(default=30, ge=1)
+    document_sharding: bool = False
+    shard_pages_per_shard: int = Field(default=50, ge=1)
+    priority_lanes: bool = False
+    priority_low_max_concurrency: int = Field(default=20, ge=2, le=1000)
+    ingestion_routes: dict[str, IngestionRoute] = {"documents": IngestionRoute(prefix="jdtest/", suffix=".pdf")}
+    backfill_enabled: bool = False
+    backfill_batch_size: int = Field(default=10, ge=1, le=10)
+    backfill_max_concurrency: int = Field(default=5, ge=1, le=1000)
+    backfill_documents_per_minute: int = Field(default=60, ge=1)
+    backfill_max_backlog: int = Field(default=100, ge=0)
+    model_quotas: dict[str, ModelQuota] = {
+        "gpt-4o": ModelQuota(requests_per_minute=5000, tokens_per_minute=800000),
+        "text-embedding-3-small": ModelQuota(requests_per_minute=5000, tokens_per_minute=5000000),
+        "pinecone": ModelQuota(requests_per_minute=6000),
+    }
 
     @classmethod
     def settings_customise_sources(
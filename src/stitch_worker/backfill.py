@@ -0,0 +1,374 @@
+"""
+Backfill of a bucket prefix through the processing pipeline.
+
+The backfill state machine created by StitchWorkerStack lists the objects under a prefix with a Step Functions
+Distributed Map and sends one S3 Object Created event per object to the queues of the processes triggered by uploads,
+in batches, at a fixed rate, and only while those queues are below a backlog limit. LocalBackfill runs the same steps
+in-process, e.g. against moto or a test account, and checkpoints its progress to a local file.
+"""
+
+import json
+import math
+import os
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import Any
+
+# SQS limit for SendMessageBatch, which also bounds the documents per batch
+MAX_BATCH_SIZE = 10
+
+DEFAULT_SUFFIX = ".pdf"
+RESULTS_PREFIX = "backfill-results"
+REQUESTER = "stitch-backfill"
+
+
+def pacing_seconds(batch_size: int, max_concurrency: int, documents_per_minute: int) -> int:
+    """
+    Compute the pause after each batch that keeps the backfill at its rate.
+
+    Args:
+        batch_size: Documents per batch
+        max_concurrency: Batches sent in parallel
+        documents_per_minute: Target rate of the backfill
+
+    Returns:
+        Seconds each batch waits after its messages were sent
+    """
+    return math.ceil(60 * batch_size * max_concurrency / documents_per_minute)
+
+
+def object_created_event(bucket: str, key: str, size: int, etag: str, account: str = "", region: str = "") -> dict:
+    """
+    Build the S3 Object Created event an upload of the object would have sent through EventBridge.
+
+    Args:
+        bucket: Bucket name
+        key: Object key
+        size: Object size in bytes
+        etag: Object ETag, with or without quotes
+        account: AWS account ID
+        region: AWS region
+
+    Returns:
+        EventBridge event, as delivered by the process rules to the process queues
+    """
+    return {
+        "version": "0",
+        "id": str(uuid.uuid4()),
+        "detail-type": "Object Created",
+        "source": "aws.s3",
+        "account": account,
+        "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "region": region,
+        "resources": [f"arn:aws:s3:::{bucket}"],
+        "detail": {
+            "version": "0",
+            "bucket": {"name": bucket},
+            "object": {"key": key, "size": size, "etag": etag.strip('"')},
+            "request-id": str(uuid.uuid4()),
+            "requester": REQUESTER,
+            "reason": "PutObject",
+        },
+    }
+
+
+def build_definition(
+    queue_urls: list[str],
+    results_bucket: str,
+    batch_size: int,
+    max_concurrency: int,
+    documents_per_minute: int,
+    max_backlog: int,
+    backlog_poll_seconds: int = 30,
+) -> dict[str, Any]:
+    """
+    Build the Amazon States Language definition of the backfill state machine.
+
+    The execution input is {"bucket": ..., "prefix": ..., "suffix": ...}; objects whose key does not end with the
+    suffix (default .pdf) are skipped. Each child execution of the Distributed Map handles one batch: for every queue
+    it waits until the backlog is at most max_backlog, sends the batch, and then pauses to keep the rate.
+
+    Args:
+        queue_urls: Queues of the processes triggered by S3 uploads
+        results_bucket: Bucket that receives the Distributed Map results under backfill-results/
+        batch_size: Documents per child execution (1-10)
+        max_concurrency: Child executions running in parallel
+        documents_per_minute: Target rate of the backfill
+        max_backlog: Visible messages a queue may hold before the backfill waits for it
+        backlog_poll_seconds: Seconds between backlog checks while a queue is above max_backlog
+
+    Returns:
+        State machine definition
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+    # One SendMessageBatch entry per object with the event an upload would have sent
+    build_entries = (
+        """(
+        $suffix := $states.input.BatchInput.suffix;
+        $bucket := $states.input.BatchInput.bucket;
+        $arn := $split($states.context.Execution.Id, ":");
+        $objects := $filter($states.input.Items, function($object) {
+            $length($suffix) = 0 or $substring($object.Key, -$length($suffix)) = $suffix
+        });
+        $append([], $map($objects, function($object, $index) {{
+            "Id": $string($index),
+            "MessageBody": $string({
+                "version": "0",
+                "id": $uuid(),
+                "detail-type": "Object Created",
+                "source": "aws.s3",
+                "account": $arn[4],
+                "time": $now(),
+                "region": $arn[3],
+                "resources": ["arn:aws:s3:::" & $bucket],
+                "detail": {
+                    "version": "0",
+                    "bucket": {"name": $bucket},
+                    "object": {"key": $object.Key, "size": $object.Size, "etag": $replace($object.Etag, '"', '')},
+                    "request-id": $uuid(),
+                    "requester": "%s",
+                    "reason": "PutObject"
+                }
+            })
+        }}))
+    )"""
+        % REQUESTER
+    )
+
+    send_batch = {
+        "ProcessorConfig": {"Mode": "INLINE"},
+        "StartAt": "CheckBacklog",
+        "States": {
+            "CheckBacklog": {
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:sqs:getQueueAttributes",
+                "Arguments": {
+                    "QueueUrl": "{% $states.input.queue %}",
+                    "AttributeNames": ["ApproximateNumberOfMessages"],
+                },
+                "Assign": {"backlog": "{% $number($states.result.Attributes.ApproximateNumberOfMessages) %}"},
+                "Output": "{% $states.input %}",
+                "Next": "BacklogTooHigh",
+            },
+            "BacklogTooHigh": {
+                "Type": "Choice",
+                "Choices": [{"Condition": f"{{% $backlog > {max_backlog} %}}", "Next": "WaitForBacklog"}],
+                "Default": "SendBatch",
+            },
+            "WaitForBacklog": {"Type": "Wait", "Seconds": backlog_poll_seconds, "Next": "CheckBacklog"},
+            "SendBatch": {
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:sqs:sendMessageBatch",
+                "Arguments": {"QueueUrl": "{% $states.input.queue %}", "Entries": "{% $entries %}"},
+                "Retry": [{"ErrorEquals": ["States.ALL"], "IntervalSeconds": 2, "MaxAttempts": 3, "BackoffRate": 2}],
+                "Assign": {"failed": "{% $count($states.result.Failed) %}"},
+                "Next": "AllSent",
+            },
+            "AllSent": {
+                "Type": "Choice",
+                "Choices": [{"Condition": "{% $failed > 0 %}", "Next": "SendFailed"}],
+                "Default": "Sent",
+            },
+            "SendFailed": {
+                "Type": "Fail",
+                "Error": "Backfill.SendFailed",
+                "Cause": "SQS rejected part of the batch; resume the execution to retry it",
+            },
+            "Sent": {"Type": "Succeed"},
+        },
+    }
+
+    process_batch = {
+        "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": "STANDARD"},
+        "StartAt": "BuildMessages",
+        "States": {
+            "BuildMessages": {
+                "Type": "Pass",
+                "Assign": {"entries": f"{{% {' '.join(build_entries.split())} %}}"},
+                "Next": "HasMessages",
+            },
+            "HasMessages": {
+                "Type": "Choice",
+                "Choices": [{"Condition": "{% $count($entries) > 0 %}", "Next": "SendToQueues"}],
+                "Default": "NothingToSend",
+            },
+            "NothingToSend": {"Type": "Succeed", "Output": {"sent": 0}},
+            "SendToQueues": {
+                "Type": "Map",
+                "Items": queue_urls,
+                "ItemSelector": {"queue": "{% $states.context.Map.Item.Value %}"},
+                "ItemProcessor": send_batch,
+                "Next": "Pace",
+            },
+            "Pace": {
+                "Type": "Wait",
+                "Seconds": pacing_seconds(batch_size, max_concurrency, documents_per_minute),
+                "Output": {"sent": "{% $count($entries) %}"},
+                "End": True,
+            },
+        },
+    }
+
+    return {
+        "Comment": "Send the objects under a bucket prefix through the processing pipeline",
+        "QueryLanguage": "JSONata",
+        "StartAt": "Backfill",
+        "States": {
+            "Backfill": {
+                "Type": "Map",
+                "Label": "Backfill",
+                "ItemReader": {
+                    "Resource": "arn:aws:states:::s3:listObjectsV2",
+                    "Arguments": {"Bucket": "{% $states.input.bucket %}", "Prefix": "{% $states.input.prefix %}"},
+                },
+                "ItemBatcher": {
+                    "MaxItemsPerBatch": batch_size,
+                    "BatchInput": {
+                        "bucket": "{% $states.input.bucket %}",
+                        "suffix": f'{{% $exists($states.input.suffix) ? $states.input.suffix : "{DEFAULT_SUFFIX}" %}}',
+                    },
+                },
+                "MaxConcurrency": max_concurrency,
+                "ItemProcessor": process_batch,
+                "ResultWriter": {
+                    "Resource": "arn:aws:states:::s3:putObject",
+                    "Arguments": {"Bucket": results_bucket, "Prefix": RESULTS_PREFIX},
+                },
+                "End": True,
+            }
+        },
+    }
+
+
+class BackfillProgress:
+    """Progress of a local backfill, saved after every batch so an interrupted run can be resumed"""
+
+    def __init__(self, bucket: str, prefix: str, suffix: str, start_after: str = "", sent: int = 0) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self.suffix = suffix
+        self.start_after = start_after
+        self.sent = sent
+
+    @classmethod
+    def load(cls, path: str, bucket: str, prefix: str, suffix: str) -> "BackfillProgress":
+        """
+        Load the progress of a previous run of the same backfill, or start a new one.
+
+        Args:
+            path: Checkpoint file
+            bucket: Bucket name
+            prefix: Key prefix
+            suffix: Key suffix
+
+        Returns:
+            Progress to continue from
+        """
+        try:
+            with open(path) as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return cls(bucket, prefix, suffix)
+        if (saved["bucket"], saved["prefix"], saved["suffix"]) != (bucket, prefix, suffix):
+            raise ValueError(f"{path} belongs to the backfill of s3://{saved['bucket']}/{saved['prefix']}")
+        return cls(**saved)
+
+    def save(self, path: str) -> None:
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(vars(self), file)
+        os.replace(temporary_path, path)
+
+
+class LocalBackfill:
+    """In-process stand-in for the backfill state machine, with the same batching, backpressure and pacing"""
+
+    def __init__(
+        self,
+        s3_client: Any,
+        sqs_client: Any,
+        queue_urls: list[str],
+        batch_size: int = MAX_BATCH_SIZE,
+        documents_per_minute: int = 60,
+        max_backlog: int = 100,
+        backlog_poll_seconds: int = 30,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self.s3 = s3_client
+        self.sqs = sqs_client
+        self.queue_urls = queue_urls
+        self.batch_size = batch_size
+        self.documents_per_minute = documents_per_minute
+        self.max_backlog = max_backlog
+        self.backlog_poll_seconds = backlog_poll_seconds
+        self.sleep = sleep
+
+    def run(self, bucket: str, prefix: str, suffix: str = DEFAULT_SUFFIX, checkpoint_path: str | None = None) -> int:
+        """
+        Send the objects under a prefix to the queues, continuing after the last batch of a previous run.
+
+        Args:
+            bucket: Bucket name
+            prefix: Key prefix
+            suffix: Only objects whose key ends with it are sent
+            checkpoint_path: File that records the progress after every batch
+
+        Returns:
+            Number of objects sent, including those of previous runs
+        """
+        progress = (
+            BackfillProgress.load(checkpoint_path, bucket, prefix, suffix)
+            if checkpoint_path
+            else BackfillProgress(bucket, prefix, suffix)
+        )
+        pause = pacing_seconds(self.batch_size, 1, self.documents_per_minute)
+
+        batch = []
+        for item in self._list_objects(bucket, prefix, progress.start_after):
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self._send(bucket, batch, suffix, progress, checkpoint_path)
+                self.sleep(pause)
+                batch = []
+        if batch:
+            self._send(bucket, batch, suffix, progress, checkpoint_path)
+        return progress.sent
+
+    def _list_objects(self, bucket: str, prefix: str, start_after: str):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, StartAfter=start_after):
+            yield from page.get("Contents", [])
+
+    def _send(
+        self, bucket: str, batch: list[dict], suffix: str, progress: BackfillProgress, checkpoint_path: str | None
+    ) -> None:
+        entries = [
+            {
+                "Id": str(index),
+                "MessageBody": json.dumps(object_created_event(bucket, item["Key"], item["Size"], item["ETag"])),
+            }
+            for index, item in enumerate(item for item in batch if item["Key"].endswith(suffix))
+        ]
+        for queue_url in self.queue_urls:
+            if not entries:
+                break
+            while self._backlog(queue_url) > self.max_backlog:
+                self.sleep(self.backlog_poll_seconds)
+            response = self.sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"SQS rejected {len(response['Failed'])} messages for {queue_url}")
+
+        progress.start_after = batch[-1]["Key"]
+        progress.sent += len(entries)
+        if checkpoint_path:
+            progress.save(checkpoint_path)
+
+    def _backlog(self, queue_url: str) -> int:
+        attributes = self.sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["ApproximateNumberOfMessages"])
+        return int(attributes["Attributes"]["ApproximateNumberOfMessages"])
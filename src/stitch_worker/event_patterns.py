@@ -0,0 +1,324 @@
+import re
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any
+
+# processes.yaml uses the snake_case keyword arguments of aws_events.EventPattern
+PATTERN_KEY_ALIASES = {"detail_type": "detail-type"}
+
+# Fields the rule index partitions on first, before looking for other selective fields
+PRIMARY_PATHS = (("source",), ("detail-type",))
+
+# Buckets with at most this many rules are matched one by one instead of being partitioned further
+INDEX_LEAF_SIZE = 8
+
+
+def normalize_pattern(pattern: dict[str, Any]) -> dict[str, Any]:
+    """
+    Convert an event_pattern from processes.yaml to the field names used in EventBridge events.
+
+    Args:
+        pattern: Event pattern using EventPattern keyword arguments or EventBridge field names
+
+    Returns:
+        Event pattern using EventBridge field names
+    """
+    return {PATTERN_KEY_ALIASES.get(key, key): value for key, value in pattern.items() if value is not None}
+
+
+def matches_pattern(pattern: dict[str, Any], event: dict[str, Any]) -> bool:
+    """
+    Check whether an event matches an EventBridge event pattern.
+
+    Args:
+        pattern: Event pattern (see normalize_pattern)
+        event: EventBridge event
+
+    Returns:
+        True if every field of the pattern matches the event
+    """
+    return CompiledPattern(pattern).matches(event)
+
+
+class PatternField:
+    """The conditions on one field of an event pattern; the field matches when any condition matches"""
+
+    __slots__ = ("path", "exists", "predicates", "literals")
+
+    def __init__(self, path: tuple[str, ...], conditions: list[Any]) -> None:
+        self.path = path
+        self.exists: set[bool] = set()
+        self.predicates: list[Callable[[Any], bool]] = []
+        # Set when every condition is an exact value, which lets the rule index partition on this field
+        self.literals: list[Hashable] | None = []
+
+        for condition in conditions:
+            if isinstance(condition, dict):
+                self.literals = None
+                (operator, operand), *_ = condition.items()
+                if operator == "exists":
+                    self.exists.add(bool(operand))
+                else:
+                    self.predicates.append(_compile_condition(operator, operand))
+            else:
+                if self.literals is not None:
+                    self.literals.append(_index_key(condition))
+                self.predicates.append(_equals_predicate(condition))
+
+    def matches(self, values: list[Any]) -> bool:
+        if values:
+            return True in self.exists or any(predicate(value) for predicate in self.predicates for value in values)
+        return False in self.exists
+
+
+class CompiledPattern:
+    """An event pattern flattened into field paths with precompiled conditions"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, pattern: dict[str, Any]) -> None:
+        self.fields = [PatternField(path, conditions) for path, conditions in _flatten(normalize_pattern(pattern))]
+
+    def matches(self, event: dict[str, Any]) -> bool:
+        """
+        Check whether an event matches the pattern.
+
+        Args:
+            event: EventBridge event
+
+        Returns:
+            True if every field of the pattern matches the event
+        """
+        return all(field.matches(lookup(event, field.path)) for field in self.fields)
+
+
+class RuleIndex:
+    """
+    Index of event patterns that only evaluates the rules that can match an event.
+
+    Rules are partitioned on their exact source and detail-type values first and then, for large groups such as
+    per-tenant rules, on the exact-valued field shared by most of the group. Rules without an exact value for a field
+    stay in the residual set of that partition and are always considered.
+    """
+
+    def __init__(self, leaf_size: int = INDEX_LEAF_SIZE) -> None:
+        self.leaf_size = leaf_size
+        self._rules: dict[Hashable, CompiledPattern] = {}
+        self._order: dict[Hashable, int] = {}
+        self._root: _IndexNode | None = None
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def add(self, rule_id: Hashable, pattern: dict[str, Any]) -> None:
+        """
+        Add or replace a rule.
+
+        Args:
+            rule_id: Identifier returned by match for events that match the pattern
+            pattern: Event pattern (see normalize_pattern)
+        """
+        self._rules[rule_id] = CompiledPattern(pattern)
+        self._order.setdefault(rule_id, len(self._order))
+        self._root = None
+
+    def remove(self, rule_id: Hashable) -> None:
+        del self._rules[rule_id]
+        self._root = None
+
+    def candidates(self, event: dict[str, Any]) -> set[Hashable]:
+        """
+        Find the rules that may match an event without evaluating their patterns.
+
+        Args:
+            event: EventBridge event
+
+        Returns:
+            Set of rule identifiers
+        """
+        if self._root is None:
+            self._root = _IndexNode(list(self._rules), self._rules, (), self.leaf_size)
+        return self._root.candidates(event)
+
+    def match(self, event: dict[str, Any]) -> list[Hashable]:
+        """
+        Find the rules that match an event.
+
+        Args:
+            event: EventBridge event
+
+        Returns:
+            List of rule identifiers in the order the rules were added
+        """
+        matched = [rule_id for rule_id in self.candidates(event) if self._rules[rule_id].matches(event)]
+        return sorted(matched, key=self._order.__getitem__)
+
+
+class _IndexNode:
+    __slots__ = ("path", "partitions", "residual", "rules")
+
+    def __init__(
+        self,
+        rule_ids: list[Hashable],
+        rules: dict[Hashable, CompiledPattern],
+        used_paths: tuple[tuple[str, ...], ...],
+        leaf_size: int,
+    ) -> None:
+        self.path = self.partitions = self.residual = None
+        self.rules = rule_ids
+
+        literal_paths: dict[tuple[str, ...], int] = {}
+        for rule_id in rule_ids:
+            for field in rules[rule_id].fields:
+                if field.literals and field.path not in used_paths:
+                    literal_paths[field.path] = literal_paths.get(field.path, 0) + 1
+
+        path = next((path for path in PRIMARY_PATHS if path in literal_paths), None)
+        if path is None and len(rule_ids) > leaf_size and literal_paths:
+            path, count = max(literal_paths.items(), key=lambda item: item[1])
+            if count < 2:
+                path = None
+        if path is None:
+            return
+
+        groups: dict[Hashable, list[Hashable]] = {}
+        residual = []
+        for rule_id in rule_ids:
+            field = next((field for field in rules[rule_id].fields if field.path == path and field.literals), None)
+            if field is None:
+                residual.append(rule_id)
+            else:
+                for key in set(field.literals):
+                    groups.setdefault(key, []).append(rule_id)
+
+        used_paths = (*used_paths, path)
+        self.path = path
+        self.partitions = {key: _IndexNode(group, rules, used_paths, leaf_size) for key, group in groups.items()}
+        self.residual = _IndexNode(residual, rules, used_paths, leaf_size) if residual else None
+        self.rules = None
+
+    def candidates(self, event: dict[str, Any]) -> set[Hashable]:
+        if self.path is None:
+            return set(self.rules)
+
+        found = self.residual.candidates(event) if self.residual else set()
+        for value in lookup(event, self.path):
+            key = _index_key(value)
+            if key is not None and (partition := self.partitions.get(key)):
+                found |= partition.candidates(event)
+        return found
+
+
+def lookup(event: Any, path: tuple[str, ...]) -> list[Any]:
+    """
+    Get the values of a field of an event, flattening arrays.
+
+    Args:
+        event: EventBridge event
+        path: Field path, e.g. ("detail", "metadata", "feature_types_count")
+
+    Returns:
+        List of values; empty when the field does not exist
+    """
+    values = [event]
+    for key in path:
+        values = [item[key] for item in _flatten_arrays(values) if isinstance(item, dict) and key in item]
+        if not values:
+            return []
+    return list(_flatten_arrays(values))
+
+
+def _flatten_arrays(values: Iterable[Any]) -> Iterable[Any]:
+    for value in values:
+        if isinstance(value, list):
+            yield from value
+        else:
+            yield value
+
+
+def _flatten(pattern: dict[str, Any], path: tuple[str, ...] = ()) -> list[tuple[tuple[str, ...], list[Any]]]:
+    fields = []
+    for key, value in pattern.items():
+        if isinstance(value, dict):
+            fields.extend(_flatten(value, (*path, key)))
+        elif isinstance(value, list):
+            fields.append(((*path, key), value))
+        else:
+            raise ValueError(f"Event pattern field {'.'.join((*path, key))} must be an object or an array")
+    return fields
+
+
+def _index_key(value: Any) -> Hashable | None:
+    # Keep booleans apart from 1 and 0, compare numbers by value and leave objects and arrays unindexed
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, int | float):
+        return ("number", float(value))
+    if value is None:
+        return ("null",)
+    return None
+
+
+def _equals_predicate(expected: Any) -> Callable[[Any], bool]:
+    key = _index_key(expected)
+    if key is None:
+        raise ValueError(f"Unsupported event pattern value: {expected!r}")
+    return lambda value: _index_key(value) == key
+
+
+_NUMERIC_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, int | float) and not isinstance(value, bool)
+
+
+def _compile_condition(operator: str, operand: Any) -> Callable[[Any], bool]:
+    if operator == "prefix":
+        return lambda value: isinstance(value, str) and value.startswith(operand)
+    if operator == "suffix":
+        return lambda value: isinstance(value, str) and value.endswith(operand)
+    if operator == "equals-ignore-case":
+        folded = operand.casefold()
+        return lambda value: isinstance(value, str) and value.casefold() == folded
+    if operator == "wildcard":
+        regex = compile_wildcard(operand)
+        return lambda value: isinstance(value, str) and regex.fullmatch(value) is not None
+    if operator == "numeric":
+        checks = [(_NUMERIC_OPERATORS[op], bound) for op, bound in zip(operand[::2], operand[1::2])]
+        return lambda value: _is_number(value) and all(check(value, bound) for check, bound in checks)
+    if operator == "anything-but":
+        if isinstance(operand, dict):
+            inner = _compile_condition(*next(iter(operand.items())))
+            return lambda value: isinstance(value, str) and not inner(value)
+        excluded = {_index_key(item) for item in (operand if isinstance(operand, list) else [operand])}
+        return lambda value: _index_key(value) not in excluded
+    raise ValueError(f"Unsupported event pattern operator: {operator}")
+
+
+_WILDCARDS: dict[str, re.Pattern] = {}
+
+
+def compile_wildcard(wildcard: str) -> re.Pattern:
+    """
+    Compile a wildcard pattern, where * matches any characters and \\* a literal asterisk.
+
+    Args:
+        wildcard: Wildcard pattern
+
+    Returns:
+        Compiled regular expression
+    """
+    if wildcard not in _WILDCARDS:
+        parts = re.split(r"(\\\*|\*)", wildcard)
+        _WILDCARDS[wildcard] = re.compile(
+            "".join(".*" if part == "*" else re.escape("*" if part == "\\*" else part) for part in parts), re.DOTALL
+        )
+    return _WILDCARDS[wildcard]
@@ -0,0 +1,101 @@
+import boto3
+import json
+import math
+import os
+from datetime import datetime, timedelta, timezone
+
+
+def desired_concurrency(target, current, visible, in_flight, oldest_age):
+    """Compute the maximum concurrency of a process from the depth and age of its queue"""
+    # Enough instances to work through the backlog at messages_per_instance messages each
+    desired = math.ceil((visible + in_flight) / target["messages_per_instance"])
+
+    # Messages that keep aging mean the queue is not draining, so grow by half even if the backlog looks small
+    max_message_age = target.get("max_message_age")
+    if max_message_age and oldest_age is not None and oldest_age > max_message_age and visible:
+        desired = max(desired, current + max(1, math.ceil(current / 2)))
+
+    # Scale out at once but only halve the distance when scaling in, to avoid flapping on bursty uploads
+    if desired < current:
+        desired = current - math.ceil((current - desired) / 2)
+
+    return min(max(desired, target["min_concurrency"]), target["max_concurrency"])
+
+
+def get_oldest_message_ages(cloudwatch_client, targets):
+    """Get the latest ApproximateAgeOfOldestMessage of every queue with a single GetMetricData call"""
+    end_time = datetime.now(timezone.utc)
+    response = cloudwatch_client.get_metric_data(
+        MetricDataQueries=[
+            {
+                "Id": f"q{index}",
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": "AWS/SQS",
+                        "MetricName": "ApproximateAgeOfOldestMessage",
+                        "Dimensions": [{"Name": "QueueName", "Value": target["queue_name"]}],
+                    },
+                    "Period": 60,
+                    "Stat": "Maximum",
+                },
+            }
+            for index, target in enumerate(targets)
+        ],
+        StartTime=end_time - timedelta(minutes=5),
+        EndTime=end_time,
+        ScanBy="TimestampDescending",
+    )
+
+    ages = {}
+    for result in response["MetricDataResults"]:
+        if result["Values"]:
+            ages[int(result["Id"][1:])] = result["Values"][0]
+    return ages
+
+
+def handler(event, context):
+    try:
+        targets = json.loads(os.environ["SCALING_TARGETS"])
+        dry_run = os.environ.get("DRY_RUN", "false").lower() == "true"
+
+        sqs_client = boto3.client("sqs")
+        lambda_client = boto3.client("lambda")
+        cloudwatch_client = boto3.client("cloudwatch")
+
+        oldest_ages = get_oldest_message_ages(cloudwatch_client, targets) if targets else {}
+        changes = []
+
+        for index, target in enumerate(targets):
+            try:
+                attributes = sqs_client.get_queue_attributes(
+                    QueueUrl=target["queue_url"],
+                    AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+                )["Attributes"]
+                visible = int(attributes["ApproximateNumberOfMessages"])
+                in_flight = int(attributes["ApproximateNumberOfMessagesNotVisible"])
+                oldest_age = oldest_ages.get(index)
+
+                mapping = lambda_client.get_event_source_mapping(UUID=target["event_source_mapping_id"])
+                current = mapping.get("ScalingConfig", {}).get("MaximumConcurrency") or target["max_concurrency"]
+                desired = desired_concurrency(target, current, visible, in_flight, oldest_age)
+
+                print(
+                    f"{target['process']}: visible={visible} in_flight={in_flight} oldest_age={oldest_age} "
+                    f"concurrency={current} -> {desired}"
+                )
+
+                if desired != current:
+                    if not dry_run:
+                        lambda_client.update_event_source_mapping(
+                            UUID=target["event_source_mapping_id"], ScalingConfig={"MaximumConcurrency": desired}
+                        )
+                    changes.append({"process": target["process"], "from": current, "to": desired})
+
+            except Exception as e:
+                print(f"Error scaling {target['process']}: {str(e)}")
+
+        return {"statusCode": 200, "body": json.dumps({"message": "Success", "changes": changes})}
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {"statusCode": 500, "body": json.dumps(f"Error: {str(e)}")}
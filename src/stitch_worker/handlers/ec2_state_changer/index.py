@@ -2,6 +2,9 @@ import boto3
 import json
 import os
 
+# Bundled from src/stitch_worker next to the handlers directory of the asset
+from runtime.hub_endpoint import HubEndpoint, publish_hub_endpoint
+
 
 def handler(event, context):
     try:
@@ -32,63 +35,23 @@ def handler(event, context):
                 print(f"Instance {instance_id} public DNS name: {public_dns_name}")
                 print(f"New hub URL: {hub_url}")
 
-                # Update Lambda functions' environment variables
-                lambda_client = boto3.client("lambda")
-
-                # Get prefix and suffix from environment or use defaults
-                prefix = os.environ.get("PREFIX", "stitch")
-                suffix = os.environ.get("SUFFIX", "dev")
-
-                # List all Lambda functions with our prefix
-                paginator = lambda_client.get_paginator("list_functions")
-                updated_functions = []
-
-                for page in paginator.paginate():
-                    for function in page["Functions"]:
-                        if function["FunctionName"].startswith(f"{prefix}-{suffix}-"):
-                            try:
-                                # Get current configuration
-                                config_response = lambda_client.get_function_configuration(
-                                    FunctionName=function["FunctionName"]
-                                )
-                                environment = config_response.get("Environment", {})
-                                variables = environment.get("Variables", {})
-
-                                # Track which variables were updated
-                                updated_vars = []
-
-                                # Update HUB_URL if it exists
-                                if "HUB_URL" in variables:
-                                    old_url = variables["HUB_URL"]
-                                    variables["HUB_URL"] = hub_url
-                                    updated_vars.append(f"HUB_URL: {old_url} -> {hub_url}")
-
-                                # Update DATABASE_HOST if it exists
-                                if "DATABASE_HOST" in variables:
-                                    old_host = variables["DATABASE_HOST"]
-                                    variables["DATABASE_HOST"] = public_dns_name
-                                    updated_vars.append(f"DATABASE_HOST: {old_host} -> {public_dns_name}")
-
-                                # Update the function if any variables were changed
-                                if updated_vars:
-                                    lambda_client.update_function_configuration(
-                                        FunctionName=function["FunctionName"], Environment={"Variables": variables}
-                                    )
-                                    updated_functions.append(function["FunctionName"])
-                                    print(f"Updated {function['FunctionName']}: {', '.join(updated_vars)}")
-                                else:
-                                    print(f"Skipped {function['FunctionName']} - no HUB_URL or DATABASE_HOST found")
-
-                            except Exception as e:
-                                print(f"Error updating {function['FunctionName']}: {str(e)}")
+                # Publish the endpoint; the functions read it through their hub endpoint cache, so their
+                # environment and warm containers are left alone
+                parameter_name = os.environ["HUB_ENDPOINT_PARAMETER"]
+                # DATABASE_HOST is only set when the database does not run on the hub instance, e.g. behind RDS Proxy
+                endpoint = HubEndpoint(hub_url, os.environ.get("DATABASE_HOST") or public_dns_name)
+                changed = publish_hub_endpoint(boto3.client("ssm"), parameter_name, endpoint)
+                print(
+                    f"{'Published' if changed else 'Unchanged'} hub endpoint {endpoint.to_json()} in {parameter_name}"
+                )
 
-                print(f"Successfully updated {len(updated_functions)} Lambda functions with new hub URL: {hub_url}")
                 return {
                     "statusCode": 200,
                     "body": json.dumps(
                         {
                             "message": "Success",
-                            "updated_functions": updated_functions,
+                            "changed": changed,
+                            "parameter_name": parameter_name,
                             "hub_url": hub_url,
                             "public_dns_name": public_dns_name,
                         }
@@ -0,0 +1,234 @@
+import boto3
+import json
+import os
+import time
+
+# Bundled from src/stitch_worker next to the handlers directory of the asset
+from event_patterns import matches_pattern
+
+# Seconds a join record is kept after its last update
+JOIN_RECORD_TTL_SECONDS = 7 * 24 * 3600
+
+
+def get_document_id(detail):
+    """Get the document ID of a worker event"""
+    return detail.get("document_id") or (detail.get("metadata") or {}).get("document_id")
+
+
+def get_run_id(detail):
+    """Get the processing run of a worker event, see runtime.runs"""
+    return (detail.get("metadata") or {}).get("run_id")
+
+
+def join_record_key(join_name, document_id, run_id):
+    """
+    Get the key of the join record of a document.
+
+    Each processing run of the document has its own record, so a document processed again completes the join again.
+    Events sent before runs were started share one record per document.
+    """
+    return f"{join_name}#{document_id}#{run_id}" if run_id else f"{join_name}#{document_id}"
+
+
+def shard_member(name, shard):
+    """Get the member a shard contributes to an awaited event, e.g. BlockCroppingCompleted#3"""
+    return f"{name}#{shard['index']}" if shard else name
+
+
+def is_complete(members, shard_count, waits_for):
+    """
+    Tell whether a join record has all its members.
+
+    A shards_of join needs every shard. A waits_for join needs each awaited event once for the document, or once per
+    shard when the event is sent by the stages that run per shard.
+    """
+    if waits_for is None:
+        return shard_count is not None and len(members) >= shard_count
+    return all(
+        awaited in members
+        or (shard_count is not None and all(f"{awaited}#{index}" in members for index in range(shard_count)))
+        for awaited in waits_for
+    )
+
+
+def record_members(dynamodb_client, table_name, join_key, members, skipped, shard_count, detail, waits_for):
+    """
+    Add members to the join record of a document and claim the completion event once all members arrived.
+
+    Members are stored in a string set, so a redelivered event is only counted once.
+    Returns the record when this call claimed the completion, otherwise None.
+    """
+    add_expression = "ADD members :members, skipped :skipped" if skipped else "ADD members :members"
+    set_expression = "SET shard_count = :shard_count, " if shard_count is not None else "SET "
+    update_expression = (
+        f"{add_expression} {set_expression}expires_at = :expires_at, "
+        "first_detail = if_not_exists(first_detail, :detail), "
+        "first_seen_at = if_not_exists(first_seen_at, :now)"
+    )
+    values = {
+        ":members": {"SS": members + skipped},
+        ":expires_at": {"N": str(int(time.time()) + JOIN_RECORD_TTL_SECONDS)},
+        ":detail": {"S": json.dumps(detail)},
+        ":now": {"N": repr(time.time())},
+    }
+    if skipped:
+        values[":skipped"] = {"SS": skipped}
+    if shard_count is not None:
+        values[":shard_count"] = {"N": str(shard_count)}
+
+    record = dynamodb_client.update_item(
+        TableName=table_name,
+        Key={"join_key": {"S": join_key}},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=values,
+        ReturnValues="ALL_NEW",
+    )["Attributes"]
+
+    recorded_shard_count = int(record["shard_count"]["N"]) if "shard_count" in record else None
+    if "completed_at" in record or not is_complete(set(record["members"]["SS"]), recorded_shard_count, waits_for):
+        return None
+
+    try:
+        dynamodb_client.update_item(
+            TableName=table_name,
+            Key={"join_key": {"S": join_key}},
+            UpdateExpression="SET completed_at = :now",
+            ConditionExpression="attribute_not_exists(completed_at)",
+            ExpressionAttributeValues={":now": {"N": repr(time.time())}},
+        )
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        # Another invocation received the last member at the same time and emits the event
+        return None
+    return record
+
+
+def release_completion(dynamodb_client, table_name, join_key):
+    """Undo a completion claim whose event could not be sent, so the retried message claims it again"""
+    dynamodb_client.update_item(
+        TableName=table_name,
+        Key={"join_key": {"S": join_key}},
+        UpdateExpression="REMOVE completed_at",
+    )
+
+
+def shard_members(event):
+    """Get the members and the shard count of a shard event"""
+    shard = event["detail"]["shard"]
+    return [str(shard["index"])], [], int(shard["count"])
+
+
+def awaited_members(event, waits_for, branches):
+    """
+    Get the members and the shard count of an event for a waits_for join.
+
+    An awaited event is a member itself, one per shard for the events of a sharded document. A trigger event of a
+    conditional branch that does not match the branch's pattern means the branch will not run, so the event it would
+    have sent is counted as skipped. Branches that filter on the shard run once per document: a shard event does not
+    decide whether they run.
+    """
+    detail_type = event["detail-type"]
+    shard = event["detail"].get("shard")
+    members = [shard_member(detail_type, shard)] if detail_type in waits_for else []
+    skipped = [
+        shard_member(awaited, shard)
+        for awaited, pattern in branches.items()
+        if detail_type in pattern.get("detail-type", [])
+        and not (shard and "shard" in pattern.get("detail", {}))
+        and not matches_pattern(pattern, event)
+    ]
+    return members, skipped, int(shard["count"]) if shard else None
+
+
+def is_skipped(skipped, awaited, shard_count):
+    """Tell whether an awaited event was skipped for the document, or for every shard"""
+    return awaited in skipped or (
+        shard_count is not None and all(f"{awaited}#{index}" in skipped for index in range(shard_count))
+    )
+
+
+def completion_detail(record, detail, waits_for):
+    """Build the detail of the completion event from the join record and the last event received"""
+    shard_count = int(record["shard_count"]["N"]) if "shard_count" in record else None
+    if waits_for is None:
+        completed = {key: value for key, value in detail.items() if key != "shard"}
+        completed["shards"] = shard_count
+    else:
+        first_detail = json.loads(record["first_detail"]["S"])
+        skipped = set(record.get("skipped", {}).get("SS", []))
+        completed = {
+            "document_id": get_document_id(detail),
+            "metadata": first_detail.get("metadata", {}),
+            "completed": [event for event in waits_for if not is_skipped(skipped, event, shard_count)],
+            "skipped": [event for event in waits_for if is_skipped(skipped, event, shard_count)],
+        }
+        if shard_count is not None:
+            completed["shards"] = shard_count
+    completed["join_latency"] = time.time() - float(record["first_seen_at"]["N"])
+    return completed
+
+
+def handler(event, context):
+    table_name = os.environ["JOIN_TABLE_NAME"]
+    join_name = os.environ["JOIN_NAME"]
+    emits = os.environ["JOIN_EMITS"]
+    event_bus_name = os.environ["EVENT_BUS_NAME"]
+    # Set for waits_for joins; shards_of joins wait for the shard count carried by the events
+    waits_for = json.loads(os.environ["JOIN_WAITS_FOR"]) if os.environ.get("JOIN_WAITS_FOR") else None
+    branches = json.loads(os.environ.get("JOIN_BRANCHES") or "{}")
+
+    dynamodb_client = boto3.client("dynamodb")
+    events_client = boto3.client("events")
+    failures = []
+
+    for record in event.get("Records", []):
+        try:
+            worker_event = json.loads(record["body"])
+            detail = worker_event["detail"]
+            document_id = get_document_id(detail)
+            if not document_id:
+                print(f"Skipping {worker_event.get('detail-type')} event without a document ID")
+                continue
+
+            if waits_for is None:
+                members, skipped, shard_count = shard_members(worker_event)
+            else:
+                members, skipped, shard_count = awaited_members(worker_event, waits_for, branches)
+            if not members and not skipped:
+                continue
+
+            join_key = join_record_key(join_name, document_id, get_run_id(detail))
+            print(
+                f"{join_name}: document {document_id} received {', '.join(members) or '-'}"
+                f" (skipped: {', '.join(skipped) or '-'}, shards: {shard_count or '-'})"
+            )
+
+            completed = record_members(
+                dynamodb_client, table_name, join_key, members, skipped, shard_count, detail, waits_for
+            )
+            if completed is None:
+                continue
+
+            try:
+                response = events_client.put_events(
+                    Entries=[
+                        {
+                            "Source": "stitch.worker",
+                            "DetailType": emits,
+                            "Detail": json.dumps(completion_detail(completed, detail, waits_for)),
+                            "EventBusName": event_bus_name,
+                        }
+                    ]
+                )
+                if response.get("FailedEntryCount"):
+                    raise RuntimeError(f"PutEvents failed: {response['Entries'][0].get('ErrorMessage')}")
+            except Exception:
+                release_completion(dynamodb_client, table_name, join_key)
+                raise
+
+            print(f"{join_name}: document {document_id} complete, sent {emits}")
+
+        except Exception as e:
+            print(f"Error processing message {record.get('messageId')}: {str(e)}")
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    return {"batchItemFailures": failures}
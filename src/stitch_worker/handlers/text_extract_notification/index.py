@@ -1,6 +1,194 @@
-# TODO: Implement the text extraction notification handler
+import boto3
+import json
+import os
+
+# Bundled from src/stitch_worker next to the handlers directory of the asset
+from runtime.runs import start_run
+from runtime.sharding import propagate_shard
+from runtime.textract_jobs import load_job_context
+
+# Blocks requested per GetDocumentAnalysis call, the maximum allowed
+MAX_RESULTS = 1000
+
+# Buffered bytes uploaded as one multipart upload part; every part but the last must be at least 5 MiB
+PART_SIZE = 8 * 1024 * 1024
+
+# JobTag document-extract sets on the analysis of a high priority document
+HIGH_PRIORITY_JOB_TAG = "high"
+
+
+def parse_notification(record):
+    """
+    Get the Textract completion message of an SQS record.
+
+    The message is wrapped in an SNS envelope unless the subscription uses raw message delivery.
+    """
+    body = json.loads(record["body"])
+    if body.get("Type") == "Notification":
+        return json.loads(body["Message"])
+    return body
+
+
+def iter_analysis_pages(textract_client, job_id):
+    """Yield the GetDocumentAnalysis responses of a job, following NextToken one page at a time"""
+    kwargs = {"JobId": job_id, "MaxResults": MAX_RESULTS}
+    while True:
+        response = textract_client.get_document_analysis(**kwargs)
+        yield response
+        next_token = response.get("NextToken")
+        if not next_token:
+            return
+        kwargs["NextToken"] = next_token
+
+
+class MultipartWriter:
+    """
+    Write a stream of bytes to an S3 object in parts, so only one part is held in memory.
+
+    Outputs smaller than one part are written with a single PutObject call.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def close(self):
+        """Upload the rest of the buffer and complete the object"""
+        if self.upload_id is None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            self._upload_part()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        """Drop the uploaded parts, which would otherwise be billed until a lifecycle rule removes them"""
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType="application/x-ndjson"
+            )["UploadId"]
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+
+def write_blocks(textract_client, s3_client, job_id, bucket, key):
+    """
+    Stream the blocks of an analysis to S3 as newline-delimited JSON.
+
+    Returns the analysis summary: pages, block count and document metadata.
+    """
+    writer = MultipartWriter(s3_client, bucket, key)
+    block_count = 0
+    document_metadata = {}
+    try:
+        for page in iter_analysis_pages(textract_client, job_id):
+            if page["JobStatus"] != "SUCCEEDED":
+                raise RuntimeError(f"Textract job {job_id} is {page['JobStatus']}: {page.get('StatusMessage')}")
+            document_metadata = page.get("DocumentMetadata", document_metadata)
+            for block in page.get("Blocks", []):
+                writer.write(json.dumps(block, separators=(",", ":")).encode() + b"\n")
+                block_count += 1
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return {"pages": document_metadata.get("Pages", 0), "block_count": block_count}
+
+
+def extraction_detail(notification, job_context, bucket, key, summary):
+    """
+    Build the detail of the DocumentExtractionCompleted event of a finished analysis.
+
+    The detail of the event that started the job, saved by document-extract, is carried over with its metadata and
+    shard, so the later stages see the same document as if the analysis had been synchronous. An unsharded document
+    starts its processing run here, with the job ID as run ID; shards carry the run started by split-file.
+    """
+    triggering_detail = job_context["detail"]
+    metadata = dict(triggering_detail.get("metadata") or {})
+    if notification.get("JobTag") == HIGH_PRIORITY_JOB_TAG:
+        metadata["priority"] = "high"
+    detail = {name: value for name, value in triggering_detail.items() if name != "shard"}
+    detail.update(
+        {
+            "document_id": job_context["document_id"],
+            "job_id": notification["JobId"],
+            "blocks": {"bucket": bucket, "key": key, "format": "ndjson"},
+            "pages": summary["pages"],
+            "block_count": summary["block_count"],
+            "metadata": metadata,
+        }
+    )
+    if "shard" not in triggering_detail:
+        detail = start_run(detail, notification["JobId"])
+    return propagate_shard(triggering_detail, detail)
 
 
 def handler(event, context):
-    print(event)
-    return {"statusCode": 200, "body": "Text extraction notification received"}
+    bucket = os.environ["TEXT_EXTRACTION_S3_BUCKET"]
+    key_prefix = os.environ["TEXT_EXTRACTION_S3_KEY_PREFIX"].rstrip("/")
+    event_bus_name = os.environ["EVENT_BUS_NAME"]
+
+    textract_client = boto3.client("textract")
+    s3_client = boto3.client("s3")
+    events_client = boto3.client("events")
+    failures = []
+
+    for record in event.get("Records", []):
+        try:
+            notification = parse_notification(record)
+            job_id = notification["JobId"]
+            if notification.get("Status") != "SUCCEEDED":
+                # Failed analyses are left in the dead-letter queue for inspection
+                raise RuntimeError(f"Textract job {job_id} finished with status {notification.get('Status')}")
+
+            # The context is saved right after the job starts; until then the message is retried
+            job_context = load_job_context(s3_client, bucket, key_prefix, job_id)
+            if job_context is None:
+                raise RuntimeError(f"No context saved for Textract job {job_id} by document-extract")
+
+            key = f"{key_prefix}/{job_id}/blocks.ndjson"
+            summary = write_blocks(textract_client, s3_client, job_id, bucket, key)
+            print(f"Wrote {summary['block_count']} blocks of {summary['pages']} pages to s3://{bucket}/{key}")
+
+            response = events_client.put_events(
+                Entries=[
+                    {
+                        "Source": "stitch.worker",
+                        "DetailType": "DocumentExtractionCompleted",
+                        "Detail": json.dumps(extraction_detail(notification, job_context, bucket, key, summary)),
+                        "EventBusName": event_bus_name,
+                    }
+                ]
+            )
+            if response.get("FailedEntryCount"):
+                raise RuntimeError(f"PutEvents failed: {response['Entries'][0].get('ErrorMessage')}")
+
+        except Exception as e:
+            print(f"Error processing message {record.get('messageId')}: {str(e)}")
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    return {"batchItemFailures": failures}
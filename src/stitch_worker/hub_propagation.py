@@ -0,0 +1,189 @@
+"""
+Propagation of the hub endpoint to the environment of the Lambda functions that call the hub.
+
+Used by update_lambda_env.py --rewrite-environment for functions deployed before they read the hub endpoint
+parameter; rewriting the environment restarts every container of the function. It only depends on boto3 and the
+standard library.
+"""
+
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from botocore.exceptions import ClientError
+
+# Tag StitchWorkerStack sets on the functions with hub settings in their environment, valued {prefix}-{suffix}
+HUB_CONSUMER_TAG = "stitch:hub-consumer"
+
+# Error codes of updates that can succeed once the previous update finished or the throttling stopped
+RETRYABLE_ERRORS = ("ResourceConflictException", "PreconditionFailedException", "TooManyRequestsException")
+
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class PropagationResult:
+    """Outcome of the propagation to one function"""
+
+    __slots__ = ("function_name", "status", "changes", "seconds", "attempts", "error")
+
+    def __init__(
+        self,
+        function_name: str,
+        status: str,
+        changes: dict[str, tuple[str, str]] | None = None,
+        seconds: float = 0.0,
+        attempts: int = 0,
+        error: str | None = None,
+    ) -> None:
+        self.function_name = function_name
+        self.status = status
+        self.changes = changes or {}
+        self.seconds = seconds
+        self.attempts = attempts
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"PropagationResult({self.function_name!r}, {self.status!r}, {self.seconds:.2f}s)"
+
+
+def find_hub_consumers(tagging_client: Any, prefix: str, suffix: str) -> list[str]:
+    """
+    Find the functions of a deployment that call the hub by their tag, without listing every function.
+
+    Args:
+        tagging_client: Boto3 Resource Groups Tagging API client
+        prefix: Resource name prefix
+        suffix: Resource name suffix
+
+    Returns:
+        Function ARNs
+    """
+    arns = []
+    paginator = tagging_client.get_paginator("get_resources")
+    for page in paginator.paginate(
+        TagFilters=[{"Key": HUB_CONSUMER_TAG, "Values": [f"{prefix}-{suffix}"]}],
+        ResourceTypeFilters=["lambda:function"],
+    ):
+        arns.extend(mapping["ResourceARN"] for mapping in page["ResourceTagMappingList"])
+    return arns
+
+
+def propagate(
+    lambda_client: Any,
+    function_names: list[str],
+    values: dict[str, str],
+    max_workers: int = 8,
+    max_attempts: int = 5,
+    base_delay: float = 0.5,
+    update_timeout: float = 60.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> list[PropagationResult]:
+    """
+    Set environment variables of functions concurrently, only where they are defined and differ.
+
+    Args:
+        lambda_client: Boto3 Lambda client
+        function_names: Function names or ARNs
+        values: Environment variables to set; a function is only updated for the variables it already defines
+        max_workers: Functions updated at the same time
+        max_attempts: Attempts per function when an update conflicts with another one or is throttled
+        base_delay: Backoff before the second attempt, doubled for each further attempt
+        update_timeout: Seconds to wait for an update to finish
+        sleep: Function used to wait, replaced in tests
+
+    Returns:
+        Result of each function, in the order of function_names
+    """
+    if not function_names:
+        return []
+
+    def run(function_name: str) -> PropagationResult:
+        return _propagate_one(lambda_client, function_name, values, max_attempts, base_delay, update_timeout, sleep)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(function_names))) as executor:
+        return list(executor.map(run, function_names))
+
+
+def _propagate_one(
+    lambda_client: Any,
+    function_name: str,
+    values: dict[str, str],
+    max_attempts: int,
+    base_delay: float,
+    update_timeout: float,
+    sleep: Callable[[float], None],
+) -> PropagationResult:
+    started = time.monotonic()
+    attempts = 0
+    changes: dict[str, tuple[str, str]] = {}
+    try:
+        while True:
+            attempts += 1
+            config = _wait_until_updated(lambda_client, function_name, update_timeout, sleep)
+            variables = config.get("Environment", {}).get("Variables", {})
+            if not values.keys() & variables.keys():
+                return PropagationResult(function_name, SKIPPED, seconds=time.monotonic() - started, attempts=attempts)
+            changes = {
+                name: (variables[name], value) for name, value in values.items() if variables.get(name, value) != value
+            }
+            if not changes:
+                return PropagationResult(
+                    function_name, UNCHANGED, seconds=time.monotonic() - started, attempts=attempts
+                )
+
+            # The revision ID makes the update fail instead of overwriting a concurrent change
+            revision = {"RevisionId": config["RevisionId"]} if config.get("RevisionId") else {}
+            try:
+                lambda_client.update_function_configuration(
+                    FunctionName=function_name,
+                    Environment={"Variables": variables | {name: new for name, (_, new) in changes.items()}},
+                    **revision,
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in RETRYABLE_ERRORS or attempts >= max_attempts:
+                    raise
+                sleep(base_delay * 2 ** (attempts - 1))
+                continue
+
+            config = _wait_until_updated(lambda_client, function_name, update_timeout, sleep)
+            if config.get("LastUpdateStatus") == "Failed":
+                raise RuntimeError(f"update failed: {config.get('LastUpdateStatusReason')}")
+            return PropagationResult(function_name, UPDATED, changes, time.monotonic() - started, attempts)
+    except Exception as e:
+        return PropagationResult(function_name, FAILED, changes, time.monotonic() - started, attempts, str(e))
+
+
+def _wait_until_updated(
+    lambda_client: Any, function_name: str, timeout: float, sleep: Callable[[float], None]
+) -> dict[str, Any]:
+    # Another update can only start once LastUpdateStatus left InProgress
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        config = lambda_client.get_function_configuration(FunctionName=function_name)
+        if config.get("LastUpdateStatus") != "InProgress":
+            return config
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"update still in progress after {timeout:.0f}s")
+        sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+
+def summarize(results: list[PropagationResult]) -> dict[str, int]:
+    """
+    Count the results by status.
+
+    Args:
+        results: Results returned by propagate
+
+    Returns:
+        Number of functions per status
+    """
+    counts = {UPDATED: 0, UNCHANGED: 0, SKIPPED: 0, FAILED: 0}
+    for result in results:
+        counts[result.status] += 1
+    return counts
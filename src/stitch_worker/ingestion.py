@@ -0,0 +1,114 @@
+import re
+from typing import Any
+
+from stitch_worker import IngestionRoute
+
+# Route names are part of EventBridge rule names
+ROUTE_NAME_PATTERN = re.compile(r"^[a-z0-9-]+$")
+
+
+class IngestionRouteError(ValueError):
+    """Raised when an ingestion route is invalid or would feed the pipeline its own output"""
+
+
+def key_condition(route: IngestionRoute) -> dict[str, str] | None:
+    """
+    Build the EventBridge condition on the object key of a route.
+
+    Args:
+        route: Ingestion route
+
+    Returns:
+        Prefix, suffix or wildcard condition, or None if the route accepts every key
+    """
+    if route.prefix and route.suffix:
+        return {"wildcard": f"{_escape_wildcard(route.prefix)}*{_escape_wildcard(route.suffix)}"}
+    if route.prefix:
+        return {"prefix": route.prefix}
+    if route.suffix:
+        return {"suffix": route.suffix}
+    return None
+
+
+def route_detail(route: IngestionRoute, detail: dict[str, Any] | None) -> dict[str, Any]:
+    """
+    Add the key and size filters of a route to the detail pattern of an upload-triggered process.
+
+    Args:
+        route: Ingestion route
+        detail: Detail pattern of the process, which must not filter on the object key or size
+
+    Returns:
+        Detail pattern matching the uploads of the route
+
+    Raises:
+        IngestionRouteError: If the detail pattern already filters on the object key or size
+    """
+    result = dict(detail or {})
+    object_pattern = dict(result.get("object") or {})
+    if "key" in object_pattern or "size" in object_pattern:
+        raise IngestionRouteError("upload event patterns must leave object.key and object.size to the ingestion routes")
+
+    condition = key_condition(route)
+    if condition is not None:
+        object_pattern["key"] = [condition]
+    if route.min_size or route.max_size is not None:
+        bounds = [">=", route.min_size] + (["<=", route.max_size] if route.max_size is not None else [])
+        object_pattern["size"] = [{"numeric": bounds}]
+    if object_pattern:
+        result["object"] = object_pattern
+    return result
+
+
+def upload_key_conditions(routes: dict[str, IngestionRoute]) -> list[dict[str, str]] | None:
+    """
+    Build the object key conditions of the rule that forwards uploads to the worker event bus.
+
+    Args:
+        routes: Ingestion routes by name
+
+    Returns:
+        Key conditions matching the keys of every route, or None if a route accepts every key
+    """
+    conditions = []
+    for route in routes.values():
+        condition = key_condition(route)
+        if condition is None:
+            return None
+        if condition not in conditions:
+            conditions.append(condition)
+    return conditions
+
+
+def check_routes(routes: dict[str, IngestionRoute], output_prefixes: dict[str, str]) -> None:
+    """
+    Validate the ingestion routes against the key prefixes the pipeline writes to.
+
+    A route whose key prefix overlaps an output prefix would start the pipeline again on its own output, so any
+    overlap is rejected regardless of the route suffix.
+
+    Args:
+        routes: Ingestion routes by name
+        output_prefixes: Key prefixes written to the document bucket, mapped to the stage that writes them
+
+    Raises:
+        IngestionRouteError: If a route name or size range is invalid, or a route matches an output prefix
+    """
+    if not routes:
+        raise IngestionRouteError("at least one ingestion route must be defined")
+
+    for name, route in routes.items():
+        if not ROUTE_NAME_PATTERN.match(name):
+            raise IngestionRouteError(f"ingestion route '{name}': name must match {ROUTE_NAME_PATTERN.pattern}")
+        if route.max_size is not None and route.max_size < route.min_size:
+            raise IngestionRouteError(f"ingestion route '{name}': max_size must not be below min_size")
+        for output_prefix, writer in output_prefixes.items():
+            if route.prefix.startswith(output_prefix) or output_prefix.startswith(route.prefix):
+                raise IngestionRouteError(
+                    f"ingestion route '{name}' (prefix '{route.prefix}') matches the objects {writer} writes under "
+                    f"'{output_prefix}'"
+                )
+
+
+def _escape_wildcard(value: str) -> str:
+    return value.replace("*", "\\*")
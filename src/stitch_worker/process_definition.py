@@ -0,0 +1,419 @@
+from typing import Any, Literal
+
+from aws_cdk import aws_iam
+from pydantic import BaseModel, ConfigDict, Field, RootModel, field_validator, model_validator
+
+from stitch_worker.runtime.priority import HIGH_PRIORITY
+
+# Limits enforced by Lambda for SQS event source mappings on standard queues
+MAX_SQS_BATCH_SIZE = 10000
+MAX_SQS_UNBATCHED_SIZE = 10
+MAX_BATCHING_WINDOW_SECONDS = 300
+MIN_MAX_CONCURRENCY = 2
+MAX_MAX_CONCURRENCY = 1000
+
+# Alias used for provisioned concurrency when the process does not name one
+DEFAULT_ALIAS_NAME = "live"
+
+# Source of the completion events emitted by the worker Lambdas
+WORKER_EVENT_SOURCE = "stitch.worker"
+
+# Source of the Object Created events of uploads, which are routed by the ingestion routes
+S3_EVENT_SOURCE = "aws.s3"
+
+# Pipeline variant of the upload-triggered processes that do not name one
+DEFAULT_PIPELINE = "default"
+
+
+class StrictModel(BaseModel):
+    """Base model for process definitions that rejects unknown keys"""
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class EventPatternDefinition(StrictModel):
+    """EventBridge pattern that routes events to the process queue"""
+
+    source: list[str] | None = None
+    detail_type: list[str] | None = None
+    detail: dict[str, Any] | None = None
+    account: list[str] | None = None
+    region: list[str] | None = None
+    resources: list[str] | None = None
+
+    def to_event_pattern_kwargs(self) -> dict[str, Any]:
+        """
+        Convert the pattern to keyword arguments for aws_events.EventPattern.
+
+        Returns:
+            Dictionary of the pattern fields that are set
+        """
+        return self.model_dump(exclude_none=True)
+
+
+class PolicyDefinition(StrictModel):
+    """Additional IAM policy statement attached to the process Lambda role"""
+
+    effect: Literal["ALLOW", "DENY"]
+    actions: list[str] = Field(min_length=1)
+    resources: list[str] = Field(min_length=1)
+
+    def to_policy_statement(self) -> aws_iam.PolicyStatement:
+        """
+        Convert the definition to an IAM PolicyStatement.
+
+        Returns:
+            IAM PolicyStatement
+        """
+        return aws_iam.PolicyStatement(
+            effect=getattr(aws_iam.Effect, self.effect),
+            actions=self.actions,
+            resources=self.resources,
+        )
+
+
+class EnvironmentDefinition(RootModel[dict[str, str]]):
+    """Process specific Lambda environment variables"""
+
+    root: dict[str, str] = {}
+
+    @field_validator("root", mode="before")
+    @classmethod
+    def stringify_values(cls, value: Any) -> Any:
+        # Lambda only accepts string values; unset settings become empty strings
+        if isinstance(value, dict):
+            return {key: "" if item is None else str(item) for key, item in value.items()}
+        return value
+
+
+class ConcurrencyControlDefinition(StrictModel):
+    """Bounds within which the concurrency controller adjusts the maximum concurrency of the SQS event source"""
+
+    min_concurrency: int = Field(default=MIN_MAX_CONCURRENCY, ge=MIN_MAX_CONCURRENCY, le=MAX_MAX_CONCURRENCY)
+    max_concurrency: int = Field(ge=MIN_MAX_CONCURRENCY, le=MAX_MAX_CONCURRENCY)
+    messages_per_instance: int = Field(default=10, ge=1)
+    max_message_age: int | None = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_bounds(self) -> "ConcurrencyControlDefinition":
+        if self.min_concurrency > self.max_concurrency:
+            raise ValueError("min_concurrency must not be greater than max_concurrency")
+        return self
+
+
+class ScalingDefinition(StrictModel):
+    """SQS event source settings for the process Lambda"""
+
+    batch_size: int = Field(default=1, ge=1, le=MAX_SQS_BATCH_SIZE)
+    max_batching_window: int = Field(default=0, ge=0, le=MAX_BATCHING_WINDOW_SECONDS)
+    max_concurrency: int | None = Field(default=None, ge=MIN_MAX_CONCURRENCY, le=MAX_MAX_CONCURRENCY)
+    report_batch_item_failures: bool = False
+    control: ConcurrencyControlDefinition | None = None
+
+    @model_validator(mode="after")
+    def check_batching_window(self) -> "ScalingDefinition":
+        if self.batch_size > MAX_SQS_UNBATCHED_SIZE and self.max_batching_window == 0:
+            raise ValueError(
+                f"max_batching_window must be set when batch_size is greater than {MAX_SQS_UNBATCHED_SIZE}"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_control(self) -> "ScalingDefinition":
+        # The controller starts from max_concurrency, which defaults to the lower bound
+        if self.control is None:
+            return self
+        if self.max_concurrency is None:
+            self.max_concurrency = self.control.min_concurrency
+        elif not self.control.min_concurrency <= self.max_concurrency <= self.control.max_concurrency:
+            raise ValueError("max_concurrency must be between control.min_concurrency and control.max_concurrency")
+        return self
+
+
+class RetryDefinition(StrictModel):
+    """Message retention and dead-letter settings for the process queue"""
+
+    retention_period_days: int = Field(default=14, ge=1, le=14)
+    max_receive_count: int = Field(default=3, ge=1, le=1000)
+
+
+class ScheduledCapacityDefinition(StrictModel):
+    """Scheduled change of the provisioned concurrency limits, e.g. at the start and end of business hours"""
+
+    name: str = Field(pattern=r"^[A-Za-z0-9-]+$")
+    cron: str = Field(pattern=r"^\S+( \S+){5}$")
+    min_capacity: int | None = Field(default=None, ge=0)
+    max_capacity: int | None = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_capacity(self) -> "ScheduledCapacityDefinition":
+        if self.min_capacity is None and self.max_capacity is None:
+            raise ValueError("min_capacity or max_capacity must be set")
+        if self.min_capacity is not None and self.max_capacity is not None and self.min_capacity > self.max_capacity:
+            raise ValueError("min_capacity must not be greater than max_capacity")
+        return self
+
+
+class QueueDepthStepDefinition(StrictModel):
+    """Step of the provisioned concurrency scaling policy on the number of visible messages in the process queue"""
+
+    lower: int | None = Field(default=None, ge=0)
+    upper: int | None = Field(default=None, ge=0)
+    change: int
+
+    @model_validator(mode="after")
+    def check_bounds(self) -> "QueueDepthStepDefinition":
+        if self.lower is None and self.upper is None:
+            raise ValueError("lower or upper must be set")
+        if self.lower is not None and self.upper is not None and self.lower >= self.upper:
+            raise ValueError("lower must be less than upper")
+        return self
+
+
+class AutoScalingDefinition(StrictModel):
+    """Application Auto Scaling settings for the provisioned concurrency of the process alias"""
+
+    min_capacity: int = Field(default=0, ge=0)
+    max_capacity: int = Field(ge=1)
+    target_utilization: float | None = Field(default=None, gt=0, lt=1)
+    time_zone: str | None = None
+    schedules: list[ScheduledCapacityDefinition] = []
+    queue_depth_steps: list[QueueDepthStepDefinition] = Field(default=[], max_length=40)
+
+    @model_validator(mode="after")
+    def check_policies(self) -> "AutoScalingDefinition":
+        if self.min_capacity > self.max_capacity:
+            raise ValueError("min_capacity must not be greater than max_capacity")
+        if self.target_utilization is None and not self.schedules and not self.queue_depth_steps:
+            raise ValueError("target_utilization, schedules or queue_depth_steps must be set")
+        if len(self.queue_depth_steps) == 1:
+            raise ValueError("queue_depth_steps needs at least a scale-out and a scale-in step")
+        return self
+
+
+class ConcurrencyDefinition(StrictModel):
+    """Reserved and provisioned concurrency settings for the process Lambda"""
+
+    enabled: bool = True
+    reserved: int | None = Field(default=None, ge=0)
+    provisioned: int | None = Field(default=None, ge=1)
+    alias: str | None = Field(default=None, pattern=r"^[A-Za-z0-9_-]+$")
+    retain_versions: bool = False
+    autoscaling: AutoScalingDefinition | None = None
+
+    @model_validator(mode="after")
+    def check_concurrency(self) -> "ConcurrencyDefinition":
+        # Provisioned concurrency can only be configured on a published version, which the alias points to
+        if self.alias is None and (self.provisioned is not None or self.autoscaling is not None):
+            self.alias = DEFAULT_ALIAS_NAME
+        if self.reserved is not None:
+            for field, value in (
+                ("provisioned", self.provisioned),
+                ("autoscaling.max_capacity", self.autoscaling.max_capacity if self.autoscaling else None),
+            ):
+                if value is not None and value > self.reserved:
+                    raise ValueError(f"{field} must not be greater than reserved")
+        if self.autoscaling is not None and self.provisioned is not None:
+            if not self.autoscaling.min_capacity <= self.provisioned <= self.autoscaling.max_capacity:
+                raise ValueError("provisioned must be between autoscaling.min_capacity and autoscaling.max_capacity")
+        return self
+
+    @property
+    def initial_provisioned(self) -> int | None:
+        """Provisioned concurrency set on the alias when it is created; auto scaling adjusts it afterwards"""
+        if self.provisioned is not None:
+            return self.provisioned
+        if self.autoscaling is not None and self.autoscaling.min_capacity:
+            return self.autoscaling.min_capacity
+        return None
+
+
+class ShardingDefinition(StrictModel):
+    """Sharding mode of a process: large documents are split into page-range shards that are processed in parallel"""
+
+    enabled: bool = True
+    pages_per_shard: int | None = Field(default=None, ge=1)
+    max_shards: int = Field(default=100, ge=1, le=1000)
+    event_pattern: EventPatternDefinition | None = None
+    emits: list[str] | None = None
+
+
+class JoinDefinition(StrictModel):
+    """
+    Built-in stage that emits one event per document once a set of events arrived for it.
+
+    With waits_for the join waits for each listed event once, or once per shard for the events of stages that run per
+    shard; with shards_of it waits for the event of every shard.
+    """
+
+    emits: str
+    waits_for: list[str] | None = Field(default=None, min_length=1)
+    shards_of: str | None = None
+
+    @model_validator(mode="after")
+    def check_mode(self) -> "JoinDefinition":
+        if (self.waits_for is None) == (self.shards_of is None):
+            raise ValueError("exactly one of waits_for and shards_of must be set")
+        return self
+
+    def to_event_pattern(self) -> EventPatternDefinition:
+        """
+        Build the pattern that routes the awaited events to the join queue.
+
+        Returns:
+            Event pattern matching the waits_for events, which the join counts per shard for sharded documents, or the
+            shards_of events of the shards
+        """
+        if self.waits_for is not None:
+            return EventPatternDefinition(source=[WORKER_EVENT_SOURCE], detail_type=list(self.waits_for))
+        return EventPatternDefinition(
+            source=[WORKER_EVENT_SOURCE],
+            detail_type=[self.shards_of],
+            detail={"shard": {"count": [{"exists": True}]}},
+        )
+
+
+class PriorityLanesDefinition(StrictModel):
+    """
+    High and low priority queues of a process, so interactive documents are not queued behind bulk loads.
+
+    The low priority lane is capped at low_max_concurrency; the rest of the reserved concurrency of the process is
+    left to the high priority lane.
+    """
+
+    enabled: bool = True
+    high_max_concurrency: int | None = Field(default=None, ge=MIN_MAX_CONCURRENCY, le=MAX_MAX_CONCURRENCY)
+    low_max_concurrency: int | None = Field(default=None, ge=MIN_MAX_CONCURRENCY, le=MAX_MAX_CONCURRENCY)
+
+
+class ProcessDefinition(StrictModel):
+    """A single processing stage: an SQS queue, a Lambda function and an EventBridge rule"""
+
+    name: str = Field(pattern=r"^[a-z0-9-]+$")
+    enabled: bool
+    module: str | None = Field(default=None, pattern=r"^[a-z0-9_]+$")
+    id_prefix: str = Field(pattern=r"^[A-Za-z0-9]+$")
+    event_pattern: EventPatternDefinition | None = None
+    emits: list[str] = []
+    additional_policies: list[PolicyDefinition] = []
+    timeout: int = Field(default=300, ge=1, le=900)
+    memory_size: int = Field(default=128, ge=128, le=10240)
+    environment: EnvironmentDefinition = EnvironmentDefinition()
+    scaling: ScalingDefinition = ScalingDefinition()
+    retry: RetryDefinition = RetryDefinition()
+    concurrency: ConcurrencyDefinition = ConcurrencyDefinition()
+    llm_cache: bool = False
+    embedding_cache: bool = False
+    sharding: ShardingDefinition | None = None
+    join: JoinDefinition | None = None
+    priority_lanes: PriorityLanesDefinition | None = None
+    pipelines: list[str] = Field(default=[DEFAULT_PIPELINE], min_length=1)
+    output_prefixes: list[str] = []
+
+    @field_validator("additional_policies", mode="before")
+    @classmethod
+    def drop_empty_policies(cls, value: Any) -> Any:
+        if isinstance(value, list):
+            return [policy for policy in value if policy]
+        return value
+
+    @model_validator(mode="after")
+    def apply_modes(self) -> "ProcessDefinition":
+        # Join stages run the built-in join handler, every other stage a worker module
+        if self.join is not None:
+            if self.module is not None:
+                raise ValueError("module must not be set for a join stage")
+            self.event_pattern = self.event_pattern or self.join.to_event_pattern()
+            self.emits = self.emits or [self.join.emits]
+        elif self.module is None:
+            raise ValueError("module must be set unless the process is a join stage")
+
+        # In sharding mode the process is routed and emits according to the sharding block
+        if self.sharding is not None and self.sharding.enabled:
+            if self.sharding.event_pattern is not None:
+                self.event_pattern = self.sharding.event_pattern
+            if self.sharding.emits is not None:
+                self.emits = self.sharding.emits
+        return self
+
+    @model_validator(mode="after")
+    def check_priority_lanes(self) -> "ProcessDefinition":
+        lanes = self.priority_lanes
+        if lanes is None or not lanes.enabled:
+            return self
+        if self.join is not None:
+            raise ValueError("priority_lanes cannot be enabled for a join stage")
+        if self.event_pattern is None:
+            raise ValueError("priority_lanes need an event_pattern to route on")
+
+        # The concurrency controller adjusts the low priority lane, starting from scaling.max_concurrency
+        if self.scaling.control is not None:
+            if lanes.low_max_concurrency is not None:
+                raise ValueError("priority_lanes.low_max_concurrency is set by the concurrency controller")
+            lanes.low_max_concurrency = self.scaling.max_concurrency
+            low_ceiling = self.scaling.control.max_concurrency
+        else:
+            lanes.low_max_concurrency = lanes.low_max_concurrency or self.scaling.max_concurrency
+            low_ceiling = lanes.low_max_concurrency
+        if low_ceiling is None:
+            raise ValueError("priority_lanes.low_max_concurrency or scaling.max_concurrency must be set")
+
+        reserved = self.concurrency.reserved if self.concurrency.enabled else None
+        if reserved is not None and low_ceiling >= reserved:
+            raise ValueError("the low priority lane must leave part of concurrency.reserved to the high priority lane")
+        return self
+
+    def lane_event_patterns(self) -> tuple[EventPatternDefinition, EventPatternDefinition]:
+        """
+        Split the event pattern into the patterns of the high and low priority lanes, on detail.metadata.priority.
+
+        Upload-triggered processes are not split here: each ingestion route sends its uploads to one lane.
+
+        Returns:
+            Tuple of the high priority pattern and the low priority pattern
+
+        Raises:
+            ValueError: If the pattern does not match only worker events
+        """
+        pattern = self.event_pattern
+        if pattern.source != [WORKER_EVENT_SOURCE]:
+            raise ValueError(f"process '{self.name}': priority lanes need a pattern on {WORKER_EVENT_SOURCE} events")
+
+        path = ("metadata", "priority")
+        high_conditions = [HIGH_PRIORITY]
+        low_conditions = [{"anything-but": [HIGH_PRIORITY]}, {"exists": False}]
+        return (
+            pattern.model_copy(update={"detail": _with_condition(pattern.detail, path, high_conditions)}),
+            pattern.model_copy(update={"detail": _with_condition(pattern.detail, path, low_conditions)}),
+        )
+
+    def is_upload_triggered(self) -> bool:
+        """
+        Check whether the process is started by uploads, through the ingestion routes of its pipelines.
+
+        Returns:
+            True if the event pattern matches S3 events
+        """
+        return self.event_pattern is not None and self.event_pattern.source == [S3_EVENT_SOURCE]
+
+    def policy_statements(self) -> list[aws_iam.PolicyStatement]:
+        """
+        Build the IAM PolicyStatements for the additional policies.
+
+        Returns:
+            List of IAM PolicyStatements
+        """
+        return [policy.to_policy_statement() for policy in self.additional_policies]
+
+
+def _with_condition(detail: dict[str, Any] | None, path: tuple[str, ...], conditions: list[Any]) -> dict[str, Any]:
+    """Add the conditions on a detail field to a detail pattern, which must not filter on that field yet"""
+    result = dict(detail or {})
+    node = result
+    for key in path[:-1]:
+        node[key] = dict(node.get(key) or {})
+        node = node[key]
+    if path[-1] in node:
+        raise ValueError(f"event pattern already filters on detail.{'.'.join(path)}")
+    node[path[-1]] = conditions
+    return result
@@ -0,0 +1,314 @@
+import argparse
+import sys
+from typing import Any
+
+from stitch_worker.event_patterns import normalize_pattern
+from stitch_worker.process_definition import WORKER_EVENT_SOURCE, EventPatternDefinition, ProcessDefinition
+
+
+class ProcessGraphError(ValueError):
+    """Raised when the process graph cannot be executed, e.g. because it contains a cycle"""
+
+
+class Edge:
+    """A completion event routed from one process to another"""
+
+    __slots__ = ("producer", "consumer", "event", "conditional")
+
+    def __init__(self, producer: str, consumer: str, event: str, conditional: bool) -> None:
+        self.producer = producer
+        self.consumer = consumer
+        self.event = event
+        self.conditional = conditional
+
+    def __repr__(self) -> str:
+        return f"Edge({self.producer!r} -> {self.consumer!r} on {self.event!r})"
+
+
+class ProcessGraph:
+    """
+    Pipeline graph compiled from the process definitions.
+
+    A process consumes the events matched by its event_pattern and produces the events listed in emits. Events with
+    the stitch.worker source connect processes; any other source is an external trigger such as S3 uploads.
+    """
+
+    def __init__(self, processes: list[ProcessDefinition]) -> None:
+        self.processes = {process.name: process for process in processes}
+        self.triggers: dict[str, list[str]] = {}
+        self.edges: list[Edge] = []
+
+        consumers: dict[str, list[tuple[str, bool]]] = {}
+        for process in processes:
+            if not process.event_pattern:
+                continue
+            pattern = process.event_pattern
+            for source in pattern.source or []:
+                for detail_type in pattern.detail_type or [""]:
+                    if source == WORKER_EVENT_SOURCE:
+                        consumers.setdefault(detail_type, []).append(
+                            (process.name, _is_conditional_on_worker_events(process))
+                        )
+                    else:
+                        trigger = f"{source}: {detail_type}" if detail_type else source
+                        self.triggers.setdefault(trigger, []).append(process.name)
+
+        self.unconsumed_events: dict[str, list[str]] = {}
+        for process in processes:
+            for event in process.emits:
+                if event not in consumers:
+                    self.unconsumed_events.setdefault(event, []).append(process.name)
+                for consumer, conditional in consumers.get(event, []):
+                    self.edges.append(Edge(process.name, consumer, event, conditional))
+
+        self.emitted_events = {event for process in processes for event in process.emits}
+        self.unproduced_events = sorted(set(consumers) - self.emitted_events)
+
+        triggered = {name for names in self.triggers.values() for name in names}
+        reachable = {edge.consumer for edge in self.edges}
+        self.orphan_stages = [name for name in self.processes if name not in triggered | reachable]
+
+    def resolve_join(self, name: str) -> tuple[list[str], dict[str, dict[str, Any]]]:
+        """
+        Work out which of the events a waits_for join stage awaits can arrive for a document.
+
+        Events without an enabled producer are never sent and are left out. Events whose only producer is triggered by
+        worker events through a detail filter other than the shard are conditional: the join also receives the
+        producer's trigger events and counts the event as skipped when a trigger does not match the producer's pattern.
+
+        Args:
+            name: Name of the join stage
+
+        Returns:
+            Tuple of the awaited events and the event patterns of the conditional producers by event
+        """
+        join = self.processes[name].join
+        producers: dict[str, list[ProcessDefinition]] = {}
+        for process in self.processes.values():
+            for event in process.emits:
+                producers.setdefault(event, []).append(process)
+
+        waits_for = [event for event in join.waits_for if event in producers]
+        branches = {
+            event: normalize_pattern(producers[event][0].event_pattern.to_event_pattern_kwargs())
+            for event in waits_for
+            if len(producers[event]) == 1 and _is_conditional_on_worker_events(producers[event][0])
+        }
+        return waits_for, branches
+
+    def join_event_pattern(self, name: str) -> EventPatternDefinition:
+        """
+        Build the pattern routing events to a waits_for join stage.
+
+        Args:
+            name: Name of the join stage
+
+        Returns:
+            Copy of the stage's event pattern that also matches the trigger events of its conditional branches
+        """
+        waits_for, branches = self.resolve_join(name)
+        trigger_types = [detail_type for pattern in branches.values() for detail_type in pattern.get("detail-type", [])]
+        return self.processes[name].event_pattern.model_copy(
+            update={"detail_type": list(dict.fromkeys(waits_for + trigger_types))}
+        )
+
+    def successors(self, name: str) -> list[str]:
+        return list(dict.fromkeys(edge.consumer for edge in self.edges if edge.producer == name))
+
+    def fan_out(self) -> dict[str, int]:
+        """
+        Count the downstream processes each process triggers.
+
+        Returns:
+            Dictionary of process names and the number of distinct downstream processes
+        """
+        return {name: len(self.successors(name)) for name in self.processes}
+
+    def find_cycles(self) -> list[list[str]]:
+        """
+        Find the cycles in the graph with a depth-first search.
+
+        Returns:
+            List of cycles, each as the list of process names that form it
+        """
+        cycles = []
+        state: dict[str, int] = {}  # 1 = on the current path, 2 = done
+        path: list[str] = []
+
+        def visit(name: str) -> None:
+            state[name] = 1
+            path.append(name)
+            for successor in self.successors(name):
+                if state.get(successor) == 1:
+                    cycles.append([*path[path.index(successor) :], successor])
+                elif successor not in state:
+                    visit(successor)
+            path.pop()
+            state[name] = 2
+
+        for name in self.processes:
+            if name not in state:
+                visit(name)
+        return cycles
+
+    def validate(self) -> None:
+        """
+        Check that the graph can be executed.
+
+        Raises:
+            ProcessGraphError: If the graph contains a cycle
+        """
+        if cycles := self.find_cycles():
+            raise ProcessGraphError(
+                "Process graph contains cycles: " + "; ".join(" -> ".join(cycle) for cycle in cycles)
+            )
+
+    def critical_path(self) -> tuple[list[str], int]:
+        """
+        Find the longest chain of processes, weighted by each process timeout.
+
+        Returns:
+            Tuple of the process names on the critical path and its worst-case duration in seconds
+
+        Raises:
+            ProcessGraphError: If the graph contains a cycle
+        """
+        self.validate()
+
+        longest: dict[str, tuple[int, list[str]]] = {}
+
+        def visit(name: str) -> tuple[int, list[str]]:
+            if name not in longest:
+                tails = [visit(successor) for successor in self.successors(name)]
+                duration, tail = max(tails, key=lambda item: item[0], default=(0, []))
+                longest[name] = (self.processes[name].timeout + duration, [name, *tail])
+            return longest[name]
+
+        duration, path = max((visit(name) for name in self.processes), key=lambda item: item[0], default=(0, []))
+        return path, duration
+
+    def to_mermaid(self) -> str:
+        """
+        Render the graph as a mermaid flowchart.
+
+        Returns:
+            Mermaid diagram source
+        """
+        lines = ["graph TD"]
+        for index, (trigger, names) in enumerate(self.triggers.items()):
+            for name in names:
+                lines.append(f'    trigger{index}["{trigger}"] --> {_node_id(name)}[{name}]')
+        for edge in self.edges:
+            arrow = "-.->" if edge.conditional else "-->"
+            lines.append(
+                f"    {_node_id(edge.producer)}[{edge.producer}] {arrow}|{edge.event}| "
+                f"{_node_id(edge.consumer)}[{edge.consumer}]"
+            )
+        for event, producers in self.unconsumed_events.items():
+            for producer in producers:
+                lines.append(f"    {_node_id(producer)}[{producer}] --> event_{event}([{event}])")
+        for name in self.orphan_stages:
+            lines.append(f"    {_node_id(name)}[{name}]")
+
+        lines.append("")
+        lines.append("    classDef trigger fill:#ff9999,stroke:#333,stroke-width:2px")
+        lines.append("    classDef lambda fill:#99ccff,stroke:#333,stroke-width:2px")
+        lines.append("    classDef event fill:#eeeeee,stroke:#333,stroke-dasharray:3")
+        if self.triggers:
+            lines.append(f"    class {','.join(f'trigger{index}' for index in range(len(self.triggers)))} trigger")
+        if self.processes:
+            lines.append(f"    class {','.join(_node_id(name) for name in self.processes)} lambda")
+        if self.unconsumed_events:
+            lines.append(f"    class {','.join(f'event_{event}' for event in self.unconsumed_events)} event")
+        return "\n".join(lines)
+
+    def to_dot(self) -> str:
+        """
+        Render the graph in Graphviz DOT format.
+
+        Returns:
+            DOT source
+        """
+        lines = ["digraph processes {", "    rankdir=TB;", "    node [shape=box];"]
+        for trigger, names in self.triggers.items():
+            lines.append(f'    "{trigger}" [shape=ellipse];')
+            for name in names:
+                lines.append(f'    "{trigger}" -> "{name}";')
+        for edge in self.edges:
+            style = ", style=dashed" if edge.conditional else ""
+            lines.append(f'    "{edge.producer}" -> "{edge.consumer}" [label="{edge.event}"{style}];')
+        for event, producers in self.unconsumed_events.items():
+            lines.append(f'    "{event}" [shape=plaintext];')
+            for producer in producers:
+                lines.append(f'    "{producer}" -> "{event}";')
+        for name in self.orphan_stages:
+            lines.append(f'    "{name}";')
+        lines.append("}")
+        return "\n".join(lines)
+
+    def report(self) -> str:
+        """
+        Summarize the graph analysis.
+
+        Returns:
+            Human readable report
+        """
+        lines = []
+        if cycles := self.find_cycles():
+            lines.append("Cycles:")
+            lines.extend(f"  {' -> '.join(cycle)}" for cycle in cycles)
+        else:
+            path, duration = self.critical_path()
+            lines.append(f"Critical path ({duration}s worst case): {' -> '.join(path)}")
+
+        fan_out = self.fan_out()
+        lines.append(f"Max fan-out: {max(fan_out.values(), default=0)}")
+        lines.extend(
+            f"  {name}: {', '.join(self.successors(name))}"
+            for name, count in sorted(fan_out.items(), key=lambda item: -item[1])
+            if count
+        )
+        lines.append(f"Orphan stages: {', '.join(self.orphan_stages) or '-'}")
+        lines.append(f"Unconsumed events: {', '.join(self.unconsumed_events) or '-'}")
+        lines.append(f"Consumed events nobody emits: {', '.join(self.unproduced_events) or '-'}")
+        return "\n".join(lines)
+
+
+def _is_conditional_on_worker_events(process: ProcessDefinition) -> bool:
+    # A filter on the shard alone only routes the events of sharded documents, e.g. document-summarization runs on
+    # DocumentShardsAggregated instead of the shard events, so the process still runs for every document
+    pattern = process.event_pattern
+    return (
+        pattern is not None
+        and WORKER_EVENT_SOURCE in (pattern.source or [])
+        and any(key != "shard" for key in pattern.detail or {})
+    )
+
+
+def _node_id(name: str) -> str:
+    return name.replace("-", "_")
+
+
+def main() -> None:
+    from stitch_worker.processes_loader import PROCESSES_YAML_PATH, load_all_processes
+
+    parser = argparse.ArgumentParser(description="Compile processes.yaml into the pipeline graph")
+    parser.add_argument("--format", choices=["report", "mermaid", "dot"], default="report", help="Output format")
+    parser.add_argument("--yaml-path", default=PROCESSES_YAML_PATH, help="Path to the processes YAML file")
+    args = parser.parse_args()
+
+    processes = load_all_processes(args.yaml_path)
+    graph = ProcessGraph([process for process in processes if process.enabled])
+
+    if args.format == "mermaid":
+        print(graph.to_mermaid())
+    elif args.format == "dot":
+        print(graph.to_dot())
+    else:
+        print(graph.report())
+        if graph.find_cycles():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
+import hashlib
 import os
-import copy
 from typing import Any
 
 import yaml
-from aws_cdk import aws_iam
+from pydantic import ValidationError
+
+from stitch_worker import StitchWorkerSettings
+from stitch_worker.process_definition import ProcessDefinition
+from stitch_worker.template_engine import compile_tree, render_tree
+
+PROCESSES_YAML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processes.yaml")
+
+# Compiled process templates keyed by the SHA-256 hash of the YAML content
+_COMPILED_PROCESSES: dict[str, tuple[list[Any] | None, dict[tuple, int]]] = {}
+
+
+class ProcessConfigError(ValueError):
+    """Raised when processes.yaml contains an invalid process definition"""
+
+    def __init__(self, yaml_path: str, line: int | None, message: str) -> None:
+        self.yaml_path = yaml_path
+        self.line = line
+        location = f"{yaml_path}:{line}" if line else yaml_path
+        super().__init__(f"{location}: {message}")
 
 
 def load_processes_config(
@@ -16,9 +35,13 @@ def load_processes_config(
     pinecone_index_name: str = None,
     ec2_host: str = None,
     database_password: str = None,
-) -> list[dict[str, Any]]:
+    database_host: str = None,
+    database_port: str = None,
+    yaml_path: str = PROCESSES_YAML_PATH,
+    strict: bool = True,
+) -> list[ProcessDefinition]:
     """
-    Load processes configuration from YAML file and substitute template variables.
+    Load processes configuration from YAML file, substitute template variables and validate it.
 
     Args:
         settings: Settings dictionary containing lambda enable flags
@@ -30,95 +53,151 @@ def load_processes_config(
         pinecone_index_name: Pinecone index name
         ec2_host: EC2 host
         database_password: Database password
+        database_host: Database host the processes connect to, e.g. a connection pooler, overriding the settings
+        database_port: Database port the processes connect to, overriding the settings
+        yaml_path: Path to the processes YAML file
+        strict: Raise when a template variable is undefined instead of leaving it in place
 
     Returns:
-        List of process configurations with substituted values
-    """
-    # Get the directory of this file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    yaml_path = os.path.join(current_dir, "processes.yaml")
-
-    with open(yaml_path, "r") as file:
-        config = yaml.safe_load(file)
-
-    processes = config["processes"]
+        List of validated process definitions
 
-    # Template variable mapping
-    template_vars: dict[str, Any] = {}
+    Raises:
+        ProcessConfigError: If a process has unknown keys, invalid values or undefined template variables
+    """
+    compiled_processes, line_numbers = _load_compiled_processes(yaml_path)
 
-    # Add all settings values dynamically with ${key} format
-    for key, value in settings.items():
-        template_vars[f"${{{key}}}"] = value
+    # Template variable mapping, starting with all settings values
+    template_vars: dict[str, Any] = dict(settings)
 
     # Add explicit mappings for backward compatibility and special cases
     explicit_mappings = {
-        "${s3_bucket_name}": s3_bucket_name,
-        "${document_extraction_topic_arn}": document_extraction_topic_arn or "",
-        "${document_extraction_role_arn}": document_extraction_role_arn or "",
-        "${openai_api_key}": openai_api_key or "",
-        "${pinecone_api_key}": pinecone_api_key or "",
-        "${pinecone_index_name}": pinecone_index_name or "",
-        "${database_host}": settings.get("database_host") or ec2_host,
-        "${database_port}": settings.get("database_port"),
-        "${database_name}": settings.get("database_name"),
-        "${database_user}": settings.get("database_user"),
-        "${database_password}": database_password or "",
+        "s3_bucket_name": s3_bucket_name,
+        "document_extraction_topic_arn": document_extraction_topic_arn or "",
+        "document_extraction_role_arn": document_extraction_role_arn or "",
+        "openai_api_key": openai_api_key or "",
+        "pinecone_api_key": pinecone_api_key or "",
+        "pinecone_index_name": pinecone_index_name or "",
+        "database_host": database_host or settings.get("database_host") or ec2_host or "",
+        "database_port": database_port or settings.get("database_port") or "",
+        "database_name": settings.get("database_name") or "",
+        "database_user": settings.get("database_user") or "",
+        "database_password": database_password or "",
     }
 
     # Update template_vars with explicit mappings (these will override dynamic ones if there are conflicts)
     template_vars.update(explicit_mappings)
 
-    processed_processes = []
+    undefined: list[tuple[tuple, str]] | None = [] if strict else None
+    rendered_processes = [
+        render_tree(process, template_vars, ("processes", index), undefined)
+        for index, process in enumerate(compiled_processes)
+    ]
+
+    if undefined:
+        details = ", ".join(f"${{{name}}} (line {_line_for(line_numbers, path)})" for path, name in undefined)
+        raise ProcessConfigError(
+            yaml_path, _line_for(line_numbers, undefined[0][0]), f"undefined template variables: {details}"
+        )
 
-    for process in processes:
-        # Deep copy the process to avoid modifying the original
-        processed_process = copy.deepcopy(process)
+    process_definitions = []
 
-        # Substitute template variables in the process
-        processed_process = _substitute_template_vars(processed_process, template_vars)
+    for index, process in enumerate(rendered_processes):
+        try:
+            process_definitions.append(ProcessDefinition.model_validate(process))
+        except ValidationError as e:
+            error = e.errors()[0]
+            location = ".".join(str(part) for part in error["loc"]) or "process"
+            raise ProcessConfigError(
+                yaml_path,
+                _line_for(line_numbers, ("processes", index, *error["loc"])),
+                f"process '{process.get('name', index)}': {location}: {error['msg']}",
+            ) from e
 
-        # Convert policy definitions to IAM PolicyStatement objects
-        if "additional_policies" in processed_process:
-            policies = []
-            for policy_def in processed_process["additional_policies"]:
-                if policy_def:  # Skip empty policies
-                    policy = aws_iam.PolicyStatement(
-                        effect=getattr(aws_iam.Effect, policy_def["effect"]),
-                        actions=policy_def["actions"],
-                        resources=policy_def["resources"],
-                    )
-                    policies.append(policy)
-            processed_process["additional_policies"] = policies
+    return process_definitions
 
-        processed_processes.append(processed_process)
 
-    return processed_processes
+def load_all_processes(yaml_path: str = PROCESSES_YAML_PATH) -> list[ProcessDefinition]:
+    """
+    Load every process for offline tooling such as the process graph and the simulator.
 
+    Settings keep their defaults except that all processes are enabled, and template variables that are only known
+    at deploy time are left unresolved.
+
+    Args:
+        yaml_path: Path to the processes YAML file
+
+    Returns:
+        List of validated process definitions
+    """
+    settings = {
+        name: field.default for name, field in StitchWorkerSettings.model_fields.items() if not field.is_required()
+    }
+    settings.update((name, True) for name in settings if name.startswith("lambda_"))
+    return load_processes_config(settings, s3_bucket_name="bucket", yaml_path=yaml_path, strict=False)
 
-def _substitute_template_vars(obj: Any, template_vars: dict[str, Any]) -> Any:
+
+def _load_compiled_processes(yaml_path: str) -> tuple[list[Any], dict[tuple, int]]:
+    """
+    Read the processes YAML file, parsing and compiling it only when its content has changed.
+
+    Args:
+        yaml_path: Path to the processes YAML file
+
+    Returns:
+        Tuple of the compiled process definitions and a mapping of node paths to line numbers
+    """
+    with open(yaml_path, "rb") as file:
+        content = file.read()
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash not in _COMPILED_PROCESSES:
+        config = yaml.safe_load(content)
+        if isinstance(config, dict) and isinstance(config.get("processes"), list):
+            line_numbers = _collect_line_numbers(yaml.compose(content, Loader=yaml.SafeLoader))
+            _COMPILED_PROCESSES[content_hash] = (compile_tree(config["processes"]), line_numbers)
+        else:
+            _COMPILED_PROCESSES[content_hash] = (None, {})
+
+    compiled_processes, line_numbers = _COMPILED_PROCESSES[content_hash]
+    if compiled_processes is None:
+        raise ProcessConfigError(yaml_path, None, "expected a top-level 'processes' list")
+    return compiled_processes, line_numbers
+
+
+def _collect_line_numbers(node: yaml.Node, path: tuple = ()) -> dict[tuple, int]:
+    """
+    Map every node path in a composed YAML document to its 1-based line number.
+
+    Args:
+        node: Composed YAML node
+        path: Path of the node from the document root
+
+    Returns:
+        Dictionary of node paths and line numbers
+    """
+    line_numbers = {path: node.start_mark.line + 1}
+    if isinstance(node, yaml.MappingNode):
+        for key_node, value_node in node.value:
+            line_numbers.update(_collect_line_numbers(value_node, (*path, key_node.value)))
+            line_numbers[(*path, key_node.value)] = key_node.start_mark.line + 1
+    elif isinstance(node, yaml.SequenceNode):
+        for index, item in enumerate(node.value):
+            line_numbers.update(_collect_line_numbers(item, (*path, index)))
+    return line_numbers
+
+
+def _line_for(line_numbers: dict[tuple, int], path: tuple) -> int | None:
     """
-    Recursively substitute template variables in a nested structure.
+    Find the line number of a path, falling back to its closest known parent.
 
     Args:
-        obj: Object to process (can be dict, list, or primitive)
-        template_vars: Dictionary of template variables and their values
+        line_numbers: Dictionary of node paths and line numbers
+        path: Path of the node from the document root
 
     Returns:
-        Object with template variables substituted
+        Line number or None if no parent of the path is known
     """
-    if isinstance(obj, dict):
-        return {key: _substitute_template_vars(value, template_vars) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [_substitute_template_vars(item, template_vars) for item in obj]
-    elif isinstance(obj, str):
-        # Check if the string is exactly a template variable
-        if obj in template_vars:
-            return template_vars[obj]
-
-        # Substitute template variables in strings
-        result = obj
-        for var, value in template_vars.items():
-            result = result.replace(var, str(value))
-        return result
-    else:
-        return obj
+    for length in range(len(path), 0, -1):
+        if (line := line_numbers.get(path[:length])) is not None:
+            return line
+    return None
@@ -0,0 +1 @@
+"""Libraries used by the worker handlers at runtime, e.g. to coordinate API usage across stages"""
@@ -0,0 +1,325 @@
+"""
+Columnar file format for the block sets passed between pipeline stages through S3.
+
+A block file stores every field of the blocks as one zlib-compressed column, followed by a JSON footer with the
+schema and the byte range of each column:
+
+    MAGIC | column | column | ... | footer JSON | footer length (uint32) | MAGIC
+
+Readers fetch the footer with a suffix byte-range request and then only the byte ranges of the columns they need,
+so a stage that only uses the block IDs and text does not download or decode the embeddings and geometry.
+"""
+
+import json
+import sys
+import zlib
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+MAGIC = b"SBLK"
+
+# Version of the file layout; readers reject files written with a newer layout
+FORMAT_VERSION = 1
+
+# Content type of block files in S3
+CONTENT_TYPE = "application/vnd.stitch.blocks"
+
+# Column types and the array typecodes of their values
+NUMERIC_TYPECODES = {"i32": "i", "i64": "q", "f32": "f", "f64": "d"}
+COLUMN_TYPES = (*NUMERIC_TYPECODES, "bool", "str", "json", "vector")
+
+# Fields of the standardized blocks by schema version; later versions only add columns
+BLOCK_SCHEMAS: dict[int, dict[str, str]] = {
+    1: {
+        "id": "str",
+        "document_id": "str",
+        "page": "i32",
+        "block_type": "str",
+        "text": "str",
+        "confidence": "f32",
+        "left": "f32",
+        "top": "f32",
+        "width": "f32",
+        "height": "f32",
+        "parent_id": "str",
+        "relationships": "json",
+        "summary": "str",
+        "embedding": "vector",
+    },
+}
+BLOCK_SCHEMA_VERSION = max(BLOCK_SCHEMAS)
+
+# Bytes fetched from the end of the file in the first request, enough for the footer of most files
+TAIL_SIZE = 64 * 1024
+
+# Column byte ranges closer than this are fetched with one request
+COALESCE_GAP = 64 * 1024
+
+_TRAILER_SIZE = 4 + len(MAGIC)
+
+
+class BlockFormatError(ValueError):
+    """Raised when a block file or the blocks written to it do not match the format"""
+
+
+def write_blocks(
+    blocks: Iterable[dict[str, Any]],
+    schema: dict[str, str] | None = None,
+    schema_version: int = BLOCK_SCHEMA_VERSION,
+    compression_level: int = 6,
+) -> bytes:
+    """
+    Encode blocks as a block file.
+
+    Args:
+        blocks: Blocks; missing fields and None values are stored as nulls
+        schema: Column types by field name, defaults to the block schema of schema_version
+        schema_version: Version of the block schema recorded in the file
+        compression_level: zlib compression level of the columns
+
+    Returns:
+        Block file
+
+    Raises:
+        BlockFormatError: If a column type is unknown, a block has a field that is not in the schema or the vectors of
+            the embedding column differ in dimension
+    """
+    schema = schema if schema is not None else BLOCK_SCHEMAS[schema_version]
+    for name, column_type in schema.items():
+        if column_type not in COLUMN_TYPES:
+            raise BlockFormatError(f"column '{name}' has unknown type '{column_type}'")
+
+    blocks = list(blocks)
+    for block in blocks:
+        unknown = block.keys() - schema.keys()
+        if unknown:
+            raise BlockFormatError(f"block fields not in schema version {schema_version}: {', '.join(sorted(unknown))}")
+
+    chunks = [MAGIC]
+    offset = len(MAGIC)
+    columns = []
+    for name, column_type in schema.items():
+        values = [block.get(name) for block in blocks]
+        payload, meta = _encode_column(name, column_type, values)
+        chunk = zlib.compress(payload, compression_level)
+        columns.append(
+            {"name": name, "type": column_type, "offset": offset, "length": len(chunk), "raw_length": len(payload)}
+            | meta
+        )
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    footer = json.dumps(
+        {"format_version": FORMAT_VERSION, "schema_version": schema_version, "rows": len(blocks), "columns": columns},
+        separators=(",", ":"),
+    ).encode()
+    chunks += [footer, len(footer).to_bytes(4, "little"), MAGIC]
+    return b"".join(chunks)
+
+
+class BlockFileReader:
+    """
+    Reader of a block file that fetches the footer once and then only the byte ranges of the projected columns.
+
+    Args:
+        fetch: Function returning the bytes of the file in [start, end)
+        fetch_tail: Function returning the last given number of bytes of the file
+    """
+
+    def __init__(self, fetch: Callable[[int, int], bytes], fetch_tail: Callable[[int], bytes]) -> None:
+        self.fetch = fetch
+        self.requests = 0
+
+        tail = fetch_tail(TAIL_SIZE)
+        self.requests += 1
+        if len(tail) < len(MAGIC) + _TRAILER_SIZE or tail[-len(MAGIC) :] != MAGIC:
+            raise BlockFormatError("not a block file")
+        footer_length = int.from_bytes(tail[-_TRAILER_SIZE : -len(MAGIC)], "little")
+        if footer_length + _TRAILER_SIZE > len(tail):
+            tail = fetch_tail(footer_length + _TRAILER_SIZE)
+            self.requests += 1
+        footer = json.loads(tail[-_TRAILER_SIZE - footer_length : -_TRAILER_SIZE])
+
+        if footer["format_version"] > FORMAT_VERSION:
+            raise BlockFormatError(f"block file format version {footer['format_version']} is not supported")
+        self.schema_version: int = footer["schema_version"]
+        self.rows: int = footer["rows"]
+        self._columns: dict[str, dict[str, Any]] = {column["name"]: column for column in footer["columns"]}
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BlockFileReader":
+        """
+        Read a block file held in memory.
+
+        Args:
+            data: Block file
+
+        Returns:
+            Reader of the file
+        """
+        return cls(lambda start, end: data[start:end], lambda length: data[-length:])
+
+    @classmethod
+    def from_s3(cls, s3_client: Any, bucket: str, key: str) -> "BlockFileReader":
+        """
+        Read a block file with S3 byte-range requests.
+
+        Args:
+            s3_client: Boto3 S3 client
+            bucket: Bucket name
+            key: Object key
+
+        Returns:
+            Reader of the object
+        """
+
+        def fetch(start: int, end: int) -> bytes:
+            return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")["Body"].read()
+
+        def fetch_tail(length: int) -> bytes:
+            return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{length}")["Body"].read()
+
+        return cls(fetch, fetch_tail)
+
+    @property
+    def schema(self) -> dict[str, str]:
+        """Column types by name"""
+        return {name: column["type"] for name, column in self._columns.items()}
+
+    def read_columns(self, names: Iterable[str] | None = None) -> dict[str, list[Any]]:
+        """
+        Read and decode columns.
+
+        Args:
+            names: Columns to read, defaults to every column
+
+        Returns:
+            Values of each column by name, with None for nulls
+
+        Raises:
+            BlockFormatError: If a column is not in the file
+        """
+        names = list(names) if names is not None else list(self._columns)
+        missing = [name for name in names if name not in self._columns]
+        if missing:
+            raise BlockFormatError(f"columns not in schema version {self.schema_version}: {', '.join(missing)}")
+
+        columns = sorted((self._columns[name] for name in names), key=lambda column: column["offset"])
+        values = {}
+        for start, end, group in _coalesce(columns):
+            data = self.fetch(start, end)
+            self.requests += 1
+            for column in group:
+                chunk = data[column["offset"] - start : column["offset"] - start + column["length"]]
+                values[column["name"]] = _decode_column(column, zlib.decompress(chunk), self.rows)
+        return {name: values[name] for name in names}
+
+    def iter_blocks(self, names: Iterable[str] | None = None) -> Iterator[dict[str, Any]]:
+        """
+        Read columns and yield them as blocks.
+
+        Args:
+            names: Fields of the blocks, defaults to every column
+
+        Returns:
+            Iterator of blocks without their null fields
+        """
+        columns = self.read_columns(names)
+        for row in range(self.rows):
+            yield {name: values[row] for name, values in columns.items() if values[row] is not None}
+
+
+def _coalesce(columns: list[dict[str, Any]]) -> Iterator[tuple[int, int, list[dict[str, Any]]]]:
+    group: list[dict[str, Any]] = []
+    start = end = 0
+    for column in columns:
+        if group and column["offset"] - end > COALESCE_GAP:
+            yield start, end, group
+            group = []
+        if not group:
+            start = column["offset"]
+        group.append(column)
+        end = column["offset"] + column["length"]
+    if group:
+        yield start, end, group
+
+
+def _to_bytes(values: array) -> bytes:
+    # Columns are little-endian like the packed embeddings of the embedding cache
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _encode_column(name: str, column_type: str, values: list[Any]) -> tuple[bytes, dict[str, Any]]:
+    # Nullable columns start with one validity byte per row
+    has_nulls = any(value is None for value in values)
+    validity = bytes(value is not None for value in values) if has_nulls else b""
+    meta: dict[str, Any] = {"nulls": has_nulls}
+
+    if column_type in NUMERIC_TYPECODES:
+        data = _to_bytes(array(NUMERIC_TYPECODES[column_type], (0 if value is None else value for value in values)))
+    elif column_type == "bool":
+        data = bytes(bool(value) for value in values)
+    elif column_type == "vector":
+        dimension = next((len(value) for value in values if value is not None), 0)
+        if any(value is not None and len(value) != dimension for value in values):
+            raise BlockFormatError(f"vectors of column '{name}' must have the same dimension")
+        flat = array("f")
+        for value in values:
+            flat.extend(value if value is not None else [0.0] * dimension)
+        data = _to_bytes(flat)
+        meta["dimension"] = dimension
+    else:
+        # Variable-length values are stored as uint32 end offsets followed by the UTF-8 data
+        encoded = [
+            b""
+            if value is None
+            else (value if column_type == "str" else json.dumps(value, separators=(",", ":"))).encode()
+            for value in values
+        ]
+        ends = array("I")
+        end = 0
+        for item in encoded:
+            end += len(item)
+            ends.append(end)
+        data = _to_bytes(ends) + b"".join(encoded)
+    return validity + data, meta
+
+
+def _decode_column(column: dict[str, Any], payload: bytes, rows: int) -> list[Any]:
+    column_type = column["type"]
+    validity = payload[:rows] if column["nulls"] else None
+    data = payload[rows:] if column["nulls"] else payload
+
+    if column_type in NUMERIC_TYPECODES:
+        values = _from_bytes(NUMERIC_TYPECODES[column_type], data).tolist()
+    elif column_type == "bool":
+        values = [bool(value) for value in data]
+    elif column_type == "vector":
+        dimension = column["dimension"]
+        flat = _from_bytes("f", data)
+        values = [flat[row * dimension : (row + 1) * dimension].tolist() for row in range(rows)]
+    else:
+        ends = _from_bytes("I", data[: 4 * rows])
+        text = data[4 * rows :]
+        values = []
+        start = 0
+        for end in ends:
+            item = text[start:end].decode()
+            values.append(item if column_type == "str" else json.loads(item) if item else None)
+            start = end
+
+    if validity is not None:
+        values = [value if valid else None for value, valid in zip(values, validity)]
+    return values
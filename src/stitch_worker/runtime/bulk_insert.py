@@ -0,0 +1,291 @@
+"""
+Bulk loading of block sets into Postgres with binary COPY.
+
+Blocks are streamed from S3 into COPY ... FROM STDIN (FORMAT BINARY) into a staging table and merged into the block
+table with INSERT ... ON CONFLICT, so a document is written with a few statements instead of one per block. The
+documents of an SQS batch share one transaction with a savepoint each: a document that fails is rolled back and
+reported without failing the rest of the batch.
+"""
+
+import json
+import os
+import struct
+from collections.abc import Iterable, Iterator
+from itertools import chain
+from typing import Any
+
+from .block_format import BLOCK_SCHEMA_VERSION, BLOCK_SCHEMAS, BlockFileReader
+
+# Environment variable set by processes.yaml on block-insertion
+BLOCK_INSERT_MODE_ENV = "BLOCK_INSERT_MODE"
+
+# Insert one row per statement, as before, or bulk load with COPY
+ROW_MODE = "row"
+COPY_MODE = "copy"
+
+# Bytes of COPY data buffered before they are sent to the server
+CHUNK_SIZE = 1024 * 1024
+
+# Postgres types of the block format column types
+PG_TYPES = {
+    "i32": "int4",
+    "i64": "int8",
+    "f32": "float4",
+    "f64": "float8",
+    "bool": "bool",
+    "str": "text",
+    "json": "jsonb",
+    "vector": "float4[]",
+}
+
+_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_HEADER = _SIGNATURE + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+_FLOAT4_OID = 700
+
+
+def insert_mode() -> str:
+    """
+    Get the insert mode configured for the process.
+
+    Returns:
+        COPY_MODE or ROW_MODE
+    """
+    return COPY_MODE if os.environ.get(BLOCK_INSERT_MODE_ENV, ROW_MODE).lower() == COPY_MODE else ROW_MODE
+
+
+def _encode_text(value: Any) -> bytes:
+    return (value if isinstance(value, str) else str(value)).encode()
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    # Binary jsonb is a version byte followed by the JSON text
+    return b"\x01" + json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _encode_float4_array(value: Any) -> bytes:
+    if not value:
+        return struct.pack(">iii", 0, 0, _FLOAT4_OID)
+    count = len(value)
+    return struct.pack(f">5i{'if' * count}", 1, 0, _FLOAT4_OID, count, 1, *chain.from_iterable((4, v) for v in value))
+
+
+_ENCODERS = {
+    "int4": struct.Struct(">i").pack,
+    "int8": struct.Struct(">q").pack,
+    "float4": struct.Struct(">f").pack,
+    "float8": struct.Struct(">d").pack,
+    "bool": lambda value: b"\x01" if value else b"\x00",
+    "text": _encode_text,
+    "jsonb": _encode_jsonb,
+    "float4[]": _encode_float4_array,
+}
+
+
+def encode_copy_binary(
+    rows: Iterable[dict[str, Any]], columns: dict[str, str], chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode rows as COPY binary data.
+
+    Args:
+        rows: Rows by column name; missing columns and None values are written as nulls
+        columns: Postgres type of each column, in the column order of the COPY statement
+        chunk_size: Bytes per yielded chunk, except the last
+
+    Returns:
+        Iterator of chunks of the COPY data
+
+    Raises:
+        ValueError: If a column type is not supported
+    """
+    unsupported = set(columns.values()) - _ENCODERS.keys()
+    if unsupported:
+        raise ValueError(f"unsupported COPY column types: {', '.join(sorted(unsupported))}")
+
+    fields = [(name, _ENCODERS[pg_type]) for name, pg_type in columns.items()]
+    tuple_header = struct.pack(">h", len(fields))
+    pack_length = struct.Struct(">i").pack
+
+    buffer = bytearray(_HEADER)
+    for row in rows:
+        buffer += tuple_header
+        for name, encode in fields:
+            value = row.get(name)
+            if value is None:
+                buffer += _NULL
+            else:
+                data = encode(value)
+                buffer += pack_length(len(data))
+                buffer += data
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += _TRAILER
+    yield bytes(buffer)
+
+
+def iter_s3_blocks(s3_client: Any, bucket: str, key: str, fields: Iterable[str] | None = None) -> Iterator[dict]:
+    """
+    Read the blocks of a block set in S3 without downloading the whole object first.
+
+    Args:
+        s3_client: Boto3 S3 client
+        bucket: Bucket name
+        key: Key of a newline-delimited JSON file (.ndjson or .jsonl) or of a block file
+        fields: Fields to read from a block file, defaults to every column
+
+    Returns:
+        Iterator of blocks
+    """
+    if key.endswith((".ndjson", ".jsonl")):
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        for line in body.iter_lines():
+            if line:
+                yield json.loads(line)
+        return
+    yield from BlockFileReader.from_s3(s3_client, bucket, key).iter_blocks(fields)
+
+
+def _quote_identifier(name: str) -> str:
+    return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+
+class BulkInsertResult:
+    """Rows written per document and the documents that failed"""
+
+    __slots__ = ("rows", "failures")
+
+    def __init__(self) -> None:
+        self.rows: dict[str, int] = {}
+        self.failures: dict[str, str] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"BulkInsertResult({len(self.rows)} documents, {sum(self.rows.values())} rows, {len(self.failures)} failed)"
+        )
+
+
+class BulkBlockWriter:
+    """
+    Writer upserting the blocks of several documents in one transaction with binary COPY and a staging table.
+
+    The staging table is a temporary table dropped at commit, so the writer also works through pgbouncer in
+    transaction mode. The connection must not be in autocommit mode.
+
+    Args:
+        connection: psycopg (3) or psycopg2 connection
+        table: Block table, optionally schema-qualified
+        columns: Postgres type of each column written, one of the values of PG_TYPES, defaults to the columns of the
+            current block schema; values are converted to the types of the table with assignment casts
+        key: Columns of the unique constraint the upsert resolves conflicts on
+        chunk_size: Bytes of COPY data sent per write
+    """
+
+    def __init__(
+        self,
+        connection: Any,
+        table: str = "blocks",
+        columns: dict[str, str] | None = None,
+        key: tuple[str, ...] = ("id",),
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.connection = connection
+        self.table = table
+        self.columns = (
+            columns
+            if columns is not None
+            else {name: PG_TYPES[column_type] for name, column_type in BLOCK_SCHEMAS[BLOCK_SCHEMA_VERSION].items()}
+        )
+        missing = [name for name in key if name not in self.columns]
+        if missing:
+            raise ValueError(f"key columns not written: {', '.join(missing)}")
+        unsupported = set(self.columns.values()) - _ENCODERS.keys()
+        if unsupported:
+            raise ValueError(f"unsupported COPY column types: {', '.join(sorted(unsupported))}")
+        self.key = key
+        self.chunk_size = chunk_size
+
+        quoted_columns = ", ".join(_quote_identifier(name) for name in self.columns)
+        quoted_key = ", ".join(_quote_identifier(name) for name in key)
+        updates = ", ".join(
+            f"{_quote_identifier(name)} = EXCLUDED.{_quote_identifier(name)}"
+            for name in self.columns
+            if name not in key
+        )
+        self._stage = _quote_identifier(f"{table.rpartition('.')[2]}_stage")
+        # The stage has the types of the COPY data; the merge casts them to the types of the block table
+        stage_columns = ", ".join(f"{_quote_identifier(name)} {pg_type}" for name, pg_type in self.columns.items())
+        self._create_stage_sql = f"CREATE TEMP TABLE {self._stage} ({stage_columns}) ON COMMIT DROP"
+        self._copy_sql = f"COPY {self._stage} ({quoted_columns}) FROM STDIN (FORMAT BINARY)"
+        # Duplicate keys within a document would make the upsert update the same row twice
+        self._merge_sql = (
+            f"INSERT INTO {_quote_identifier(table)} ({quoted_columns}) "
+            f"SELECT DISTINCT ON ({quoted_key}) {quoted_columns} FROM {self._stage} ORDER BY {quoted_key} "
+            f"ON CONFLICT ({quoted_key}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+        )
+
+    def write_documents(self, documents: Iterable[tuple[str, Iterable[dict[str, Any]]]]) -> BulkInsertResult:
+        """
+        Upsert the blocks of documents and commit them together.
+
+        Args:
+            documents: Document IDs with an iterable of their blocks, e.g. from iter_s3_blocks; the blocks of a
+                document are only read once the previous document was written
+
+        Returns:
+            Rows written per document and the error of each failed document, whose blocks were rolled back
+        """
+        result = BulkInsertResult()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(self._create_stage_sql)
+            for document_id, blocks in documents:
+                cursor.execute("SAVEPOINT document")
+                try:
+                    self._copy(cursor, blocks)
+                    cursor.execute(self._merge_sql)
+                    result.rows[document_id] = cursor.rowcount
+                    cursor.execute(f"TRUNCATE {self._stage}")
+                    cursor.execute("RELEASE SAVEPOINT document")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT document")
+                    cursor.execute("RELEASE SAVEPOINT document")
+                    result.failures[document_id] = str(e)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        return result
+
+    def _copy(self, cursor: Any, blocks: Iterable[dict[str, Any]]) -> None:
+        chunks = encode_copy_binary(blocks, self.columns, self.chunk_size)
+        if hasattr(cursor, "copy"):
+            with cursor.copy(self._copy_sql) as copy:
+                for chunk in chunks:
+                    copy.write(chunk)
+        else:
+            cursor.copy_expert(self._copy_sql, _ChunkReader(chunks), size=self.chunk_size)
+
+
+class _ChunkReader:
+    # File-like object over the chunks for psycopg2's copy_expert
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        size = len(self.buffer) if size < 0 else size
+        data = bytes(self.buffer[:size])
+        # Deleting from the front of a bytearray does not move the rest of the buffer
+        del self.buffer[:size]
+        return data
@@ -0,0 +1,383 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+# Environment variables set by StitchWorkerStack on every process Lambda
+CHECKPOINT_TABLE_ENV = "CHECKPOINT_TABLE_NAME"
+CHECKPOINT_RETENTION_ENV = "CHECKPOINT_RETENTION_DAYS"
+CHECKPOINT_LEASE_ENV = "CHECKPOINT_LEASE_SECONDS"
+
+STARTED = "STARTED"
+COMPLETED = "COMPLETED"
+
+# Seconds a started stage is protected from a concurrent run; set this to at least the Lambda timeout
+DEFAULT_LEASE_SECONDS = 900
+DEFAULT_RETENTION_DAYS = 30
+
+
+class CheckpointInProgress(RuntimeError):
+    """Raised when another invocation is running the same stage for the same input; retry after the lease expires"""
+
+
+def content_hash(content: bytes | str | dict | list) -> str:
+    """
+    Hash the input of a stage.
+
+    Args:
+        content: Raw bytes (e.g. the uploaded PDF), text, or a JSON-serializable object such as the event detail
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    if isinstance(content, dict | list):
+        content = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+class Checkpoint:
+    """A stage run for one document input, as recorded in the ledger"""
+
+    __slots__ = ("document_id", "content_hash", "stage", "token", "status", "started_at", "completed_at", "output")
+
+    def __init__(
+        self,
+        document_id: str,
+        content_hash: str,
+        stage: str,
+        token: str,
+        status: str,
+        started_at: float,
+        completed_at: float | None = None,
+        output: Any = None,
+    ) -> None:
+        self.document_id = document_id
+        self.content_hash = content_hash
+        self.stage = stage
+        self.token = token
+        self.status = status
+        self.started_at = started_at
+        self.completed_at = completed_at
+        self.output = output
+
+    @property
+    def skipped(self) -> bool:
+        """True if the stage already completed for this input and the work can be skipped"""
+        return self.status == COMPLETED
+
+    @property
+    def duration(self) -> float | None:
+        return self.completed_at - self.started_at if self.completed_at is not None else None
+
+    def to_item(self) -> dict[str, Any]:
+        return {
+            "document_id": self.document_id,
+            "content_hash": self.content_hash,
+            "stage": self.stage,
+            "token": self.token,
+            "status": self.status,
+            "started_at": self.started_at,
+            "completed_at": self.completed_at,
+            "output": self.output,
+        }
+
+    @classmethod
+    def from_item(cls, item: dict[str, Any]) -> "Checkpoint":
+        return cls(**item)
+
+
+class CheckpointStore(ABC):
+    """Storage of checkpoints with atomic claim and completion"""
+
+    @abstractmethod
+    def claim(self, checkpoint: Checkpoint, lease_until: float, expires_at: int) -> Checkpoint | None:
+        """
+        Record a stage start unless the stage completed or is running under an unexpired lease.
+
+        Args:
+            checkpoint: Started checkpoint with a new token
+            lease_until: Time until which the claim blocks other runs
+            expires_at: Epoch seconds after which the record may be deleted
+
+        Returns:
+            None if the claim succeeded, otherwise the checkpoint that blocked it
+        """
+
+    @abstractmethod
+    def complete(self, checkpoint: Checkpoint, expires_at: int) -> bool:
+        """
+        Mark a claimed checkpoint completed.
+
+        Args:
+            checkpoint: Completed checkpoint with the token of the claim
+            expires_at: Epoch seconds after which the record may be deleted
+
+        Returns:
+            False if the claim was lost, e.g. because its lease expired and another run took over
+        """
+
+    @abstractmethod
+    def release(self, checkpoint: Checkpoint) -> None:
+        """Delete a claimed checkpoint whose stage failed, so a retry can claim it at once"""
+
+    @abstractmethod
+    def query(self, document_id: str) -> list[Checkpoint]:
+        """List the checkpoints of a document"""
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """In-process checkpoint store for tests and local runs"""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._items: dict[tuple[str, str, str], tuple[dict[str, Any], float]] = {}
+
+    @staticmethod
+    def _key(checkpoint: Checkpoint) -> tuple[str, str, str]:
+        return checkpoint.document_id, checkpoint.content_hash, checkpoint.stage
+
+    def claim(self, checkpoint: Checkpoint, lease_until: float, expires_at: int) -> Checkpoint | None:
+        with self._lock:
+            existing = self._items.get(self._key(checkpoint))
+            if existing:
+                item, existing_lease = existing
+                if item["status"] == COMPLETED or existing_lease > self.clock():
+                    return Checkpoint.from_item(item)
+            self._items[self._key(checkpoint)] = (checkpoint.to_item(), lease_until)
+            return None
+
+    def complete(self, checkpoint: Checkpoint, expires_at: int) -> bool:
+        with self._lock:
+            existing = self._items.get(self._key(checkpoint))
+            if not existing or existing[0]["token"] != checkpoint.token:
+                return False
+            self._items[self._key(checkpoint)] = (checkpoint.to_item(), 0)
+            return True
+
+    def release(self, checkpoint: Checkpoint) -> None:
+        with self._lock:
+            existing = self._items.get(self._key(checkpoint))
+            if existing and existing[0]["token"] == checkpoint.token:
+                del self._items[self._key(checkpoint)]
+
+    def query(self, document_id: str) -> list[Checkpoint]:
+        with self._lock:
+            return [Checkpoint.from_item(item) for key, (item, _) in self._items.items() if key[0] == document_id]
+
+
+class DynamoDBCheckpointStore(CheckpointStore):
+    """
+    Checkpoint store backed by the checkpoint table provisioned by StitchWorkerStack.
+
+    Items are keyed by document_id and "{content_hash}#{stage}", so all runs of a document are read with one query.
+    """
+
+    def __init__(self, table_name: str, dynamodb_client: Any = None, clock: Callable[[], float] = time.time) -> None:
+        if dynamodb_client is None:
+            import boto3
+
+            dynamodb_client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = dynamodb_client
+        self.clock = clock
+
+    @staticmethod
+    def _key(checkpoint: Checkpoint) -> dict[str, Any]:
+        return {
+            "document_id": {"S": checkpoint.document_id},
+            "run": {"S": f"{checkpoint.content_hash}#{checkpoint.stage}"},
+        }
+
+    @staticmethod
+    def _item(checkpoint: Checkpoint, lease_until: float, expires_at: int) -> dict[str, Any]:
+        item = {
+            **DynamoDBCheckpointStore._key(checkpoint),
+            "stage": {"S": checkpoint.stage},
+            "token": {"S": checkpoint.token},
+            "status": {"S": checkpoint.status},
+            "started_at": {"N": repr(checkpoint.started_at)},
+            "lease_until": {"N": repr(lease_until)},
+            "expires_at": {"N": str(expires_at)},
+        }
+        if checkpoint.completed_at is not None:
+            item["completed_at"] = {"N": repr(checkpoint.completed_at)}
+        if checkpoint.output is not None:
+            item["output"] = {"S": json.dumps(checkpoint.output)}
+        return item
+
+    @staticmethod
+    def _checkpoint(item: dict[str, Any]) -> Checkpoint:
+        content_hash, stage = item["run"]["S"].split("#", 1)
+        return Checkpoint(
+            document_id=item["document_id"]["S"],
+            content_hash=content_hash,
+            stage=stage,
+            token=item["token"]["S"],
+            status=item["status"]["S"],
+            started_at=float(item["started_at"]["N"]),
+            completed_at=float(item["completed_at"]["N"]) if "completed_at" in item else None,
+            output=json.loads(item["output"]["S"]) if "output" in item else None,
+        )
+
+    def claim(self, checkpoint: Checkpoint, lease_until: float, expires_at: int) -> Checkpoint | None:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item=self._item(checkpoint, lease_until, expires_at),
+                ConditionExpression="attribute_not_exists(#run) OR (#status = :started AND lease_until < :now)",
+                ExpressionAttributeNames={"#run": "run", "#status": "status"},
+                ExpressionAttributeValues={":started": {"S": STARTED}, ":now": {"N": repr(self.clock())}},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        except self.client.exceptions.ConditionalCheckFailedException as e:
+            item = e.response.get("Item")
+            if not item:
+                item = self.client.get_item(
+                    TableName=self.table_name, Key=self._key(checkpoint), ConsistentRead=True
+                ).get("Item")
+            return self._checkpoint(item) if item else checkpoint
+        return None
+
+    def complete(self, checkpoint: Checkpoint, expires_at: int) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item=self._item(checkpoint, 0, expires_at),
+                ConditionExpression="#token = :token",
+                ExpressionAttributeNames={"#token": "token"},
+                ExpressionAttributeValues={":token": {"S": checkpoint.token}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def release(self, checkpoint: Checkpoint) -> None:
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key=self._key(checkpoint),
+                ConditionExpression="#token = :token",
+                ExpressionAttributeNames={"#token": "token"},
+                ExpressionAttributeValues={":token": {"S": checkpoint.token}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def query(self, document_id: str) -> list[Checkpoint]:
+        checkpoints = []
+        paginator = self.client.get_paginator("query")
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            KeyConditionExpression="document_id = :document_id",
+            ExpressionAttributeValues={":document_id": {"S": document_id}},
+        ):
+            checkpoints.extend(self._checkpoint(item) for item in page["Items"])
+        return checkpoints
+
+
+class CheckpointLedger:
+    """
+    Ledger of the stages completed for each document input.
+
+    Handlers wrap their work in stage(); a stage that already completed for the same document and content hash is
+    skipped, and a concurrent duplicate delivery raises CheckpointInProgress instead of doing the work twice.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore | None,
+        retention_days: int = DEFAULT_RETENTION_DAYS,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.store = store
+        self.retention_days = retention_days
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    @classmethod
+    def from_environment(cls) -> "CheckpointLedger":
+        """
+        Create the ledger configured by StitchWorkerStack, or a disabled ledger when no table is configured.
+
+        Returns:
+            Checkpoint ledger
+        """
+        table_name = os.environ.get(CHECKPOINT_TABLE_ENV)
+        retention_days = int(os.environ.get(CHECKPOINT_RETENTION_ENV) or DEFAULT_RETENTION_DAYS)
+        lease_seconds = int(os.environ.get(CHECKPOINT_LEASE_ENV) or DEFAULT_LEASE_SECONDS)
+        return cls(DynamoDBCheckpointStore(table_name) if table_name else None, retention_days, lease_seconds)
+
+    def _expires_at(self, now: float) -> int:
+        return int(now) + self.retention_days * 24 * 3600
+
+    @contextmanager
+    def stage(
+        self, document_id: str, content_hash: str, stage: str, lease_seconds: int | None = None
+    ) -> Iterator[Checkpoint]:
+        """
+        Run a stage at most once per document input.
+
+        The yielded checkpoint has skipped set when the stage already completed; its output holds what the completed
+        run stored. Otherwise set checkpoint.output to a small JSON-serializable result if later runs need it. The
+        stage is recorded as completed when the block exits without an exception and released when it raises.
+
+        Args:
+            document_id: Document ID
+            content_hash: Hash of the stage input, see content_hash
+            stage: Process name
+            lease_seconds: Seconds the claim blocks concurrent runs, by default the lease of the ledger
+
+        Yields:
+            Checkpoint of this run
+
+        Raises:
+            CheckpointInProgress: If another invocation holds the claim for the same input
+        """
+        now = self.clock()
+        checkpoint = Checkpoint(document_id, content_hash, stage, uuid.uuid4().hex, STARTED, now)
+        if self.store is None:
+            yield checkpoint
+            return
+
+        lease_until = now + (lease_seconds or self.lease_seconds)
+        blocking = self.store.claim(checkpoint, lease_until, self._expires_at(now))
+        if blocking is not None:
+            if blocking.status == COMPLETED:
+                yield blocking
+                return
+            raise CheckpointInProgress(f"Stage {stage} of document {document_id} is already running")
+
+        try:
+            yield checkpoint
+        except BaseException:
+            self.store.release(checkpoint)
+            raise
+
+        checkpoint.status = COMPLETED
+        checkpoint.completed_at = self.clock()
+        if not self.store.complete(checkpoint, self._expires_at(checkpoint.completed_at)):
+            print(f"Checkpoint of stage {stage} for document {document_id} was taken over after its lease expired")
+
+    def timings(self, document_id: str) -> list[Checkpoint]:
+        """
+        List the stage runs of a document for latency analysis.
+
+        Args:
+            document_id: Document ID
+
+        Returns:
+            Checkpoints ordered by start time; completed ones have a duration
+        """
+        if self.store is None:
+            return []
+        return sorted(self.store.query(document_id), key=lambda checkpoint: checkpoint.started_at)
@@ -0,0 +1,293 @@
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Callable, Sequence
+from typing import Any
+
+# Environment variables set by StitchWorkerStack on the processes with embedding_cache enabled
+EMBEDDING_CACHE_TABLE_ENV = "EMBEDDING_CACHE_TABLE_NAME"
+EMBEDDING_CACHE_TTL_ENV = "EMBEDDING_CACHE_TTL_SECONDS"
+
+DEFAULT_TTL_SECONDS = 90 * 24 * 3600
+
+# DynamoDB limits for BatchGetItem and BatchWriteItem
+DYNAMODB_BATCH_GET_SIZE = 100
+DYNAMODB_BATCH_WRITE_SIZE = 25
+
+# Attempts of a batch request while DynamoDB returns unprocessed keys or items, and the bounds of the backoff between
+MAX_BATCH_ATTEMPTS = 8
+BATCH_BASE_DELAY = 0.05
+BATCH_MAX_DELAY = 2.0
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so that copies of the same clause that only differ in formatting share an embedding.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Text with compatibility characters folded and whitespace collapsed
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Compute the cache key of an embedding.
+
+    Args:
+        model: Embedding model name
+        text: Input text
+
+    Returns:
+        Hex SHA-256 digest of the model and the normalized text
+    """
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    """
+    Pack an embedding as little-endian float32 values.
+
+    Args:
+        vector: Embedding
+
+    Returns:
+        4 bytes per dimension
+    """
+    packed = array("f", vector)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_vector(data: bytes) -> list[float]:
+    """
+    Unpack an embedding packed by pack_vector.
+
+    Args:
+        data: Packed embedding
+
+    Returns:
+        Embedding
+    """
+    packed = array("f")
+    packed.frombytes(data)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tolist()
+
+
+class EmbeddingStore(ABC):
+    """Storage of packed embeddings by key"""
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """
+        Read embeddings.
+
+        Args:
+            keys: Keys from embedding_key
+
+        Returns:
+            Packed embeddings of the keys that were found
+        """
+
+    @abstractmethod
+    def put_many(self, vectors: dict[str, bytes]) -> None:
+        """
+        Store embeddings.
+
+        Args:
+            vectors: Packed embeddings by key
+        """
+
+
+class LocalEmbeddingStore(EmbeddingStore):
+    """In-process embedding store for tests and local runs"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._vectors: dict[str, bytes] = {}
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        with self._lock:
+            return {key: self._vectors[key] for key in keys if key in self._vectors}
+
+    def put_many(self, vectors: dict[str, bytes]) -> None:
+        with self._lock:
+            self._vectors.update(vectors)
+
+
+class DynamoDBEmbeddingStore(EmbeddingStore):
+    """
+    Embedding store backed by the embedding cache table provisioned by StitchWorkerStack.
+
+    Items carry an expires_at TTL attribute set when they are written. Keys and items that DynamoDB leaves unprocessed
+    are requested again with exponential backoff; after max_attempts the remaining keys are treated as misses and the
+    remaining items are not cached.
+
+    Args:
+        table_name: Name of the embedding cache table
+        ttl_seconds: Seconds an embedding is kept after it was written
+        dynamodb_client: Boto3 DynamoDB client
+        max_attempts: Attempts of each batch request
+        sleep: Function used to wait, replaced in tests
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        dynamodb_client: Any = None,
+        max_attempts: int = MAX_BATCH_ATTEMPTS,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if dynamodb_client is None:
+            import boto3
+
+            dynamodb_client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.client = dynamodb_client
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+
+    def _backoff(self, attempt: int) -> None:
+        # Unprocessed keys and items mean the table is throttled; retrying at once would be throttled again
+        self.sleep(random.uniform(0, min(BATCH_MAX_DELAY, BATCH_BASE_DELAY * 2**attempt)))
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        found = {}
+        for start in range(0, len(keys), DYNAMODB_BATCH_GET_SIZE):
+            request = {
+                self.table_name: {
+                    "Keys": [{"key": {"S": key}} for key in keys[start : start + DYNAMODB_BATCH_GET_SIZE]],
+                    "ProjectionExpression": "#key, vector",
+                    "ExpressionAttributeNames": {"#key": "key"},
+                }
+            }
+            # Throttled keys come back as UnprocessedKeys and are requested again
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    self._backoff(attempt)
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    found[item["key"]["S"]] = item["vector"]["B"]
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+        return found
+
+    def put_many(self, vectors: dict[str, bytes]) -> None:
+        expires_at = {"N": str(int(time.time()) + self.ttl_seconds)}
+        items = list(vectors.items())
+        for start in range(0, len(items), DYNAMODB_BATCH_WRITE_SIZE):
+            request = {
+                self.table_name: [
+                    {"PutRequest": {"Item": {"key": {"S": key}, "vector": {"B": vector}, "expires_at": expires_at}}}
+                    for key, vector in items[start : start + DYNAMODB_BATCH_WRITE_SIZE]
+                ]
+            }
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    self._backoff(attempt)
+                request = self.client.batch_write_item(RequestItems=request).get("UnprocessedItems")
+                if not request:
+                    break
+
+
+class EmbeddingCache:
+    """Embedding lookup that deduplicates texts and only embeds the texts that are not cached yet"""
+
+    def __init__(self, store: EmbeddingStore | None) -> None:
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_environment(cls) -> "EmbeddingCache":
+        """
+        Create the cache configured by StitchWorkerStack, or a disabled cache when no table is configured.
+
+        Returns:
+            Embedding cache
+        """
+        table_name = os.environ.get(EMBEDDING_CACHE_TABLE_ENV)
+        if not table_name:
+            return cls(None)
+        ttl_seconds = int(os.environ.get(EMBEDDING_CACHE_TTL_ENV) or DEFAULT_TTL_SECONDS)
+        return cls(DynamoDBEmbeddingStore(table_name, ttl_seconds))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def embed(
+        self,
+        model: str,
+        texts: list[str],
+        embed_batch: Callable[[list[str]], list[Sequence[float]]],
+        batch_size: int = 100,
+    ) -> list[list[float]]:
+        """
+        Get the embeddings of texts, calling the model only for texts without a cached embedding.
+
+        Texts that normalize to the same string are embedded once, both within the call and across documents.
+
+        Args:
+            model: Embedding model name
+            texts: Input texts
+            embed_batch: Function that embeds a list of texts with the model, e.g. one OpenAI embeddings request
+            batch_size: Maximum number of texts per embed_batch call, e.g. EMBEDDING_BATCH_SIZE
+
+        Returns:
+            Embeddings in the order of the texts
+        """
+        keys = [embedding_key(model, text) for text in texts]
+        unique = dict(zip(keys, texts))
+
+        packed = self.store.get_many(list(unique)) if self.store else {}
+        vectors = {key: unpack_vector(data) for key, data in packed.items()}
+
+        missing = [key for key in unique if key not in vectors]
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start : start + batch_size]
+            embeddings = embed_batch([unique[key] for key in batch])
+            new_vectors = {key: pack_vector(embedding) for key, embedding in zip(batch, embeddings)}
+            if self.store:
+                self.store.put_many(new_vectors)
+            # Round-trip through float32 so hits and misses return identical values
+            vectors.update((key, unpack_vector(data)) for key, data in new_vectors.items())
+
+        return [vectors[key] for key in keys]
+
+    def add_metrics(self, metrics: Any) -> None:
+        """
+        Add the hits, misses and hit rate to a Powertools Metrics instance.
+
+        Args:
+            metrics: aws_lambda_powertools.Metrics of the handler
+        """
+        from aws_lambda_powertools.metrics import MetricUnit
+
+        if not self.hits + self.misses:
+            return
+        metrics.add_metric(name="EmbeddingCacheHits", unit=MetricUnit.Count, value=self.hits)
+        metrics.add_metric(name="EmbeddingCacheMisses", unit=MetricUnit.Count, value=self.misses)
+        metrics.add_metric(name="EmbeddingCacheHitRate", unit=MetricUnit.Percent, value=100 * self.hit_rate)
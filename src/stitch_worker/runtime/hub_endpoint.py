@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+# Environment variables set by StitchWorkerStack on the functions that call the hub
+HUB_ENDPOINT_PARAMETER_ENV = "HUB_ENDPOINT_PARAMETER"
+HUB_ENDPOINT_TTL_ENV = "HUB_ENDPOINT_TTL_SECONDS"
+
+# Deploy-time endpoint, used until the parameter can be read
+HUB_URL_ENV = "HUB_URL"
+DATABASE_HOST_ENV = "DATABASE_HOST"
+
+DEFAULT_TTL_SECONDS = 60
+
+T = TypeVar("T")
+
+
+def hub_endpoint_parameter_name(prefix: str, suffix: str) -> str:
+    """
+    Name of the SSM parameter holding the hub endpoint of a deployment.
+
+    Args:
+        prefix: Resource name prefix
+        suffix: Resource name suffix
+
+    Returns:
+        Parameter name
+    """
+    return f"/{prefix}/{suffix}/hub-endpoint"
+
+
+class HubEndpoint:
+    """Address of the hub API and of its database"""
+
+    __slots__ = ("hub_url", "database_host")
+
+    def __init__(self, hub_url: str, database_host: str) -> None:
+        self.hub_url = hub_url
+        self.database_host = database_host
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, HubEndpoint)
+            and self.hub_url == other.hub_url
+            and self.database_host == other.database_host
+        )
+
+    def __repr__(self) -> str:
+        return f"HubEndpoint({self.hub_url!r}, {self.database_host!r})"
+
+    def to_json(self) -> str:
+        """Encode the endpoint as the value of the hub endpoint parameter"""
+        return json.dumps({"hub_url": self.hub_url, "database_host": self.database_host}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, value: str) -> "HubEndpoint":
+        """
+        Decode the value of the hub endpoint parameter.
+
+        Args:
+            value: Parameter value written by to_json
+
+        Returns:
+            Hub endpoint
+        """
+        data = json.loads(value)
+        return cls(data["hub_url"], data["database_host"])
+
+
+def publish_hub_endpoint(ssm_client: Any, parameter_name: str, endpoint: HubEndpoint) -> bool:
+    """
+    Write the hub endpoint to its parameter unless it already holds it.
+
+    Args:
+        ssm_client: Boto3 SSM client
+        parameter_name: Name from hub_endpoint_parameter_name
+        endpoint: New hub endpoint
+
+    Returns:
+        True if the parameter was written
+    """
+    try:
+        current = ssm_client.get_parameter(Name=parameter_name)["Parameter"]["Value"]
+    except ssm_client.exceptions.ParameterNotFound:
+        current = None
+    if current == endpoint.to_json():
+        return False
+    ssm_client.put_parameter(Name=parameter_name, Value=endpoint.to_json(), Type="String", Overwrite=True)
+    return True
+
+
+class HubEndpointCache:
+    """
+    Hub endpoint read from Parameter Store and kept in memory for the life of the Lambda container.
+
+    The parameter is read again once the TTL has passed, or when a call to the hub fails to connect, so a hub that
+    moved to a new address is picked up without redeploying or cold-starting the functions. If the parameter cannot
+    be read, the last endpoint read, or else the fallback, is used until the next refresh.
+    """
+
+    def __init__(
+        self,
+        parameter_name: str | None,
+        ssm_client: Any = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        fallback: HubEndpoint | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if parameter_name and ssm_client is None:
+            import boto3
+
+            ssm_client = boto3.client("ssm")
+        self.parameter_name = parameter_name
+        self.client = ssm_client
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.refreshes = 0
+        self._endpoint = fallback
+        self._expires_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "HubEndpointCache":
+        """
+        Create the cache configured by StitchWorkerStack, falling back to the deploy-time HUB_URL and DATABASE_HOST.
+
+        Without a configured parameter, the cache always returns the deploy-time endpoint.
+
+        Returns:
+            Hub endpoint cache; create it once at module scope so it lives as long as the container
+        """
+        fallback = None
+        if os.environ.get(HUB_URL_ENV):
+            fallback = HubEndpoint(os.environ[HUB_URL_ENV], os.environ.get(DATABASE_HOST_ENV, ""))
+        return cls(
+            os.environ.get(HUB_ENDPOINT_PARAMETER_ENV),
+            ttl_seconds=float(os.environ.get(HUB_ENDPOINT_TTL_ENV) or DEFAULT_TTL_SECONDS),
+            fallback=fallback,
+        )
+
+    def get(self) -> HubEndpoint:
+        """
+        Get the hub endpoint, reading the parameter if the cached value expired.
+
+        Returns:
+            Hub endpoint
+
+        Raises:
+            LookupError: If no parameter is configured and there is no fallback endpoint
+            botocore.exceptions.ClientError: If the parameter cannot be read and no endpoint was read before
+        """
+        with self._lock:
+            if self.parameter_name and self.clock() >= self._expires_at:
+                self._read()
+            if self._endpoint is None:
+                raise LookupError(f"no hub endpoint in parameter {self.parameter_name} or the environment")
+            return self._endpoint
+
+    def refresh(self) -> HubEndpoint:
+        """
+        Read the parameter now, e.g. after the hub stopped answering at the cached address.
+
+        Returns:
+            Hub endpoint
+        """
+        with self._lock:
+            self._expires_at = float("-inf")
+        return self.get()
+
+    def call(self, fn: Callable[[HubEndpoint], T], retry_on: tuple[type[BaseException], ...] = (OSError,)) -> T:
+        """
+        Call the hub, retrying once with a refreshed endpoint if the call fails to connect and the endpoint moved.
+
+        Args:
+            fn: Function making the call to the given endpoint
+            retry_on: Connection errors, e.g. requests.ConnectionError (an OSError) or psycopg.OperationalError
+
+        Returns:
+            Result of fn
+        """
+        endpoint = self.get()
+        try:
+            return fn(endpoint)
+        except retry_on:
+            if self.refresh() == endpoint:
+                raise
+        return fn(self.get())
+
+    def _read(self) -> None:
+        # Failed reads also wait for the TTL, so an SSM outage does not add a request to every hub call
+        self._expires_at = self.clock() + self.ttl_seconds
+        try:
+            value = self.client.get_parameter(Name=self.parameter_name)["Parameter"]["Value"]
+            self._endpoint = HubEndpoint.from_json(value)
+            self.refreshes += 1
+        except Exception:
+            if self._endpoint is None:
+                raise
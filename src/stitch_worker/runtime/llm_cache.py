@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+# Environment variables set by StitchWorkerStack on the processes with llm_cache enabled
+LLM_CACHE_BACKEND_ENV = "LLM_CACHE_BACKEND"
+LLM_CACHE_TABLE_ENV = "LLM_CACHE_TABLE_NAME"
+LLM_CACHE_BUCKET_ENV = "LLM_CACHE_BUCKET"
+LLM_CACHE_PREFIX_ENV = "LLM_CACHE_PREFIX"
+LLM_CACHE_TTL_ENV = "LLM_CACHE_TTL_SECONDS"
+
+# Environment variables of the local file backend, set by hand in tests and local runs
+LLM_CACHE_DIR_ENV = "LLM_CACHE_DIR"
+LLM_CACHE_MAX_ENTRIES_ENV = "LLM_CACHE_MAX_ENTRIES"
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def cache_key(model: str, temperature: float, prompt: Any) -> str:
+    """
+    Compute the content address of a chat completion request.
+
+    Args:
+        model: Chat model name
+        temperature: Sampling temperature
+        prompt: Prompt string or list of chat messages
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON of the request
+    """
+    request = json.dumps(
+        {"model": model, "temperature": float(temperature), "prompt": prompt},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Storage of cached responses by content address"""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        """
+        Read a cached response.
+
+        Args:
+            key: Content address from cache_key
+
+        Returns:
+            Cached response, or None if it is missing or expired
+        """
+
+    @abstractmethod
+    def put(self, key: str, value: str) -> None:
+        """
+        Store a response.
+
+        Args:
+            key: Content address from cache_key
+            value: Response to cache
+        """
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Cache in a local directory for tests and local runs.
+
+    Entries expire after ttl_seconds, and once there are more than max_entries the least recently used entries (by
+    file modification time, which is refreshed on every hit) are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries = sum(1 for _ in self.directory.glob("*/*.json"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        now = self.clock()
+        if now - entry["created_at"] > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            self._entries -= 1
+            return None
+        os.utime(path, (now, now))
+        return entry["value"]
+
+    def put(self, key: str, value: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        if not path.exists():
+            self._entries += 1
+        temporary_path = path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"created_at": self.clock(), "value": value}))
+        temporary_path.replace(path)
+        now = self.clock()
+        os.utime(path, (now, now))
+
+        if self._entries > self.max_entries:
+            self._evict()
+
+    def _evict(self) -> None:
+        paths = sorted(self.directory.glob("*/*.json"), key=lambda path: path.stat().st_mtime)
+        for path in paths[: len(paths) - self.max_entries]:
+            path.unlink(missing_ok=True)
+        self._entries = min(len(paths), self.max_entries)
+
+
+class DynamoDBCacheBackend(CacheBackend):
+    """
+    Cache in the DynamoDB table provisioned by StitchWorkerStack.
+
+    Items carry an expires_at TTL attribute. Hits in the second half of the TTL push the expiry out again, so entries
+    that keep being used stay cached while unused ones expire. The table is not capped in size: it is bounded by the
+    entries written within one TTL.
+    """
+
+    def __init__(self, table_name: str, ttl_seconds: int = DEFAULT_TTL_SECONDS, dynamodb_client: Any = None) -> None:
+        if dynamodb_client is None:
+            import boto3
+
+            dynamodb_client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.client = dynamodb_client
+
+    def get(self, key: str) -> str | None:
+        item = self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}}).get("Item")
+        now = int(time.time())
+        # DynamoDB deletes expired items lazily, so they can still be returned for a while
+        if not item or int(item["expires_at"]["N"]) <= now:
+            return None
+        if int(item["expires_at"]["N"]) - now < self.ttl_seconds // 2:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"key": {"S": key}},
+                UpdateExpression="SET expires_at = :expires_at",
+                ExpressionAttributeValues={":expires_at": {"N": str(now + self.ttl_seconds)}},
+            )
+        return item["value"]["S"]
+
+    def put(self, key: str, value: str) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "key": {"S": key},
+                "value": {"S": value},
+                "expires_at": {"N": str(int(time.time()) + self.ttl_seconds)},
+            },
+        )
+
+
+class S3CacheBackend(CacheBackend):
+    """
+    Cache under an S3 prefix; the bucket lifecycle rule created by StitchWorkerStack expires old entries.
+
+    The prefix is not capped in size: it is bounded by the entries written within the lifecycle expiry.
+    """
+
+    def __init__(self, bucket: str, prefix: str, s3_client: Any = None) -> None:
+        if s3_client is None:
+            import boto3
+
+            s3_client = boto3.client("s3")
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.client = s3_client
+
+    def get(self, key: str) -> str | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read().decode()
+
+    def put(self, key: str, value: str) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=f"{self.prefix}/{key}", Body=value.encode(), ContentType="application/json"
+        )
+
+
+class LLMCache:
+    """Content-addressed cache of chat completion responses with hit rate tracking"""
+
+    def __init__(self, backend: CacheBackend | None) -> None:
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_environment(cls) -> "LLMCache":
+        """
+        Create the cache configured by StitchWorkerStack.
+
+        LLM_CACHE_BACKEND selects dynamodb, s3 or file; without it the cache is disabled and every call is computed.
+
+        Returns:
+            LLM cache
+        """
+        backend_name = os.environ.get(LLM_CACHE_BACKEND_ENV, "")
+        ttl_seconds = int(os.environ.get(LLM_CACHE_TTL_ENV) or DEFAULT_TTL_SECONDS)
+        if backend_name == "dynamodb":
+            backend = DynamoDBCacheBackend(os.environ[LLM_CACHE_TABLE_ENV], ttl_seconds)
+        elif backend_name == "s3":
+            backend = S3CacheBackend(os.environ[LLM_CACHE_BUCKET_ENV], os.environ[LLM_CACHE_PREFIX_ENV])
+        elif backend_name == "file":
+            backend = FileCacheBackend(
+                os.environ.get(LLM_CACHE_DIR_ENV) or "/tmp/llm-cache",
+                ttl_seconds,
+                int(os.environ.get(LLM_CACHE_MAX_ENTRIES_ENV) or DEFAULT_MAX_ENTRIES),
+            )
+        else:
+            backend = None
+        return cls(backend)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get_or_compute(self, model: str, temperature: float, prompt: Any, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached response for a request, calling the model only on a miss.
+
+        Args:
+            model: Chat model name
+            temperature: Sampling temperature
+            prompt: Prompt string or list of chat messages
+            compute: Function that calls the model and returns a JSON-serializable response
+
+        Returns:
+            Cached or newly computed response
+        """
+        if self.backend is None:
+            return compute()
+
+        key = cache_key(model, temperature, prompt)
+        cached = self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        response = compute()
+        self.backend.put(key, json.dumps(response))
+        return response
+
+    def add_metrics(self, metrics: Any) -> None:
+        """
+        Add the hits, misses and hit rate to a Powertools Metrics instance.
+
+        Args:
+            metrics: aws_lambda_powertools.Metrics of the handler
+        """
+        from aws_lambda_powertools.metrics import MetricUnit
+
+        if not self.hits + self.misses:
+            return
+        metrics.add_metric(name="LLMCacheHits", unit=MetricUnit.Count, value=self.hits)
+        metrics.add_metric(name="LLMCacheMisses", unit=MetricUnit.Count, value=self.misses)
+        metrics.add_metric(name="LLMCacheHitRate", unit=MetricUnit.Percent, value=100 * self.hit_rate)
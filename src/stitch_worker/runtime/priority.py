@@ -0,0 +1,42 @@
+from typing import Any
+
+HIGH_PRIORITY = "high"
+LOW_PRIORITY = "low"
+
+# Suffix of the queue of the high priority lane; the low priority lane keeps the process queue name
+HIGH_PRIORITY_QUEUE_SUFFIX = "-high"
+
+
+def record_priority(record: dict[str, Any]) -> str:
+    """
+    Get the priority lane an SQS record was received from.
+
+    Args:
+        record: SQS record of the Lambda event
+
+    Returns:
+        HIGH_PRIORITY for records of the high priority queue, otherwise LOW_PRIORITY
+    """
+    queue_name = record.get("eventSourceARN", "").rsplit(":", 1)[-1]
+    return HIGH_PRIORITY if queue_name.endswith(HIGH_PRIORITY_QUEUE_SUFFIX) else LOW_PRIORITY
+
+
+def propagate_priority(record: dict[str, Any], outgoing_detail: dict[str, Any]) -> dict[str, Any]:
+    """
+    Mark the event a stage sends next with the priority of the record it processed.
+
+    Downstream processes route events on detail.metadata.priority, so every stage must do this to keep a document in
+    the high priority lane. Documents uploaded through a high priority ingestion route enter the high priority lane
+    here, in the first stage after the upload.
+
+    Args:
+        record: SQS record that triggered the stage
+        outgoing_detail: Detail of the event the stage sends
+
+    Returns:
+        Outgoing detail with metadata.priority set for high priority documents
+    """
+    if record_priority(record) != HIGH_PRIORITY:
+        return outgoing_detail
+    metadata = {**outgoing_detail.get("metadata", {}), "priority": HIGH_PRIORITY}
+    return {**outgoing_detail, "metadata": metadata}
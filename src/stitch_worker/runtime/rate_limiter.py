@@ -0,0 +1,261 @@
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import Any
+
+# Environment variables set by StitchWorkerStack on the Lambdas that call rate-limited APIs
+RATE_LIMIT_TABLE_ENV = "RATE_LIMIT_TABLE_NAME"
+MODEL_QUOTAS_ENV = "MODEL_QUOTAS"
+
+# Upper bound for a single wait so a blocked caller re-reads the shared bucket regularly
+MAX_WAIT_SECONDS = 5.0
+
+# Compare-and-set attempts of one try_acquire, and the bounds of the backoff after a lost attempt
+MAX_CONFLICTS = 5
+CONFLICT_BASE_DELAY = 0.02
+CONFLICT_MAX_DELAY = 0.5
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when tokens could not be acquired before the timeout"""
+
+
+class BucketState:
+    """Remaining requests and tokens of a model bucket at a point in time"""
+
+    __slots__ = ("requests", "tokens", "updated_at")
+
+    def __init__(self, requests: float, tokens: float, updated_at: float) -> None:
+        self.requests = requests
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class BucketStore(ABC):
+    """Storage of bucket states with compare-and-set updates"""
+
+    @abstractmethod
+    def get(self, key: str) -> tuple[BucketState | None, int]:
+        """
+        Read a bucket.
+
+        Args:
+            key: Bucket key
+
+        Returns:
+            Tuple of the state (None for a new bucket) and its version
+        """
+
+    @abstractmethod
+    def put(self, key: str, state: BucketState, version: int) -> bool:
+        """
+        Write a bucket if it was not changed since it was read.
+
+        Args:
+            key: Bucket key
+            state: New state
+            version: Version returned by get
+
+        Returns:
+            True if the state was written, False if another caller updated the bucket first
+        """
+
+
+class LocalBucketStore(BucketStore):
+    """In-process bucket store for tests and local runs"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[BucketState, int]] = {}
+
+    def get(self, key: str) -> tuple[BucketState | None, int]:
+        with self._lock:
+            state, version = self._buckets.get(key, (None, 0))
+            return (BucketState(state.requests, state.tokens, state.updated_at) if state else None), version
+
+    def put(self, key: str, state: BucketState, version: int) -> bool:
+        with self._lock:
+            if self._buckets.get(key, (None, 0))[1] != version:
+                return False
+            self._buckets[key] = (BucketState(state.requests, state.tokens, state.updated_at), version + 1)
+            return True
+
+
+class DynamoDBBucketStore(BucketStore):
+    """Bucket store backed by the rate limit table provisioned by StitchWorkerStack"""
+
+    def __init__(self, table_name: str, dynamodb_client: Any = None) -> None:
+        if dynamodb_client is None:
+            import boto3
+
+            dynamodb_client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = dynamodb_client
+
+    def get(self, key: str) -> tuple[BucketState | None, int]:
+        item = self.client.get_item(TableName=self.table_name, Key={"bucket": {"S": key}}, ConsistentRead=True).get(
+            "Item"
+        )
+        if not item:
+            return None, 0
+        state = BucketState(float(item["requests"]["N"]), float(item["tokens"]["N"]), float(item["updated_at"]["N"]))
+        return state, int(item["version"]["N"])
+
+    def put(self, key: str, state: BucketState, version: int) -> bool:
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "bucket": {"S": key},
+                    "requests": {"N": repr(state.requests)},
+                    "tokens": {"N": repr(state.tokens)},
+                    "updated_at": {"N": repr(state.updated_at)},
+                    "version": {"N": str(version + 1)},
+                },
+                ConditionExpression="attribute_not_exists(#bucket) OR #version = :version",
+                ExpressionAttributeNames={"#bucket": "bucket", "#version": "version"},
+                ExpressionAttributeValues={":version": {"N": str(version)}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by all stages through a bucket store.
+
+    Each model has one bucket holding its remaining requests and tokens. Buckets refill continuously at the per-minute
+    quota and hold at most one minute of quota, so bursts never exceed what the API allows.
+
+    Args:
+        store: Bucket store shared by the callers
+        quotas: Requests and tokens per minute by model
+        clock: Function returning the current time, replaced in tests
+        sleep: Function used to wait, replaced in tests
+        max_conflicts: Compare-and-set attempts of one try_acquire before it gives up and asks the caller to wait
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        quotas: dict[str, dict[str, int | None]],
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        max_conflicts: int = MAX_CONFLICTS,
+    ) -> None:
+        self.store = store
+        self.quotas = quotas
+        self.clock = clock
+        self.sleep = sleep
+        self.max_conflicts = max_conflicts
+
+    @classmethod
+    def from_environment(cls) -> "RateLimiter":
+        """
+        Create the rate limiter configured by StitchWorkerStack.
+
+        Falls back to a LocalBucketStore when no rate limit table is configured, which limits the calls of this
+        process only.
+
+        Returns:
+            Rate limiter
+        """
+        quotas = json.loads(os.environ.get(MODEL_QUOTAS_ENV) or "{}")
+        table_name = os.environ.get(RATE_LIMIT_TABLE_ENV)
+        store = DynamoDBBucketStore(table_name) if table_name else LocalBucketStore()
+        return cls(store, quotas)
+
+    def try_acquire(self, model: str, tokens: int = 0, requests: int = 1) -> float:
+        """
+        Take requests and tokens from the bucket of a model without waiting.
+
+        Models without a quota are not limited. When another caller updates the bucket between the read and the
+        write, the update is retried after a jittered backoff, up to max_conflicts times.
+
+        Args:
+            model: Model name, e.g. gpt-4o
+            tokens: Number of tokens the requests will use
+            requests: Number of requests, e.g. 1 for an embedding call with a whole batch of inputs
+
+        Returns:
+            0 if the requests and tokens were acquired, otherwise the seconds until the bucket holds enough, or
+            until the next attempt if every compare-and-set lost against other callers
+
+        Raises:
+            ValueError: If the amount exceeds what the bucket can ever hold
+        """
+        quota = self.quotas.get(model)
+        if quota is None:
+            return 0.0
+
+        request_rate = quota["requests_per_minute"] / 60
+        token_rate = (quota.get("tokens_per_minute") or 0) / 60
+        if requests > quota["requests_per_minute"] or (token_rate and tokens > quota["tokens_per_minute"]):
+            raise ValueError(f"{requests} requests and {tokens} tokens exceed the per-minute quota of {model}")
+
+        for attempt in range(self.max_conflicts):
+            if attempt:
+                # Full jitter spreads the retries of the callers that collided instead of repeating the collision
+                self.sleep(random.uniform(0, min(CONFLICT_MAX_DELAY, CONFLICT_BASE_DELAY * 2 ** (attempt - 1))))
+            now = self.clock()
+            state, version = self.store.get(model)
+            if state is None:
+                state = BucketState(quota["requests_per_minute"], quota.get("tokens_per_minute") or 0, now)
+
+            # Refill for the time since the last update, capped at one minute of quota
+            elapsed = max(0.0, now - state.updated_at)
+            available_requests = min(quota["requests_per_minute"], state.requests + elapsed * request_rate)
+            available_tokens = min(quota.get("tokens_per_minute") or 0, state.tokens + elapsed * token_rate)
+
+            wait = (requests - available_requests) / request_rate
+            if token_rate:
+                wait = max(wait, (tokens - available_tokens) / token_rate)
+            if wait > 0:
+                return wait
+
+            new_state = BucketState(available_requests - requests, available_tokens - tokens if token_rate else 0, now)
+            if self.store.put(model, new_state, version):
+                return 0.0
+        return random.uniform(CONFLICT_BASE_DELAY, CONFLICT_MAX_DELAY)
+
+    def acquire(self, model: str, tokens: int = 0, requests: int = 1, timeout: float | None = None) -> float:
+        """
+        Take requests and tokens from the bucket of a model, waiting until they are available.
+
+        Args:
+            model: Model name, e.g. gpt-4o
+            tokens: Number of tokens the requests will use
+            requests: Number of requests
+            timeout: Maximum seconds to wait, or None to wait as long as needed
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitTimeout: If the tokens were not acquired within the timeout
+        """
+        start = self.clock()
+        while wait := self.try_acquire(model, tokens, requests):
+            waited = self.clock() - start
+            if timeout is not None and waited + wait > timeout:
+                raise RateLimitTimeout(f"Timed out after {waited:.1f}s waiting for the {model} rate limit")
+            self.sleep(min(wait, MAX_WAIT_SECONDS))
+        return self.clock() - start
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text for acquiring tokens before the exact count is known.
+
+    Args:
+        text: Prompt or input text
+
+    Returns:
+        Estimated number of tokens (about four characters per token)
+    """
+    return len(text) // 4 + 1
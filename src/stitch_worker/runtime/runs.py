@@ -0,0 +1,39 @@
+import uuid
+from typing import Any
+
+# Key of the run ID in the metadata of the event detail
+RUN_ID_KEY = "run_id"
+
+
+def get_run_id(detail: dict[str, Any]) -> str | None:
+    """
+    Get the processing run an event belongs to.
+
+    Args:
+        detail: Event detail
+
+    Returns:
+        Run ID from detail.metadata, or None for events sent before the run was started
+    """
+    return (detail.get("metadata") or {}).get(RUN_ID_KEY)
+
+
+def start_run(detail: dict[str, Any], run_id: str | None = None) -> dict[str, Any]:
+    """
+    Mark the first event of a document's processing run with the run ID.
+
+    A run starts each time a document enters the pipeline, e.g. on upload or backfill, and the ID travels in
+    detail.metadata with the rest of the metadata. Join stages keep one record per document and run, so a document
+    processed again completes its joins again, while redelivered and redriven events of a run are counted once.
+
+    Args:
+        detail: Detail of the first event of the run
+        run_id: ID of the run, a random ID if not given
+
+    Returns:
+        Detail with detail.metadata.run_id set; a detail that already belongs to a run is returned unchanged
+    """
+    if get_run_id(detail):
+        return detail
+    metadata = {**(detail.get("metadata") or {}), RUN_ID_KEY: run_id or uuid.uuid4().hex}
+    return {**detail, "metadata": metadata}
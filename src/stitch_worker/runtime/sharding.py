@@ -0,0 +1,131 @@
+import json
+import math
+import os
+from typing import Any
+
+from .runs import start_run
+
+# Environment variables set by StitchWorkerStack on the processes with sharding enabled
+SHARD_PAGES_PER_SHARD_ENV = "SHARD_PAGES_PER_SHARD"
+SHARD_MAX_SHARDS_ENV = "SHARD_MAX_SHARDS"
+SHARD_EVENT_DETAIL_TYPE_ENV = "SHARD_EVENT_DETAIL_TYPE"
+
+# Maximum number of entries per EventBridge PutEvents request
+PUT_EVENTS_BATCH_SIZE = 10
+
+
+class Shard:
+    """A page range of a document that is processed as its own pipeline run"""
+
+    __slots__ = ("index", "count", "first_page", "last_page")
+
+    def __init__(self, index: int, count: int, first_page: int, last_page: int) -> None:
+        self.index = index
+        self.count = count
+        self.first_page = first_page
+        self.last_page = last_page
+
+    def __repr__(self) -> str:
+        return f"Shard({self.index + 1}/{self.count}, pages {self.first_page}-{self.last_page})"
+
+    def to_detail(self) -> dict[str, int]:
+        """
+        Build the shard metadata carried in the event detail.
+
+        Returns:
+            Detail value for the "shard" key; pages are 1-based and inclusive
+        """
+        return {"index": self.index, "count": self.count, "first_page": self.first_page, "last_page": self.last_page}
+
+
+def plan_shards(page_count: int, pages_per_shard: int, max_shards: int) -> list[Shard]:
+    """
+    Split a document into page ranges of roughly equal size.
+
+    Documents with more than pages_per_shard * max_shards pages get larger shards instead of more of them.
+
+    Args:
+        page_count: Number of pages of the document
+        pages_per_shard: Target number of pages per shard
+        max_shards: Maximum number of shards
+
+    Returns:
+        Shards covering every page once; a single shard if the document is not larger than pages_per_shard
+    """
+    if page_count < 1:
+        raise ValueError("page_count must be at least 1")
+    count = min(max_shards, math.ceil(page_count / pages_per_shard))
+    base, extra = divmod(page_count, count)
+
+    shards = []
+    first_page = 1
+    for index in range(count):
+        size = base + (1 if index < extra else 0)
+        shards.append(Shard(index, count, first_page, first_page + size - 1))
+        first_page += size
+    return shards
+
+
+def shard_events(
+    detail: dict[str, Any], shards: list[Shard], detail_type: str, event_bus_name: str
+) -> list[list[dict[str, Any]]]:
+    """
+    Build the PutEvents entries that start one pipeline run per shard.
+
+    The shards share the processing run of the document, started here unless the detail already belongs to one.
+
+    Args:
+        detail: Detail of the event that would have been sent for the whole document
+        shards: Shards from plan_shards
+        detail_type: Detail type of the shard events, e.g. FileShardCreated
+        event_bus_name: Event bus name
+
+    Returns:
+        Entries in batches of at most PUT_EVENTS_BATCH_SIZE, one PutEvents request each
+    """
+    detail = start_run(detail)
+    entries = [
+        {
+            "Source": "stitch.worker",
+            "DetailType": detail_type,
+            "Detail": json.dumps({**detail, "shard": shard.to_detail()}),
+            "EventBusName": event_bus_name,
+        }
+        for shard in shards
+    ]
+    return [entries[start : start + PUT_EVENTS_BATCH_SIZE] for start in range(0, len(entries), PUT_EVENTS_BATCH_SIZE)]
+
+
+def propagate_shard(incoming_detail: dict[str, Any], outgoing_detail: dict[str, Any]) -> dict[str, Any]:
+    """
+    Copy the shard metadata of an incoming event to the event a stage sends next.
+
+    Every stage between split-file and the join stage must do this, so that the join stage can count the shards.
+
+    Args:
+        incoming_detail: Detail of the event that triggered the stage
+        outgoing_detail: Detail of the event the stage sends
+
+    Returns:
+        Outgoing detail with the "shard" key of the incoming detail, if any
+    """
+    if "shard" in outgoing_detail or "shard" not in incoming_detail:
+        return outgoing_detail
+    return {**outgoing_detail, "shard": incoming_detail["shard"]}
+
+
+def sharding_config() -> tuple[int, int, str] | None:
+    """
+    Read the sharding configuration set by StitchWorkerStack.
+
+    Returns:
+        Pages per shard, maximum number of shards and the shard event detail type, or None when sharding is disabled
+    """
+    pages_per_shard = os.environ.get(SHARD_PAGES_PER_SHARD_ENV)
+    if not pages_per_shard:
+        return None
+    return (
+        int(pages_per_shard),
+        int(os.environ.get(SHARD_MAX_SHARDS_ENV) or 100),
+        os.environ[SHARD_EVENT_DETAIL_TYPE_ENV],
+    )
@@ -0,0 +1,66 @@
+import json
+from typing import Any
+
+# Name of the object next to the analysis output holding the context of a job
+CONTEXT_OBJECT_NAME = "context.json"
+
+
+def job_context_key(key_prefix: str, job_id: str) -> str:
+    """
+    Key of the context of a Textract job.
+
+    Args:
+        key_prefix: TEXT_EXTRACTION_S3_KEY_PREFIX, e.g. textract-output
+        job_id: JobId returned by StartDocumentAnalysis
+
+    Returns:
+        Object key next to the blocks written by the Textract notification handler
+    """
+    return f"{key_prefix.rstrip('/')}/{job_id}/{CONTEXT_OBJECT_NAME}"
+
+
+def save_job_context(
+    s3_client: Any, bucket: str, key_prefix: str, job_id: str, document_id: str, detail: dict[str, Any]
+) -> str:
+    """
+    Keep the event that started a Textract job until its completion notification arrives.
+
+    document-extract calls this right after StartDocumentAnalysis. The notification only carries the JobId, JobTag and
+    document location, so the Textract notification handler merges the saved detail (metadata, shard and the pipeline
+    document ID) back into DocumentExtractionCompleted.
+
+    Args:
+        s3_client: Boto3 S3 client
+        bucket: TEXT_EXTRACTION_S3_BUCKET
+        key_prefix: TEXT_EXTRACTION_S3_KEY_PREFIX
+        job_id: JobId returned by StartDocumentAnalysis
+        document_id: Document ID used by the rest of the pipeline
+        detail: Detail of the event that triggered document-extract
+
+    Returns:
+        Key of the saved context
+    """
+    key = job_context_key(key_prefix, job_id)
+    body = json.dumps({"document_id": document_id, "detail": detail}, separators=(",", ":"))
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode(), ContentType="application/json")
+    return key
+
+
+def load_job_context(s3_client: Any, bucket: str, key_prefix: str, job_id: str) -> dict[str, Any] | None:
+    """
+    Read the context saved by save_job_context.
+
+    Args:
+        s3_client: Boto3 S3 client
+        bucket: TEXT_EXTRACTION_S3_BUCKET
+        key_prefix: TEXT_EXTRACTION_S3_KEY_PREFIX
+        job_id: JobId of the completion notification
+
+    Returns:
+        Dict with the document_id and the detail of the triggering event, or None if it was not saved (yet)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=job_context_key(key_prefix, job_id))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
@@ -0,0 +1,260 @@
+"""
+Concurrent batched upserts of embeddings to the Pinecone index.
+
+Vectors are added as the embedding batches arrive and are upserted in batches of their own size from a thread pool.
+Adding vectors blocks while too many upserts are in flight, overall or for their namespace. A document then never
+holds more than a few batches of vectors in memory, and the upserts overlap the embedding calls instead of following
+them. A retried batch keeps its slot while it backs off, so a throttled namespace slows down the producer.
+"""
+
+import os
+import random
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+# Environment variables set by processes.yaml on block-vectorization
+PINECONE_API_KEY_ENV = "PINECONE_API_KEY"
+PINECONE_INDEX_NAME_ENV = "PINECONE_INDEX_NAME"
+UPSERT_BATCH_SIZE_ENV = "PINECONE_UPSERT_BATCH_SIZE"
+UPSERT_CONCURRENCY_ENV = "PINECONE_UPSERT_CONCURRENCY"
+NAMESPACE_CONCURRENCY_ENV = "PINECONE_NAMESPACE_CONCURRENCY"
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+
+# HTTP statuses of upserts that can succeed once the index caught up
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tell whether a failed upsert is worth retrying.
+
+    Args:
+        error: Exception raised by the index
+
+    Returns:
+        True for throttling, server errors, timeouts and connection errors
+    """
+    status = getattr(error, "status", None)
+    return status in RETRYABLE_STATUSES or isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _vector_id(vector: Any) -> str:
+    # Pinecone accepts (id, values[, metadata]) tuples and {"id": ..., "values": ...} dicts
+    return vector["id"] if isinstance(vector, dict) else vector[0]
+
+
+class InMemoryIndex:
+    """
+    Index with the upsert and fetch methods of a Pinecone index, for tests and local runs.
+
+    Args:
+        latency: Seconds each upsert takes, to simulate the network
+        fail: Called with the namespace and vectors before each upsert, raises to simulate an error
+    """
+
+    def __init__(self, latency: float = 0.0, fail: Callable[[str, list], None] | None = None) -> None:
+        self.latency = latency
+        self.fail = fail
+        self.vectors: dict[str, dict[str, Any]] = {}
+        self.upserts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: list, namespace: str = "") -> dict[str, int]:
+        with self._lock:
+            self.upserts += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.fail:
+                self.fail(namespace, vectors)
+            with self._lock:
+                stored = self.vectors.setdefault(namespace, {})
+                for vector in vectors:
+                    stored[_vector_id(vector)] = vector
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids: list[str], namespace: str = "") -> dict[str, Any]:
+        with self._lock:
+            stored = self.vectors.get(namespace, {})
+            return {"vectors": {id_: stored[id_] for id_ in ids if id_ in stored}, "namespace": namespace}
+
+
+class UpsertResult:
+    """Vectors upserted per namespace, and the IDs and errors of the batches that failed"""
+
+    __slots__ = ("upserted", "failed", "errors")
+
+    def __init__(self) -> None:
+        self.upserted: dict[str, int] = {}
+        self.failed: dict[str, list[str]] = {}
+        self.errors: list[str] = []
+
+    def __repr__(self) -> str:
+        return (
+            f"UpsertResult({sum(self.upserted.values())} upserted, "
+            f"{sum(len(ids) for ids in self.failed.values())} failed)"
+        )
+
+
+class VectorUpsertPipeline:
+    """
+    Pipeline upserting vectors to an index in batches, with a bounded number of concurrent requests.
+
+    Use it as a context manager: leaving the block upserts the partial batches and waits for every request. A batch
+    that still fails after max_attempts is recorded in the result instead of stopping the other batches.
+
+    Args:
+        index: Pinecone index, or an InMemoryIndex
+        batch_size: Vectors per upsert request, independent of the embedding batch size
+        concurrency: Upsert requests in flight at the same time
+        namespace_concurrency: Upsert requests in flight at the same time for one namespace, defaults to concurrency
+        max_attempts: Attempts per batch for retryable errors
+        base_delay: Upper bound of the first backoff, doubled for each further attempt
+        max_delay: Upper bound of any backoff
+        retryable: Tells whether an error is retryable
+        sleep: Function used to wait, replaced in tests
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        namespace_concurrency: int | None = None,
+        max_attempts: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        retryable: Callable[[Exception], bool] = is_retryable,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("batch_size and concurrency must be at least 1")
+        self.index = index
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.namespace_concurrency = min(namespace_concurrency or concurrency, concurrency)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self.sleep = sleep
+        self.result = UpsertResult()
+        self._buffers: dict[str, list] = {}
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._namespace_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vector-upsert")
+
+    @classmethod
+    def from_environment(cls, index: Any = None) -> "VectorUpsertPipeline":
+        """
+        Create the pipeline configured by processes.yaml.
+
+        Args:
+            index: Index to upsert to, defaults to PINECONE_INDEX_NAME opened with the pinecone client
+
+        Returns:
+            Vector upsert pipeline
+        """
+        if index is None:
+            from pinecone import Pinecone
+
+            index = Pinecone(api_key=os.environ[PINECONE_API_KEY_ENV]).Index(os.environ[PINECONE_INDEX_NAME_ENV])
+        return cls(
+            index,
+            batch_size=int(os.environ.get(UPSERT_BATCH_SIZE_ENV) or DEFAULT_BATCH_SIZE),
+            concurrency=int(os.environ.get(UPSERT_CONCURRENCY_ENV) or DEFAULT_CONCURRENCY),
+            namespace_concurrency=int(os.environ.get(NAMESPACE_CONCURRENCY_ENV) or 0) or None,
+        )
+
+    def __enter__(self) -> "VectorUpsertPipeline":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def add(self, vectors: Iterable[Any], namespace: str = "") -> None:
+        """
+        Add vectors, upserting every full batch.
+
+        Blocks while the upsert requests in flight are at the limit of the pipeline or of the namespace.
+
+        Args:
+            vectors: Vectors as (id, values[, metadata]) tuples or dicts, e.g. one embedding batch
+            namespace: Index namespace
+        """
+        buffer = self._buffers.setdefault(namespace, [])
+        for vector in vectors:
+            buffer.append(vector)
+            if len(buffer) >= self.batch_size:
+                self._submit(namespace, buffer)
+                buffer = self._buffers[namespace] = []
+
+    def flush(self) -> None:
+        """Upsert the partial batches of every namespace without waiting for them"""
+        for namespace, buffer in self._buffers.items():
+            if buffer:
+                self._submit(namespace, buffer)
+        self._buffers.clear()
+
+    def close(self) -> UpsertResult:
+        """
+        Upsert the partial batches and wait for every request.
+
+        Returns:
+            Vectors upserted and failed per namespace
+        """
+        self.flush()
+        self._executor.shutdown(wait=True)
+        return self.result
+
+    def _submit(self, namespace: str, batch: list) -> None:
+        with self._lock:
+            namespace_slots = self._namespace_slots.get(namespace)
+            if namespace_slots is None:
+                namespace_slots = self._namespace_slots[namespace] = threading.BoundedSemaphore(
+                    self.namespace_concurrency
+                )
+        # Waiting here, before the batch is queued, keeps the vectors held in memory bounded
+        namespace_slots.acquire()
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._upsert, namespace, batch, namespace_slots)
+        except BaseException:
+            self._slots.release()
+            namespace_slots.release()
+            raise
+
+    def _upsert(self, namespace: str, batch: list, namespace_slots: threading.BoundedSemaphore) -> None:
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    self.index.upsert(vectors=batch, namespace=namespace)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_attempts or not self.retryable(e):
+                        with self._lock:
+                            self.result.failed.setdefault(namespace, []).extend(_vector_id(v) for v in batch)
+                            self.result.errors.append(f"{namespace or '(default)'}: {e}")
+                        return
+                # Full jitter spreads the retries of concurrent batches instead of repeating their collision
+                self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+            with self._lock:
+                self.result.upserted[namespace] = self.result.upserted.get(namespace, 0) + len(batch)
+        finally:
+            self._slots.release()
+            namespace_slots.release()
@@ -0,0 +1,534 @@
+"""
+Offline simulator for the processing pipeline.
+
+Replays the routing of processes.yaml with an in-process event bus: events are matched against each process
+event_pattern, queued in memory and consumed by stub handlers on an asyncio event loop that runs on simulated time,
+so hours of pipeline activity take seconds to simulate.
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import selectors
+import statistics
+from collections.abc import Callable
+from typing import Any
+
+from stitch_worker.event_patterns import RuleIndex, matches_pattern
+from stitch_worker.process_definition import ProcessDefinition
+from stitch_worker.process_graph import WORKER_EVENT_SOURCE, ProcessGraph
+
+# Handler stub: receives the batch of events of one invocation and returns the events it emits
+StageHandler = Callable[[ProcessDefinition, list[dict[str, Any]]], list[dict[str, Any]]]
+
+# Latency model: returns the duration in seconds of one invocation for a batch size
+LatencyModel = Callable[[random.Random, int], float]
+
+DEFAULT_CONCURRENCY = 10
+
+
+def fixed_latency(seconds: float, per_message: float = 0.0) -> LatencyModel:
+    """Latency that is the same for every invocation plus a cost per message of the batch"""
+    return lambda rng, batch_size: seconds + per_message * batch_size
+
+
+def uniform_latency(low: float, high: float, per_message: float = 0.0) -> LatencyModel:
+    """Latency drawn uniformly between low and high plus a cost per message of the batch"""
+    return lambda rng, batch_size: rng.uniform(low, high) + per_message * batch_size
+
+
+def lognormal_latency(median: float, sigma: float = 0.5, per_message: float = 0.0) -> LatencyModel:
+    """Long-tailed latency around a median, typical of calls to external APIs"""
+    return lambda rng, batch_size: rng.lognormvariate(math.log(median), sigma) + per_message * batch_size
+
+
+def emit_completion_events(process: ProcessDefinition, events: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Default handler stub: emit the events declared in processes.yaml, carrying the document forward"""
+    return [
+        {
+            "source": WORKER_EVENT_SOURCE,
+            "detail-type": detail_type,
+            "detail": {"document_id": document_id(event), "metadata": event["detail"].get("metadata", {})},
+        }
+        for event in events
+        for detail_type in process.emits
+    ]
+
+
+def document_id(event: dict[str, Any]) -> str:
+    """Get the document ID of an event; S3 events are identified by the object key"""
+    detail = event.get("detail", {})
+    return detail.get("document_id") or detail.get("object", {}).get("key")
+
+
+class JoinHandler:
+    """
+    Handler stub of a join stage, emitting its event once per document like the built-in join handler.
+
+    A shards_of join waits for the event of every shard. A waits_for join waits for each awaited event, once per shard
+    for the events of a sharded document, and counts the event of a conditional branch as skipped when the branch's
+    trigger event does not match its pattern.
+
+    Args:
+        process: Join stage
+        waits_for: Awaited events that can arrive, from ProcessGraph.resolve_join
+        branches: Event patterns of the conditional branches by awaited event, from ProcessGraph.resolve_join
+    """
+
+    def __init__(
+        self,
+        process: ProcessDefinition,
+        waits_for: list[str] | None = None,
+        branches: dict[str, dict[str, Any]] | None = None,
+    ) -> None:
+        self.emits = process.join.emits
+        self.waits_for = waits_for if waits_for is not None else process.join.waits_for
+        self.branches = branches or {}
+        self.members: dict[str, set[str]] = {}
+        self.skipped: dict[str, set[str]] = {}
+        self.shard_counts: dict[str, int] = {}
+        self.metadata: dict[str, dict[str, Any]] = {}
+        self.completed: set[str] = set()
+
+    def __call__(self, process: ProcessDefinition, events: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        emitted = []
+        for event in events:
+            document = document_id(event)
+            shard = event["detail"].get("shard")
+            if shard:
+                self.shard_counts[document] = int(shard["count"])
+            self.metadata.setdefault(document, event["detail"].get("metadata", {}))
+            members = self.members.setdefault(document, set())
+            skipped = self.skipped.setdefault(document, set())
+            if self.waits_for is None:
+                members.add(str(shard["index"]))
+            else:
+                detail_type = event["detail-type"]
+                if detail_type in self.waits_for:
+                    members.add(_shard_member(detail_type, shard))
+                # Branches that filter on the shard run once per document, so a shard event does not skip them
+                skipped.update(
+                    _shard_member(awaited, shard)
+                    for awaited, pattern in self.branches.items()
+                    if detail_type in pattern.get("detail-type", [])
+                    and not (shard and "shard" in pattern.get("detail", {}))
+                    and not matches_pattern(pattern, event)
+                )
+            if document not in self.completed and self._is_complete(document):
+                self.completed.add(document)
+                emitted.append(self._completion_event(document))
+        return emitted
+
+    def _has(self, members: set[str], document: str, awaited: str) -> bool:
+        shard_count = self.shard_counts.get(document)
+        return awaited in members or (
+            shard_count is not None and all(f"{awaited}#{index}" in members for index in range(shard_count))
+        )
+
+    def _is_complete(self, document: str) -> bool:
+        members = self.members[document] | self.skipped[document]
+        if self.waits_for is None:
+            return document in self.shard_counts and len(members) >= self.shard_counts[document]
+        return all(self._has(members, document, awaited) for awaited in self.waits_for)
+
+    def _completion_event(self, document: str) -> dict[str, Any]:
+        detail: dict[str, Any] = {"document_id": document, "metadata": self.metadata[document]}
+        if self.waits_for is not None:
+            skipped = [awaited for awaited in self.waits_for if self._has(self.skipped[document], document, awaited)]
+            detail["completed"] = [awaited for awaited in self.waits_for if awaited not in skipped]
+            detail["skipped"] = skipped
+        if document in self.shard_counts:
+            detail["shards"] = self.shard_counts[document]
+        return {"source": WORKER_EVENT_SOURCE, "detail-type": self.emits, "detail": detail}
+
+
+def _shard_member(name: str, shard: dict[str, Any] | None) -> str:
+    return f"{name}#{shard['index']}" if shard else name
+
+
+class StageOptions:
+    """Simulation settings of a process, defaulting to its processes.yaml configuration"""
+
+    def __init__(
+        self,
+        latency: LatencyModel | None = None,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+        max_batching_window: float | None = None,
+        memory_size: int | None = None,
+        handler: StageHandler | None = None,
+    ) -> None:
+        self.latency = latency
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_batching_window = max_batching_window
+        self.memory_size = memory_size
+        self.handler = handler
+
+
+class VirtualClock:
+    """Simulated time, advanced by the event loop instead of waiting"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+
+class _VirtualTimeSelector(selectors.SelectSelector):
+    """Selector that advances the clock to the next scheduled callback instead of blocking"""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout: float | None = None) -> list:
+        if timeout is None:
+            raise RuntimeError("Simulation deadlocked: no scheduled work and no pending events")
+        self._clock.now += timeout
+        return []
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop where asyncio.sleep advances simulated time instantly"""
+
+    def __init__(self) -> None:
+        self.clock = VirtualClock()
+        super().__init__(selector=_VirtualTimeSelector(self.clock))
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+class _Message:
+    __slots__ = ("event", "document_id", "receive_count")
+
+    def __init__(self, event: dict[str, Any], document_id: str) -> None:
+        self.event = event
+        self.document_id = document_id
+        self.receive_count = 0
+
+
+class _Stage:
+    def __init__(self, process: ProcessDefinition, options: StageOptions) -> None:
+        self.process = process
+        self.handler = options.handler or emit_completion_events
+        self.latency = options.latency or fixed_latency(1.0)
+        self.concurrency = options.concurrency or process.scaling.max_concurrency or DEFAULT_CONCURRENCY
+        self.batch_size = options.batch_size or process.scaling.batch_size
+        self.max_batching_window = (
+            options.max_batching_window
+            if options.max_batching_window is not None
+            else process.scaling.max_batching_window
+        )
+        # Lambda CPU scales with memory, so latencies are assumed to be measured at the configured memory size
+        self.speedup = (options.memory_size or process.memory_size) / process.memory_size
+        self.queue: asyncio.Queue[_Message] = asyncio.Queue()
+        self.invocations = 0
+        self.timeouts = 0
+        self.dead_letters = 0
+        self.busy_time = 0.0
+
+
+class SimulationReport:
+    """Results of a simulation run"""
+
+    def __init__(
+        self,
+        document_latencies: dict[str, float],
+        backlog: dict[str, list[tuple[float, int]]],
+        stages: dict[str, dict[str, float]],
+        duration: float,
+    ) -> None:
+        self.document_latencies = document_latencies
+        self.backlog = backlog
+        self.stages = stages
+        self.duration = duration
+
+    def latency_percentiles(self, percentiles: tuple[int, ...] = (50, 90, 99)) -> dict[str, float]:
+        """
+        Compute the end-to-end document latency percentiles.
+
+        Args:
+            percentiles: Percentiles to compute
+
+        Returns:
+            Dictionary of percentile labels (e.g. p90) and latencies in seconds
+        """
+        latencies = sorted(self.document_latencies.values())
+        if not latencies:
+            return {}
+        if len(latencies) == 1:
+            return {f"p{percentile}": latencies[0] for percentile in percentiles} | {"max": latencies[0]}
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        return {f"p{percentile}": quantiles[percentile - 1] for percentile in percentiles} | {"max": latencies[-1]}
+
+    def max_backlog(self) -> dict[str, int]:
+        return {name: max((depth for _, depth in samples), default=0) for name, samples in self.backlog.items()}
+
+    def summary(self) -> str:
+        lines = [f"Documents: {len(self.document_latencies)}, simulated duration: {self.duration:.1f}s"]
+        lines.append(
+            "Document latency: "
+            + ", ".join(f"{label}={value:.1f}s" for label, value in self.latency_percentiles().items())
+        )
+        lines.append(f"{'process':<26}{'invokes':>9}{'timeouts':>10}{'dlq':>6}{'util':>7}{'max backlog':>13}")
+        max_backlog = self.max_backlog()
+        for name, stats in self.stages.items():
+            lines.append(
+                f"{name:<26}{stats['invocations']:>9.0f}{stats['timeouts']:>10.0f}{stats['dead_letters']:>6.0f}"
+                f"{stats['utilization']:>7.0%}{max_backlog[name]:>13}"
+            )
+        return "\n".join(lines)
+
+
+class PipelineSimulator:
+    """
+    Simulate the pipeline defined by the processes on an in-process event bus.
+
+    Every message on a process queue counts as in-flight work for its document; a document completes when its last
+    message has been processed and no further events were emitted for it.
+    """
+
+    def __init__(
+        self,
+        processes: list[ProcessDefinition],
+        options: dict[str, StageOptions] | None = None,
+        seed: int = 0,
+        sample_interval: float = 10.0,
+    ) -> None:
+        options = options or {}
+        self.processes = [process for process in processes if process.enabled]
+        self.options = {process.name: options.get(process.name, StageOptions()) for process in self.processes}
+        self.rng = random.Random(seed)
+        self.sample_interval = sample_interval
+
+    def run(self, uploads: list[tuple[float, dict[str, Any]]]) -> SimulationReport:
+        """
+        Run the simulation until every document has been processed.
+
+        Args:
+            uploads: List of arrival times in seconds and the events to put on the bus at that time
+
+        Returns:
+            Simulation report
+        """
+        loop = VirtualTimeEventLoop()
+        try:
+            return loop.run_until_complete(self._run(uploads))
+        finally:
+            loop.close()
+
+    async def _run(self, uploads: list[tuple[float, dict[str, Any]]]) -> SimulationReport:
+        loop = asyncio.get_running_loop()
+        graph = ProcessGraph(self.processes)
+        self._stages = [_Stage(process, self.options[process.name]) for process in self.processes]
+        self._stages_by_name = {stage.process.name: stage for stage in self._stages}
+        self._rules = RuleIndex()
+        for stage in self._stages:
+            process = stage.process
+            event_pattern = process.event_pattern
+            if process.join and process.join.waits_for:
+                # Routed like the stack routes it, with the trigger events of the conditional branches
+                event_pattern = graph.join_event_pattern(process.name)
+            if process.join and not self.options[process.name].handler:
+                resolved = graph.resolve_join(process.name) if process.join.waits_for else ()
+                stage.handler = JoinHandler(process, *resolved)
+            if event_pattern:
+                self._rules.add(process.name, event_pattern.to_event_pattern_kwargs())
+        self._in_flight: dict[str, int] = {}
+        self._started: dict[str, float] = {}
+        self._latencies: dict[str, float] = {}
+        self._backlog: dict[str, list[tuple[float, int]]] = {stage.process.name: [] for stage in self._stages}
+        self._pending_uploads = len(uploads)
+        self._done = asyncio.Event()
+
+        workers = [asyncio.create_task(self._poll(stage)) for stage in self._stages for _ in range(stage.concurrency)]
+        sampler = asyncio.create_task(self._sample())
+
+        # Uploads are scheduled in arrival order; a counter keeps the heap stable for equal times
+        counter = itertools.count()
+        schedule = [(arrival, next(counter), event) for arrival, event in uploads]
+        heapq.heapify(schedule)
+        while schedule:
+            arrival, _, event = heapq.heappop(schedule)
+            await asyncio.sleep(max(0.0, arrival - loop.time()))
+            self._started.setdefault(document_id(event), loop.time())
+            self._pending_uploads -= 1
+            self._publish(event)
+            self._check_done(document_id(event))
+
+        if uploads:
+            await self._done.wait()
+        duration = loop.time()
+
+        for task in [*workers, sampler]:
+            task.cancel()
+        await asyncio.gather(*workers, sampler, return_exceptions=True)
+
+        return SimulationReport(
+            document_latencies=self._latencies,
+            backlog=self._backlog,
+            stages={
+                stage.process.name: {
+                    "invocations": stage.invocations,
+                    "timeouts": stage.timeouts,
+                    "dead_letters": stage.dead_letters,
+                    "utilization": stage.busy_time / (duration * stage.concurrency) if duration else 0.0,
+                }
+                for stage in self._stages
+            },
+            duration=duration,
+        )
+
+    def _publish(self, event: dict[str, Any]) -> None:
+        for name in self._rules.match(event):
+            self._enqueue(self._stages_by_name[name], _Message(event, document_id(event)))
+
+    def _enqueue(self, stage: _Stage, message: _Message) -> None:
+        self._in_flight[message.document_id] = self._in_flight.get(message.document_id, 0) + 1
+        stage.queue.put_nowait(message)
+
+    def _complete(self, message: _Message) -> None:
+        self._in_flight[message.document_id] -= 1
+        self._check_done(message.document_id)
+
+    def _check_done(self, document: str) -> None:
+        loop = asyncio.get_running_loop()
+        if self._in_flight.get(document, 0) == 0 and document not in self._latencies:
+            self._latencies[document] = loop.time() - self._started[document]
+        if self._pending_uploads == 0 and not any(self._in_flight.values()):
+            self._done.set()
+
+    async def _poll(self, stage: _Stage) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for the first message, then gather a batch until it is full or the batching window closes
+            batch = [await stage.queue.get()]
+            deadline = loop.time() + stage.max_batching_window
+            while len(batch) < stage.batch_size:
+                if not stage.queue.empty():
+                    batch.append(stage.queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(stage.queue.get(), remaining))
+                except TimeoutError:
+                    break
+
+            await self._invoke(stage, batch)
+
+    async def _invoke(self, stage: _Stage, batch: list[_Message]) -> None:
+        stage.invocations += 1
+        for message in batch:
+            message.receive_count += 1
+
+        duration = stage.latency(self.rng, len(batch)) / stage.speedup
+        if duration > stage.process.timeout:
+            # The invocation times out and the batch becomes visible again after the visibility timeout
+            stage.timeouts += 1
+            stage.busy_time += stage.process.timeout
+            await asyncio.sleep(stage.process.timeout)
+            for message in batch:
+                if message.receive_count >= stage.process.retry.max_receive_count:
+                    stage.dead_letters += 1
+                    self._complete(message)
+                else:
+                    stage.queue.put_nowait(message)
+            return
+
+        stage.busy_time += duration
+        await asyncio.sleep(duration)
+        for event in stage.handler(stage.process, [message.event for message in batch]):
+            self._publish(event)
+        for message in batch:
+            self._complete(message)
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            for stage in self._stages:
+                self._backlog[stage.process.name].append((loop.time(), stage.queue.qsize()))
+            await asyncio.sleep(self.sample_interval)
+
+
+def s3_upload_event(bucket_name: str, key: str, metadata: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Build the S3 Object Created event of an uploaded document.
+
+    Args:
+        bucket_name: S3 bucket name
+        key: Object key, used as the document ID
+        metadata: Document metadata carried by the completion events (e.g. seed_questions, feature_types_count)
+
+    Returns:
+        EventBridge event
+    """
+    return {
+        "source": "aws.s3",
+        "detail-type": "Object Created",
+        "detail": {"bucket": {"name": bucket_name}, "object": {"key": key}, "metadata": metadata or {}},
+    }
+
+
+def _parse_overrides(values: list[str], cast: Callable[[str], Any]) -> dict[str, Any]:
+    overrides = {}
+    for value in values:
+        name, _, setting = value.partition("=")
+        overrides[name] = cast(setting)
+    return overrides
+
+
+def main() -> None:
+    from stitch_worker.processes_loader import PROCESSES_YAML_PATH, load_all_processes
+
+    parser = argparse.ArgumentParser(description="Simulate the processing pipeline defined in processes.yaml")
+    parser.add_argument("--documents", type=int, default=100, help="Number of uploaded documents")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between uploads")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--latency", action="append", default=[], help="Median latency of a process, e.g. block-summarization=45"
+    )
+    parser.add_argument(
+        "--concurrency", action="append", default=[], help="Concurrency of a process, e.g. block-insertion=5"
+    )
+    parser.add_argument(
+        "--batch-size", action="append", default=[], help="Batch size of a process, e.g. block-insertion=10"
+    )
+    parser.add_argument(
+        "--memory-size", action="append", default=[], help="Memory size of a process, e.g. split-file=4096"
+    )
+    parser.add_argument("--metadata", action="append", default=[], help="Document metadata, e.g. feature_types_count=2")
+    parser.add_argument("--yaml-path", default=PROCESSES_YAML_PATH, help="Path to the processes YAML file")
+    args = parser.parse_args()
+
+    processes = load_all_processes(args.yaml_path)
+
+    latencies = _parse_overrides(args.latency, float)
+    concurrency = _parse_overrides(args.concurrency, int)
+    batch_sizes = _parse_overrides(args.batch_size, int)
+    memory_sizes = _parse_overrides(args.memory_size, int)
+    options = {
+        process.name: StageOptions(
+            latency=lognormal_latency(latencies.get(process.name, 5.0)),
+            concurrency=concurrency.get(process.name),
+            batch_size=batch_sizes.get(process.name),
+            memory_size=memory_sizes.get(process.name),
+        )
+        for process in processes
+    }
+    metadata = _parse_overrides(args.metadata, lambda value: int(value) if value.isdigit() else value)
+
+    uploads = [
+        (index * args.interval, s3_upload_event("bucket", f"document-{index}.pdf", metadata))
+        for index in range(args.documents)
+    ]
+    report = PipelineSimulator(processes, options, seed=args.seed).run(uploads)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+import json
+import shlex
+
 from aws_cdk import (
+    Annotations,
+    ArnFormat,
+    RemovalPolicy,
     Stack,
+    TimeZone,
     aws_lambda,
     aws_sqs,
     aws_lambda_event_sources,
@@ -9,16 +16,107 @@ from aws_cdk import (
     aws_ecr,
     aws_sns_subscriptions,
     Duration,
+    IgnoreMode,
     Tags,
     aws_sns,
     aws_secretsmanager,
     aws_s3,
     aws_ec2,
     aws_logs,
+    aws_applicationautoscaling,
+    aws_dynamodb,
+    aws_stepfunctions,
+    aws_ssm,
+    aws_rds,
 )
 from constructs import Construct
 
+from stitch_worker import IngestionRoute, backfill, ingestion
+from stitch_worker.process_definition import S3_EVENT_SOURCE, ProcessDefinition
+from stitch_worker.hub_propagation import HUB_CONSUMER_TAG
+from stitch_worker.process_graph import ProcessGraph
 from stitch_worker.processes_loader import load_processes_config
+from stitch_worker.runtime import checkpoints, hub_endpoint, llm_cache, sharding
+from stitch_worker.runtime.embedding_cache import EMBEDDING_CACHE_TABLE_ENV, EMBEDDING_CACHE_TTL_ENV
+from stitch_worker.runtime.priority import HIGH_PRIORITY, HIGH_PRIORITY_QUEUE_SUFFIX
+from stitch_worker.runtime.rate_limiter import MODEL_QUOTAS_ENV, RATE_LIMIT_TABLE_ENV
+
+# Environment variables of processes that call APIs covered by the shared rate limiter
+RATE_LIMITED_API_KEYS = ("OPENAI_API_KEY", "PINECONE_API_KEY")
+
+# Paging through the analysis of a 1,000 page document takes minutes
+TEXT_EXTRACTION_NOTIFICATION_TIMEOUT_SECONDS = 900
+
+# Port the hub instance publishes its Postgres database on
+HUB_DATABASE_PORT = 5445
+
+# pgbouncer image run on the hub instance, pinned so that a restart does not pull another release;
+# max_prepared_statements needs pgbouncer 1.21 or later
+PGBOUNCER_IMAGE = "edoburu/pgbouncer:v1.23.1-p2"
+
+# Environment variable telling the processes with database settings which pooler DATABASE_HOST points at
+DATABASE_POOLER_ENV = "DATABASE_POOLER"
+
+# Environment variables of the functions that call the hub, which read its current address from the hub endpoint
+# parameter
+HUB_ENVIRONMENT_KEYS = {"HUB_URL", "DATABASE_HOST"}
+
+
+def handler_asset_exclude(handler: str, modules: list[str]) -> list[str]:
+    """
+    Build the exclude patterns of a handler asset of src/stitch_worker.
+
+    Args:
+        handler: Directory of the handler under handlers/
+        modules: Modules of src/stitch_worker the handler imports, e.g. runtime/hub_endpoint.py, bundled next to the
+            handlers directory with the __init__.py of their package
+
+    Returns:
+        Git ignore patterns that leave out every other file
+    """
+    # GitIgnoreStrategy matches directories without a trailing slash, so directory patterns must not end with one
+    patterns = ["/*"]
+    # Packages come first, so that their exclusion of the other files does not undo the modules of another package
+    for package in dict.fromkeys(module.rpartition("/")[0] for module in modules):
+        if package:
+            patterns += [f"!/{package}", f"/{package}/*", f"!/{package}/__init__.py"]
+    patterns += [f"!/{module}" for module in modules]
+    return [*patterns, "!/handlers", "/handlers/*", f"!/handlers/{handler}", "__pycache__"]
+
+
+def check_database_pooler(settings: dict) -> None:
+    """
+    Check that the settings of the database connection pooler are complete.
+
+    Args:
+        settings: Stack settings
+
+    Raises:
+        ValueError: If the pooler cannot be created with the settings
+    """
+    pooler = settings["database_pooler"]
+    if pooler == "pgbouncer":
+        if not settings["create_hub_instance"]:
+            raise ValueError("database_pooler 'pgbouncer' runs on the hub instance and requires create_hub_instance")
+        if not settings.get("database_user"):
+            raise ValueError("database_pooler 'pgbouncer' requires database_user")
+    elif pooler == "rds_proxy":
+        missing = [
+            name
+            for name in ("rds_proxy_vpc_id", "rds_proxy_secret_name", "rds_proxy_database_security_group_id")
+            if not settings.get(name)
+        ]
+        if not settings.get("rds_proxy_db_cluster_identifier"):
+            if not settings.get("rds_proxy_db_instance_identifier"):
+                missing.append("rds_proxy_db_instance_identifier or rds_proxy_db_cluster_identifier")
+            if not settings.get("database_host"):
+                missing.append("database_host")
+        if missing:
+            raise ValueError(f"database_pooler 'rds_proxy' requires {', '.join(missing)}")
+
+
+# The join handler only needs the handler and the matcher
+JOIN_HANDLER_ASSET_EXCLUDE = handler_asset_exclude("join", ["event_patterns.py"])
 
 
 class StitchWorkerStack(Stack):
@@ -29,11 +127,11 @@ class StitchWorkerStack(Stack):
         tags = self.node.try_get_context("tags")
         naming = self.node.try_get_context("naming")
         settings = self.node.try_get_context("settings")
-        self.env = self.node.try_get_context("env") or "dev"
+        self.env_name = self.node.try_get_context("env") or "dev"
         self.prefix = naming["prefix"]
-        self.suffix = self.env
+        self.suffix = self.env_name
 
-        tags.update({"Environment": self.env})
+        tags.update({"Environment": self.env_name})
         # Apply tags to all resources in the stack
         for key, value in tags.items():
             Tags.of(self).add(key, value)
@@ -71,12 +169,29 @@ class StitchWorkerStack(Stack):
             targets=[aws_events_targets.CloudWatchLogGroup(log_group=log_group)],
         )
 
-        if settings["create_hub_instance"]:
-            ec2_instance = self.create_hub_instance()
-            ec2_host = ec2_instance.instance_public_dns_name
-            self.create_ec2_state_change_handler(ec2_instance)
-        else:
-            ec2_host = "localhost"
+        check_database_pooler(settings)
+        ec2_instance = self.create_hub_instance(settings) if settings["create_hub_instance"] else None
+        ec2_host = ec2_instance.instance_public_dns_name if ec2_instance else "localhost"
+        hub_url = settings.get("hub_url") or f"http://{ec2_host}:5050/hub/api/v1"
+
+        # The processes connect to the pooler instead of the database when one is configured
+        self.database_proxy = None
+        pooler_host, pooler_port = self.create_database_pooler(settings, ec2_host)
+        database_host = pooler_host or settings.get("database_host") or ec2_host
+        database_on_hub = settings["database_pooler"] == "pgbouncer" or (
+            settings["database_pooler"] == "disabled" and not settings.get("database_host")
+        )
+
+        # The hub endpoint starts at its deploy-time address and is updated by the EC2 state change handler
+        self.hub_endpoint_parameter = aws_ssm.StringParameter(
+            self,
+            "HubEndpointParameter",
+            parameter_name=hub_endpoint.hub_endpoint_parameter_name(self.prefix, self.suffix),
+            string_value=hub_endpoint.HubEndpoint(hub_url, database_host).to_json(),
+            description="Current address of the hub, read by the functions through their hub endpoint cache",
+        )
+        if ec2_instance:
+            self.create_ec2_state_change_handler(ec2_instance, None if database_on_hub else database_host)
 
         default_environment = {
             "DEBUG_MODE": "True",
@@ -86,11 +201,13 @@ class StitchWorkerStack(Stack):
             "EVENT_BUS_NAME": self.bus.event_bus_name,
             "LOGGER_NAME": "stitch_worker",
             "LOG_LEVEL": "DEBUG",
-            "HUB_URL": settings.get("hub_url") or f"http://{ec2_host}:5050/hub/api/v1",
+            "HUB_URL": hub_url,
+            hub_endpoint.HUB_ENDPOINT_PARAMETER_ENV: self.hub_endpoint_parameter.parameter_name,
+            hub_endpoint.HUB_ENDPOINT_TTL_ENV: str(settings["hub_endpoint_ttl_seconds"]),
             "SYSTEM_ADMIN_API_KEY": settings.get("system_admin_api_key"),
         }
 
-        if self.env == "local":
+        if self.env_name == "local":
             openai_api_key = settings["openai_api_key"]
             pinecone_api_key = settings["pinecone_api_key"]
             pinecone_index_name = settings["pinecone_index_name"]
@@ -104,7 +221,7 @@ class StitchWorkerStack(Stack):
             secret_manager = aws_secretsmanager.Secret.from_secret_name_v2(
                 self,
                 "WorkerSecret",
-                secret_name=f"ayp/{self.env}/worker",
+                secret_name=f"ayp/{self.env_name}/worker",
             )
             openai_api_key = secret_manager.secret_value_from_json("OPENAI_API_KEY").to_string()
             pinecone_api_key = secret_manager.secret_value_from_json("PINECONE_API_KEY").to_string()
@@ -124,7 +241,10 @@ class StitchWorkerStack(Stack):
 
         if settings["lambda_document_extraction"]:
             document_extraction_topic, document_extraction_queue, document_extraction_role = (
-                self.create_document_extraction_notification_lambda(default_environment=default_environment)
+                self.create_document_extraction_notification_lambda(
+                    default_environment=default_environment,
+                    handler=settings["text_extraction_notification_handler"],
+                )
             )
 
         # Load processes configuration from YAML
@@ -138,52 +258,229 @@ class StitchWorkerStack(Stack):
             pinecone_index_name=pinecone_index_name,
             ec2_host=ec2_host,
             database_password=database_password,
+            database_host=pooler_host,
+            database_port=pooler_port,
         )
 
+        # Compile the pipeline graph to catch routing mistakes at synth time
+        process_graph = ProcessGraph([process for process in processes if process.enabled])
+        process_graph.validate()
+        for name in process_graph.orphan_stages:
+            Annotations.of(self).add_warning(f"Process '{name}' is not triggered by any enabled process or S3 event")
+
+        # Uploads that start the pipeline, checked against the prefixes the pipeline writes to
+        ingestion_routes = {
+            name: IngestionRoute.model_validate(route) for name, route in settings["ingestion_routes"].items()
+        }
+        output_prefixes = {
+            prefix: f"process '{process.name}'"
+            for process in processes
+            if process.enabled
+            for prefix in process.output_prefixes
+        }
+        if settings["backfill_enabled"]:
+            output_prefixes[f"{backfill.RESULTS_PREFIX}/"] = "the backfill state machine"
+        ingestion.check_routes(ingestion_routes, output_prefixes)
+        upload_processes = [process for process in processes if process.enabled and process.is_upload_triggered()]
+        routed_pipelines = {route.pipeline for route in ingestion_routes.values()}
+        for name, route in ingestion_routes.items():
+            if not any(route.pipeline in process.pipelines for process in upload_processes):
+                Annotations.of(self).add_warning(
+                    f"Ingestion route '{name}' targets pipeline '{route.pipeline}', which no enabled process handles"
+                )
+        for process in upload_processes:
+            if routed_pipelines.isdisjoint(process.pipelines):
+                Annotations.of(self).add_warning(f"Process '{process.name}' is not targeted by any ingestion route")
+
+        # Shared token buckets for the OpenAI and Pinecone quotas of all processes
+        rate_limit_table = self.create_rate_limit_table() if settings["rate_limiter_enabled"] else None
+
+        # Content-addressed cache of chat completions for the processes with llm_cache enabled
+        llm_cache_environment = self.create_llm_cache(settings)
+
+        # Packed float32 embeddings by model and normalized text for the processes with embedding_cache enabled
+        embedding_cache_table = self.create_embedding_cache_table() if settings["embedding_cache_enabled"] else None
+
+        # Ledger of the stages completed per document input, shared by all processes
+        checkpoint_table = self.create_checkpoint_table() if settings["checkpoint_ledger_enabled"] else None
+
+        # Events received per document by the join stages
+        join_table = (
+            self.create_join_table() if any(process.enabled and process.join for process in processes) else None
+        )
+
+        # Event sources whose maximum concurrency is adjusted by the concurrency controller
+        scaling_targets = []
+
+        # Queues of the processes triggered by S3 uploads, which the backfill state machine sends objects to
+        upload_queues = []
+
         # Create SQS queues and Lambda functions for each process
         for process in processes:
-            if not process["enabled"]:
+            if not process.enabled:
                 continue
 
-            # Create SQS queue
-            queue = aws_sqs.Queue(
+            # Create SQS queue with a dead-letter queue for messages that keep failing
+            dead_letter_queue = aws_sqs.Queue(
                 self,
-                f"{process['id_prefix']}Queue",
-                queue_name=f"{self.prefix}-{self.suffix}-{process['name']}",
-                visibility_timeout=Duration.seconds(amount=process.get("timeout", 300)),
+                f"{process.id_prefix}DeadLetterQueue",
+                queue_name=f"{self.prefix}-{self.suffix}-{process.name}-dlq",
                 retention_period=Duration.days(14),
             )
+            queue = aws_sqs.Queue(
+                self,
+                f"{process.id_prefix}Queue",
+                queue_name=f"{self.prefix}-{self.suffix}-{process.name}",
+                visibility_timeout=Duration.seconds(amount=process.timeout),
+                retention_period=Duration.days(process.retry.retention_period_days),
+                dead_letter_queue=aws_sqs.DeadLetterQueue(
+                    max_receive_count=process.retry.max_receive_count, queue=dead_letter_queue
+                ),
+            )
+
+            # The process queue is the low priority lane; the high priority lane gets its own queue
+            lanes = process.priority_lanes if process.priority_lanes and process.priority_lanes.enabled else None
+            if lanes:
+                high_priority_queue = aws_sqs.Queue(
+                    self,
+                    f"{process.id_prefix}HighPriorityQueue",
+                    queue_name=f"{self.prefix}-{self.suffix}-{process.name}{HIGH_PRIORITY_QUEUE_SUFFIX}",
+                    visibility_timeout=Duration.seconds(amount=process.timeout),
+                    retention_period=Duration.days(process.retry.retention_period_days),
+                    dead_letter_queue=aws_sqs.DeadLetterQueue(
+                        max_receive_count=process.retry.max_receive_count, queue=dead_letter_queue
+                    ),
+                )
+
+            # Publish versions only for processes that use an alias
+            concurrency = process.concurrency if process.concurrency.enabled else None
+            reserved_concurrency = concurrency.reserved if concurrency else None
+            version_options = (
+                aws_lambda.VersionOptions(
+                    removal_policy=RemovalPolicy.RETAIN if concurrency.retain_versions else RemovalPolicy.DESTROY
+                )
+                if concurrency and concurrency.alias
+                else None
+            )
+
+            environment = default_environment | process.environment.root
+            uses_rate_limiter = rate_limit_table is not None and any(
+                key in environment for key in RATE_LIMITED_API_KEYS
+            )
+            if uses_rate_limiter:
+                environment |= {
+                    RATE_LIMIT_TABLE_ENV: rate_limit_table.table_name,
+                    MODEL_QUOTAS_ENV: json.dumps(settings["model_quotas"], separators=(",", ":")),
+                }
+            if process.llm_cache and llm_cache_environment:
+                environment |= llm_cache_environment
+            if process.embedding_cache and embedding_cache_table:
+                environment[EMBEDDING_CACHE_TABLE_ENV] = embedding_cache_table.table_name
+                environment[EMBEDDING_CACHE_TTL_ENV] = str(settings["embedding_cache_ttl_days"] * 24 * 3600)
+            if checkpoint_table:
+                environment |= {
+                    checkpoints.CHECKPOINT_TABLE_ENV: checkpoint_table.table_name,
+                    checkpoints.CHECKPOINT_RETENTION_ENV: str(settings["checkpoint_retention_days"]),
+                    checkpoints.CHECKPOINT_LEASE_ENV: str(process.timeout),
+                }
+            if process.sharding and process.sharding.enabled and process.sharding.pages_per_shard:
+                environment |= {
+                    sharding.SHARD_PAGES_PER_SHARD_ENV: str(process.sharding.pages_per_shard),
+                    sharding.SHARD_MAX_SHARDS_ENV: str(process.sharding.max_shards),
+                    sharding.SHARD_EVENT_DETAIL_TYPE_ENV: process.emits[0],
+                }
+            # Processes with database settings connect through the pooler; behind RDS Proxy they run in its VPC
+            uses_database = "DATABASE_HOST" in environment and not process.join
+            if uses_database and settings["database_pooler"] != "disabled":
+                environment[DATABASE_POOLER_ENV] = settings["database_pooler"]
+            database_network = (
+                {
+                    "vpc": self.database_proxy_vpc,
+                    "vpc_subnets": aws_ec2.SubnetSelection(subnet_type=aws_ec2.SubnetType.PRIVATE_WITH_EGRESS),
+                    "security_groups": [self.database_client_security_group],
+                }
+                if uses_database and self.database_proxy
+                else {}
+            )
+            if process.join:
+                environment = {
+                    "EVENT_BUS_NAME": self.bus.event_bus_name,
+                    "JOIN_TABLE_NAME": join_table.table_name,
+                    "JOIN_NAME": process.name,
+                    "JOIN_EMITS": process.join.emits,
+                }
+            event_pattern = process.event_pattern
+            if process.join and process.join.waits_for:
+                # The join also receives the trigger events of conditional branches to count skipped branches
+                waits_for, branches = process_graph.resolve_join(process.name)
+                environment |= {
+                    "JOIN_WAITS_FOR": json.dumps(waits_for),
+                    "JOIN_BRANCHES": json.dumps(branches, separators=(",", ":")),
+                }
+                event_pattern = process_graph.join_event_pattern(process.name)
 
             # Create Lambda function
-            if self.env == "local":
+            if process.join:
+                # Join stages run the built-in handler, which only needs boto3 and the event pattern matcher
                 lambda_fn = aws_lambda.Function(
                     self,
-                    f"{process['id_prefix']}Lambda",
-                    function_name=f"{self.prefix}-{self.suffix}-{process['name']}",
+                    f"{process.id_prefix}Lambda",
+                    function_name=f"{self.prefix}-{self.suffix}-{process.name}",
                     runtime=aws_lambda.Runtime.PYTHON_3_13,
-                    handler=f"worker.handlers.{process['module']}.index.handler",
+                    handler="handlers.join.index.handler",
+                    code=aws_lambda.Code.from_asset(
+                        path="src/stitch_worker",
+                        ignore_mode=IgnoreMode.GIT,
+                        exclude=JOIN_HANDLER_ASSET_EXCLUDE,
+                    ),
+                    timeout=Duration.seconds(amount=process.timeout),
+                    environment=environment,
+                    memory_size=process.memory_size,
+                    logging_format=aws_lambda.LoggingFormat.JSON,
+                    reserved_concurrent_executions=reserved_concurrency,
+                    current_version_options=version_options,
+                )
+                join_table.grant_read_write_data(lambda_fn)
+            elif self.env_name == "local":
+                lambda_fn = aws_lambda.Function(
+                    self,
+                    f"{process.id_prefix}Lambda",
+                    function_name=f"{self.prefix}-{self.suffix}-{process.name}",
+                    runtime=aws_lambda.Runtime.PYTHON_3_13,
+                    handler=f"worker.handlers.{process.module}.index.handler",
                     code=aws_lambda.Code.from_asset("/Users/jason/Downloads/worker_deployment_package.zip"),
                     timeout=Duration.seconds(300),
-                    environment=default_environment | process.get("environment", {}),
-                    memory_size=process.get("memory_size", 128),
+                    environment=environment,
+                    memory_size=process.memory_size,
                     logging_format=aws_lambda.LoggingFormat.JSON,
+                    reserved_concurrent_executions=reserved_concurrency,
+                    current_version_options=version_options,
+                    **database_network,
                 )
             else:
                 lambda_fn = aws_lambda.DockerImageFunction(
                     self,
-                    f"{process['id_prefix']}Lambda",
-                    function_name=f"{self.prefix}-{self.suffix}-{process['name']}",
+                    f"{process.id_prefix}Lambda",
+                    function_name=f"{self.prefix}-{self.suffix}-{process.name}",
                     code=aws_lambda.DockerImageCode.from_ecr(
                         repository=self.repository,
                         tag_or_digest=self.image_tag,
-                        cmd=[f"worker.handlers.{process['module']}.index.handler"],
+                        cmd=[f"worker.handlers.{process.module}.index.handler"],
                     ),
                     logging_format=aws_lambda.LoggingFormat.JSON,
-                    timeout=Duration.seconds(amount=process.get("timeout", 300)),
-                    environment=default_environment | process.get("environment", {}),
-                    memory_size=process.get("memory_size", 128),
+                    timeout=Duration.seconds(amount=process.timeout),
+                    environment=environment,
+                    memory_size=process.memory_size,
+                    reserved_concurrent_executions=reserved_concurrency,
+                    current_version_options=version_options,
+                    **database_network,
                 )
 
+            # Let the function read the current hub address, and update_lambda_env.py --rewrite-environment find it
+            if HUB_ENVIRONMENT_KEYS & environment.keys():
+                self.hub_endpoint_parameter.grant_read(lambda_fn)
+                Tags.of(lambda_fn).add(HUB_CONSUMER_TAG, f"{self.prefix}-{self.suffix}")
+
             # Add EventBridge permissions to Lambda
             lambda_fn.add_to_role_policy(
                 aws_iam.PolicyStatement(
@@ -191,44 +488,199 @@ class StitchWorkerStack(Stack):
                 )
             )
 
-            if policies := process.get("additional_policies"):
-                for policy in policies:
-                    lambda_fn.add_to_role_policy(policy)
+            for policy in process.policy_statements():
+                lambda_fn.add_to_role_policy(policy)
+
+            if uses_rate_limiter:
+                rate_limit_table.grant_read_write_data(lambda_fn)
+
+            if process.llm_cache and isinstance(self.llm_cache_store, aws_dynamodb.Table):
+                self.llm_cache_store.grant_read_write_data(lambda_fn)
+            elif process.llm_cache and isinstance(self.llm_cache_store, aws_s3.Bucket):
+                self.llm_cache_store.grant_read_write(lambda_fn, objects_key_pattern="llm-cache/*")
+
+            if process.embedding_cache and embedding_cache_table:
+                embedding_cache_table.grant_read_write_data(lambda_fn)
+
+            if checkpoint_table and not process.join:
+                checkpoint_table.grant_read_write_data(lambda_fn)
+
+            # Route messages through the alias so they are served by its provisioned concurrency
+            if concurrency and concurrency.alias:
+                lambda_target = self.create_process_alias(process, lambda_fn, queue)
+            else:
+                lambda_target = lambda_fn
 
             # Add SQS event source to Lambda
-            lambda_fn.add_event_source(aws_lambda_event_sources.SqsEventSource(queue, batch_size=1))
+            scaling = process.scaling
+            max_batching_window = Duration.seconds(scaling.max_batching_window) if scaling.max_batching_window else None
+            event_source = aws_lambda_event_sources.SqsEventSource(
+                queue,
+                batch_size=scaling.batch_size,
+                max_batching_window=max_batching_window,
+                max_concurrency=lanes.low_max_concurrency if lanes else scaling.max_concurrency,
+                report_batch_item_failures=scaling.report_batch_item_failures,
+            )
+            lambda_target.add_event_source(event_source)
+
+            if lanes:
+                lambda_target.add_event_source(
+                    aws_lambda_event_sources.SqsEventSource(
+                        high_priority_queue,
+                        batch_size=scaling.batch_size,
+                        max_batching_window=max_batching_window,
+                        max_concurrency=lanes.high_max_concurrency,
+                        report_batch_item_failures=scaling.report_batch_item_failures,
+                    )
+                )
 
-            # Create EventBridge rule
-            if process["event_pattern"]:
+            if scaling.control:
+                scaling_targets.append(
+                    {
+                        "process": process.name,
+                        "queue_url": queue.queue_url,
+                        "queue_name": queue.queue_name,
+                        "queue_arn": queue.queue_arn,
+                        "event_source_mapping_id": event_source.event_source_mapping_id,
+                        **scaling.control.model_dump(),
+                    }
+                )
+
+            # Create EventBridge rules: one per ingestion route of the pipelines of upload-triggered processes,
+            # otherwise one per priority lane
+            if process.is_upload_triggered():
+                for route_name, route in ingestion_routes.items():
+                    if route.pipeline not in process.pipelines:
+                        continue
+                    route_pattern = process.event_pattern.model_copy(
+                        update={"detail": ingestion.route_detail(route, process.event_pattern.detail)}
+                    )
+                    route_queue = high_priority_queue if lanes and route.priority == HIGH_PRIORITY else queue
+                    aws_events.Rule(
+                        self,
+                        id=f"Stitch{process.id_prefix}{route_name}EventRule",
+                        enabled=True,
+                        event_bus=self.bus,
+                        rule_name=f"{self.prefix}-{self.suffix}-{process.name}-{route_name}",
+                        event_pattern=aws_events.EventPattern(**route_pattern.to_event_pattern_kwargs()),
+                        targets=[aws_events_targets.SqsQueue(route_queue)],
+                    )
+                upload_queues.append(queue)
+            elif lanes:
+                high_priority_pattern, low_priority_pattern = process.lane_event_patterns()
+                aws_events.Rule(
+                    self,
+                    id=f"Stitch{process.id_prefix}HighPriorityEventRule",
+                    enabled=True,
+                    event_bus=self.bus,
+                    rule_name=f"{self.prefix}-{self.suffix}-{process.name}{HIGH_PRIORITY_QUEUE_SUFFIX}",
+                    event_pattern=aws_events.EventPattern(**high_priority_pattern.to_event_pattern_kwargs()),
+                    targets=[aws_events_targets.SqsQueue(high_priority_queue)],
+                )
+                aws_events.Rule(
+                    self,
+                    id=f"Stitch{process.id_prefix}EventRule",
+                    enabled=True,
+                    event_bus=self.bus,
+                    rule_name=f"{self.prefix}-{self.suffix}-{process.name}",
+                    event_pattern=aws_events.EventPattern(**low_priority_pattern.to_event_pattern_kwargs()),
+                    targets=[aws_events_targets.SqsQueue(queue)],
+                )
+            elif event_pattern:
                 aws_events.Rule(
                     self,
-                    id=f"Stitch{process['id_prefix']}EventRule",
+                    id=f"Stitch{process.id_prefix}EventRule",
                     enabled=True,
                     event_bus=self.bus,
-                    rule_name=f"{self.prefix}-{self.suffix}-{process['name']}",
-                    event_pattern=aws_events.EventPattern(**process["event_pattern"]),
+                    rule_name=f"{self.prefix}-{self.suffix}-{process.name}",
+                    event_pattern=aws_events.EventPattern(**event_pattern.to_event_pattern_kwargs()),
                     targets=[aws_events_targets.SqsQueue(queue)],
                 )
 
-        # Create EventBridge rule for S3 Object Created on default event bus
+        if scaling_targets:
+            self.create_concurrency_controller(scaling_targets)
+
+        if settings["backfill_enabled"] and upload_queues:
+            self.create_backfill_state_machine(upload_queues, settings)
+
+        # Forward the uploads of the ingestion routes from the default event bus; process rules filter on size
+        upload_detail = {"bucket": {"name": [self.s3_bucket.bucket_name]}}
+        upload_key_conditions = ingestion.upload_key_conditions(ingestion_routes)
+        if upload_key_conditions is not None:
+            upload_detail["object"] = {"key": upload_key_conditions}
         aws_events.Rule(
             self,
             "StitchDocumentUploadEventRule",
             enabled=True,
             rule_name=f"{self.prefix}-{self.suffix}-document-upload",
             event_pattern=aws_events.EventPattern(
-                source=["aws.s3"],
+                source=[S3_EVENT_SOURCE],
                 detail_type=["Object Created"],
-                detail={
-                    "bucket": {"name": [self.s3_bucket.bucket_name]},
-                    "object": {"key": [{"wildcard": "jdtest/*.pdf"}]},
-                },
+                detail=upload_detail,
             ),
             targets=[aws_events_targets.EventBus(self.bus)],
         )
 
+    def create_process_alias(
+        self, process: ProcessDefinition, lambda_fn: aws_lambda.Function, queue: aws_sqs.Queue
+    ) -> aws_lambda.Alias:
+        concurrency = process.concurrency
+
+        # The alias points to the version published for the current function configuration
+        alias = aws_lambda.Alias(
+            self,
+            f"{process.id_prefix}Alias",
+            alias_name=concurrency.alias,
+            version=lambda_fn.current_version,
+            provisioned_concurrent_executions=concurrency.initial_provisioned,
+        )
+
+        autoscaling = concurrency.autoscaling
+        if autoscaling is None:
+            return alias
+
+        scalable_target = aws_applicationautoscaling.ScalableTarget(
+            self,
+            f"{process.id_prefix}ProvisionedConcurrencyTarget",
+            service_namespace=aws_applicationautoscaling.ServiceNamespace.LAMBDA,
+            scalable_dimension="lambda:function:ProvisionedConcurrency",
+            resource_id=f"function:{lambda_fn.function_name}:{alias.alias_name}",
+            min_capacity=autoscaling.min_capacity,
+            max_capacity=autoscaling.max_capacity,
+        )
+        scalable_target.node.add_dependency(alias)
+
+        if autoscaling.target_utilization is not None:
+            scalable_target.scale_to_track_metric(
+                "UtilizationTracking",
+                target_value=autoscaling.target_utilization,
+                predefined_metric=aws_applicationautoscaling.PredefinedMetric.LAMBDA_PROVISIONED_CONCURRENCY_UTILIZATION,
+            )
+
+        for schedule in autoscaling.schedules:
+            scalable_target.scale_on_schedule(
+                schedule.name,
+                schedule=aws_applicationautoscaling.Schedule.expression(f"cron({schedule.cron})"),
+                min_capacity=schedule.min_capacity,
+                max_capacity=schedule.max_capacity,
+                time_zone=TimeZone.of(autoscaling.time_zone) if autoscaling.time_zone else None,
+            )
+
+        if autoscaling.queue_depth_steps:
+            scalable_target.scale_on_metric(
+                "QueueDepthScaling",
+                metric=queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(1)),
+                scaling_steps=[
+                    aws_applicationautoscaling.ScalingInterval(lower=step.lower, upper=step.upper, change=step.change)
+                    for step in autoscaling.queue_depth_steps
+                ],
+                adjustment_type=aws_applicationautoscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            )
+
+        return alias
+
     def create_document_extraction_notification_lambda(
-        self, default_environment: dict
+        self, default_environment: dict, handler: str = "image"
     ) -> tuple[aws_sns.Topic, aws_sqs.Queue, aws_iam.Role]:
         # Create SNS Topic
         topic = aws_sns.Topic(
@@ -236,20 +688,61 @@ class StitchWorkerStack(Stack):
         )
 
         # Create SQS Queue for SNS Topic
+        dead_letter_queue = aws_sqs.Queue(
+            self,
+            "TextExtractionNotificationDeadLetterQueue",
+            queue_name=f"{self.prefix}-{self.suffix}-text-extraction-notification-dlq",
+            retention_period=Duration.days(14),
+        )
         queue = aws_sqs.Queue(
             self,
             "TextExtractionNotificationQueue",
             queue_name=f"{self.prefix}-{self.suffix}-text-extraction-notification",
-            visibility_timeout=Duration.seconds(300),
+            visibility_timeout=Duration.seconds(
+                TEXT_EXTRACTION_NOTIFICATION_TIMEOUT_SECONDS if handler == "repo" else 300
+            ),
             retention_period=Duration.days(14),
+            dead_letter_queue=aws_sqs.DeadLetterQueue(max_receive_count=3, queue=dead_letter_queue),
         )
 
         # Add SNS Topic to SQS Queue
         topic.add_subscription(aws_sns_subscriptions.SqsSubscription(queue))
         topic.add_subscription(aws_sns_subscriptions.EmailSubscription(email_address="jason@stitchstudio.ai"))
 
+        environment = default_environment | {
+            "TEXT_EXTRACTION_S3_BUCKET": self.s3_bucket.bucket_name,
+            "TEXT_EXTRACTION_S3_KEY_PREFIX": "textract-output",
+        }
+
         # Add Lambda Function to SQS Queue
-        if self.env == "local":
+        if handler == "repo":
+            # Blocks are streamed to S3 in parts, so memory does not grow with pages
+            lambda_fn = aws_lambda.Function(
+                self,
+                "DocumentExtractionNotificationLambda",
+                function_name=f"{self.prefix}-{self.suffix}-document-extraction-notification",
+                runtime=aws_lambda.Runtime.PYTHON_3_13,
+                handler="handlers.text_extract_notification.index.handler",
+                code=aws_lambda.Code.from_asset(
+                    path="src/stitch_worker",
+                    ignore_mode=IgnoreMode.GIT,
+                    exclude=handler_asset_exclude(
+                        "text_extract_notification",
+                        ["runtime/runs.py", "runtime/sharding.py", "runtime/textract_jobs.py"],
+                    ),
+                ),
+                logging_format=aws_lambda.LoggingFormat.JSON,
+                timeout=Duration.seconds(TEXT_EXTRACTION_NOTIFICATION_TIMEOUT_SECONDS),
+                memory_size=256,
+                environment=environment,
+            )
+            lambda_fn.add_to_role_policy(
+                aws_iam.PolicyStatement(
+                    effect=aws_iam.Effect.ALLOW, actions=["textract:GetDocumentAnalysis"], resources=["*"]
+                )
+            )
+            self.s3_bucket.grant_read_write(lambda_fn, objects_key_pattern="textract-output/*")
+        elif self.env_name == "local":
             lambda_fn = aws_lambda.Function(
                 self,
                 "DocumentExtractionNotificationLambda",
@@ -259,11 +752,7 @@ class StitchWorkerStack(Stack):
                 code=aws_lambda.Code.from_asset("/Users/jason/Downloads/worker_deployment_package.zip"),
                 logging_format=aws_lambda.LoggingFormat.JSON,
                 timeout=Duration.seconds(300),
-                environment=default_environment
-                | {
-                    "TEXT_EXTRACTION_S3_BUCKET": self.s3_bucket.bucket_name,
-                    "TEXT_EXTRACTION_S3_KEY_PREFIX": "textract-output",
-                },
+                environment=environment,
             )
         else:
             lambda_fn = aws_lambda.DockerImageFunction(
@@ -277,12 +766,10 @@ class StitchWorkerStack(Stack):
                 ),
                 logging_format=aws_lambda.LoggingFormat.JSON,
                 timeout=Duration.seconds(300),
-                environment=default_environment
-                | {
-                    "TEXT_EXTRACTION_S3_BUCKET": self.s3_bucket.bucket_name,
-                    "TEXT_EXTRACTION_S3_KEY_PREFIX": "textract-output",
-                },
+                environment=environment,
             )
+        self.hub_endpoint_parameter.grant_read(lambda_fn)
+        Tags.of(lambda_fn).add(HUB_CONSUMER_TAG, f"{self.prefix}-{self.suffix}")
 
         lambda_fn.add_to_role_policy(
             aws_iam.PolicyStatement(
@@ -290,7 +777,12 @@ class StitchWorkerStack(Stack):
             )
         )
 
-        lambda_fn.add_event_source(aws_lambda_event_sources.SqsEventSource(queue))
+        if handler == "repo":
+            lambda_fn.add_event_source(
+                aws_lambda_event_sources.SqsEventSource(queue, batch_size=1, report_batch_item_failures=True)
+            )
+        else:
+            lambda_fn.add_event_source(aws_lambda_event_sources.SqsEventSource(queue))
 
         # Create IAM Role for Textract to publish to SNS Topic
         role = aws_iam.Role(
@@ -306,7 +798,7 @@ class StitchWorkerStack(Stack):
 
         return topic, queue, role
 
-    def create_hub_instance(self) -> aws_ec2.Instance:
+    def create_hub_instance(self, settings: dict) -> aws_ec2.Instance:
         """Create EC2 instance for hub"""
         user_data = aws_ec2.UserData.for_linux()
         user_data.add_commands(
@@ -344,8 +836,10 @@ class StitchWorkerStack(Stack):
             "# git checkout feat/dockerize",
             "# docker build -t hub .",
             "",
-            "echo 'EC2 instance setup completed successfully!'",
         )
+        if settings["database_pooler"] == "pgbouncer":
+            user_data.add_commands(*self.pgbouncer_commands(settings))
+        user_data.add_commands("echo 'EC2 instance setup completed successfully!'")
 
         vpc = aws_ec2.Vpc.from_lookup(self, "AypDevVpc", vpc_id="vpc-006d3d536785de977")
         security_group = aws_ec2.SecurityGroup(self, "StitchHubSecurityGroup", vpc=vpc, allow_all_outbound=True)
@@ -353,8 +847,16 @@ class StitchWorkerStack(Stack):
             peer=aws_ec2.Peer.any_ipv4(), connection=aws_ec2.Port.tcp(port=5050), description="allow access to hub"
         )
         security_group.add_ingress_rule(
-            peer=aws_ec2.Peer.any_ipv4(), connection=aws_ec2.Port.tcp(port=5445), description="allow access to postgres"
+            peer=aws_ec2.Peer.any_ipv4(),
+            connection=aws_ec2.Port.tcp(port=HUB_DATABASE_PORT),
+            description="allow access to postgres",
         )
+        if settings["database_pooler"] == "pgbouncer":
+            security_group.add_ingress_rule(
+                peer=aws_ec2.Peer.any_ipv4(),
+                connection=aws_ec2.Port.tcp(port=settings["pgbouncer_port"]),
+                description="allow access to pgbouncer",
+            )
 
         ec2_instance = aws_ec2.Instance(
             self,
@@ -381,23 +883,377 @@ class StitchWorkerStack(Stack):
             ),
         )
 
+        if settings["database_pooler"] == "pgbouncer":
+            # pgbouncer reads the database password from the worker secret when the instance starts
+            ec2_instance.role.add_to_principal_policy(
+                aws_iam.PolicyStatement(
+                    effect=aws_iam.Effect.ALLOW,
+                    actions=["secretsmanager:GetSecretValue"],
+                    resources=[
+                        self.format_arn(
+                            service="secretsmanager",
+                            resource="secret",
+                            resource_name=f"ayp/{self.env_name}/worker-*",
+                            arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                        )
+                    ],
+                )
+            )
+
         return ec2_instance
 
-    def create_ec2_state_change_handler(self, ec2_instance: aws_ec2.Instance):
-        """Create EventBridge rule and Lambda to update environment variables when EC2 IP changes"""
+    def pgbouncer_commands(self, settings: dict) -> list[str]:
+        """
+        Build the user data commands running pgbouncer in front of the hub database.
+
+        pgbouncer runs in transaction mode, so the connections of all Lambda containers share a pool of
+        pgbouncer_pool_size server connections.
+
+        Args:
+            settings: Stack settings
+
+        Returns:
+            Shell commands
+        """
+        # The user data is readable by anyone who can describe the instance, so the password is read from the secret
+        password_command = (
+            f"DATABASE_PASSWORD=$(aws secretsmanager get-secret-value --region {self.region}"
+            f" --secret-id ayp/{self.env_name}/worker --query SecretString --output text"
+            " | jq -r .DATABASE_PASSWORD)"
+        )
+        port = settings["pgbouncer_port"]
+        return [
+            "# Run pgbouncer in front of the hub database",
+            "echo 'Starting pgbouncer...'",
+            "sudo yum install jq -y",
+            "sudo mkdir -p /etc/pgbouncer",
+            password_command,
+            "cat <<'EOF' | sudo tee /etc/pgbouncer/pgbouncer.ini > /dev/null",
+            "[databases]",
+            f"* = host=host.docker.internal port={HUB_DATABASE_PORT}",
+            "",
+            "[pgbouncer]",
+            "listen_addr = 0.0.0.0",
+            f"listen_port = {port}",
+            "auth_type = scram-sha-256",
+            "auth_file = /etc/pgbouncer/userlist.txt",
+            "pool_mode = transaction",
+            f"default_pool_size = {settings['pgbouncer_pool_size']}",
+            f"max_client_conn = {settings['pgbouncer_max_client_connections']}",
+            "max_prepared_statements = 100",
+            "ignore_startup_parameters = extra_float_digits,options",
+            "EOF",
+            "# userlist.txt escapes double quotes by doubling them",
+            f"""printf '"%s" "%s"\\n' {shlex.quote(settings["database_user"])} \\""",
+            """  "${DATABASE_PASSWORD//\\"/\\"\\"}" | sudo tee /etc/pgbouncer/userlist.txt > /dev/null""",
+            "sudo chown -R 70:70 /etc/pgbouncer",
+            "sudo chmod 600 /etc/pgbouncer/userlist.txt",
+            f"docker run -d --name pgbouncer --restart unless-stopped --add-host=host.docker.internal:host-gateway"
+            f" -p {port}:{port} -v /etc/pgbouncer:/etc/pgbouncer {PGBOUNCER_IMAGE}",
+            "",
+        ]
+
+    def create_database_pooler(self, settings: dict, ec2_host: str) -> tuple[str | None, str | None]:
+        """
+        Create the connection pooler configured by database_pooler.
+
+        Args:
+            settings: Stack settings
+            ec2_host: Public DNS name of the hub instance
+
+        Returns:
+            Host and port the processes connect to, or None to connect to the database directly
+        """
+        if settings["database_pooler"] == "pgbouncer":
+            # pgbouncer itself is started by the user data of the hub instance
+            return ec2_host, str(settings["pgbouncer_port"])
+        if settings["database_pooler"] == "rds_proxy":
+            self.database_proxy = self.create_database_proxy(settings)
+            return self.database_proxy.endpoint, str(settings.get("database_port") or 5432)
+        return None, None
+
+    def create_database_proxy(self, settings: dict) -> aws_rds.DatabaseProxy:
+        """Create the RDS Proxy in front of the managed database and the security group of the Lambdas using it"""
+        vpc = aws_ec2.Vpc.from_lookup(self, "DatabaseVpc", vpc_id=settings["rds_proxy_vpc_id"])
+        port = int(settings.get("database_port") or 5432)
+        database_security_group = aws_ec2.SecurityGroup.from_security_group_id(
+            self, "DatabaseSecurityGroup", settings["rds_proxy_database_security_group_id"]
+        )
+        if settings.get("rds_proxy_db_cluster_identifier"):
+            target = aws_rds.ProxyTarget.from_cluster(
+                aws_rds.DatabaseCluster.from_database_cluster_attributes(
+                    self,
+                    "ProxiedDatabaseCluster",
+                    cluster_identifier=settings["rds_proxy_db_cluster_identifier"],
+                    engine=aws_rds.DatabaseClusterEngine.AURORA_POSTGRESQL,
+                    port=port,
+                    security_groups=[database_security_group],
+                )
+            )
+        else:
+            target = aws_rds.ProxyTarget.from_instance(
+                aws_rds.DatabaseInstance.from_database_instance_attributes(
+                    self,
+                    "ProxiedDatabaseInstance",
+                    instance_identifier=settings["rds_proxy_db_instance_identifier"],
+                    instance_endpoint_address=settings["database_host"],
+                    port=port,
+                    engine=aws_rds.DatabaseInstanceEngine.POSTGRES,
+                    security_groups=[database_security_group],
+                )
+            )
+
+        proxy = aws_rds.DatabaseProxy(
+            self,
+            "DatabaseProxy",
+            db_proxy_name=f"{self.prefix}-{self.suffix}-database-proxy",
+            proxy_target=target,
+            secrets=[
+                aws_secretsmanager.Secret.from_secret_name_v2(
+                    self, "DatabaseProxySecret", secret_name=settings["rds_proxy_secret_name"]
+                )
+            ],
+            vpc=vpc,
+            max_connections_percent=settings["rds_proxy_max_connections_percent"],
+        )
+        database_security_group.add_ingress_rule(
+            peer=proxy.connections.security_groups[0],
+            connection=aws_ec2.Port.tcp(port),
+            description="allow access from the database proxy",
+        )
+
+        self.database_proxy_vpc = vpc
+        self.database_client_security_group = aws_ec2.SecurityGroup(
+            self,
+            "DatabaseClientSecurityGroup",
+            vpc=vpc,
+            allow_all_outbound=True,
+            description="Process Lambdas connecting to the database proxy",
+        )
+        proxy.connections.allow_from(
+            self.database_client_security_group, aws_ec2.Port.tcp(port), "allow access from the process Lambdas"
+        )
+        return proxy
+
+    def create_rate_limit_table(self) -> aws_dynamodb.Table:
+        """Create the DynamoDB table holding one token bucket per rate-limited model"""
+        return aws_dynamodb.Table(
+            self,
+            "RateLimitTable",
+            table_name=f"{self.prefix}-{self.suffix}-rate-limits",
+            partition_key=aws_dynamodb.Attribute(name="bucket", type=aws_dynamodb.AttributeType.STRING),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            # Buckets refill from empty within a minute, so there is nothing worth keeping
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+    def create_llm_cache(self, settings: dict) -> dict[str, str]:
+        """Create the LLM response cache storage and return the environment variables that configure it"""
+        backend = settings["llm_cache_backend"]
+        ttl_days = settings["llm_cache_ttl_days"]
+        environment = {
+            llm_cache.LLM_CACHE_BACKEND_ENV: backend,
+            llm_cache.LLM_CACHE_TTL_ENV: str(ttl_days * 24 * 3600),
+        }
+
+        if backend == "dynamodb":
+            self.llm_cache_store = aws_dynamodb.Table(
+                self,
+                "LLMCacheTable",
+                table_name=f"{self.prefix}-{self.suffix}-llm-cache",
+                partition_key=aws_dynamodb.Attribute(name="key", type=aws_dynamodb.AttributeType.STRING),
+                billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            environment[llm_cache.LLM_CACHE_TABLE_ENV] = self.llm_cache_store.table_name
+        elif backend == "s3":
+            self.llm_cache_store = aws_s3.Bucket(
+                self,
+                "LLMCacheBucket",
+                bucket_name=f"{self.prefix}-{self.suffix}-llm-cache",
+                lifecycle_rules=[aws_s3.LifecycleRule(prefix="llm-cache/", expiration=Duration.days(ttl_days))],
+                removal_policy=RemovalPolicy.DESTROY,
+                auto_delete_objects=True,
+            )
+            environment[llm_cache.LLM_CACHE_BUCKET_ENV] = self.llm_cache_store.bucket_name
+            environment[llm_cache.LLM_CACHE_PREFIX_ENV] = "llm-cache/"
+        else:
+            self.llm_cache_store = None
+            return {}
+
+        return environment
+
+    def create_embedding_cache_table(self) -> aws_dynamodb.Table:
+        """Create the DynamoDB table holding embeddings by model and normalized text hash"""
+        return aws_dynamodb.Table(
+            self,
+            "EmbeddingCacheTable",
+            table_name=f"{self.prefix}-{self.suffix}-embedding-cache",
+            partition_key=aws_dynamodb.Attribute(name="key", type=aws_dynamodb.AttributeType.STRING),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+    def create_checkpoint_table(self) -> aws_dynamodb.Table:
+        """Create the DynamoDB table holding one checkpoint per document, content hash and stage"""
+        return aws_dynamodb.Table(
+            self,
+            "CheckpointTable",
+            table_name=f"{self.prefix}-{self.suffix}-checkpoints",
+            partition_key=aws_dynamodb.Attribute(name="document_id", type=aws_dynamodb.AttributeType.STRING),
+            sort_key=aws_dynamodb.Attribute(name="run", type=aws_dynamodb.AttributeType.STRING),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.RETAIN,
+        )
+
+    def create_join_table(self) -> aws_dynamodb.Table:
+        """Create the DynamoDB table holding the events each join stage has received per document"""
+        return aws_dynamodb.Table(
+            self,
+            "JoinTable",
+            table_name=f"{self.prefix}-{self.suffix}-joins",
+            partition_key=aws_dynamodb.Attribute(name="join_key", type=aws_dynamodb.AttributeType.STRING),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+    def create_backfill_state_machine(
+        self, upload_queues: list[aws_sqs.Queue], settings: dict
+    ) -> aws_stepfunctions.StateMachine:
+        """Create the Step Functions state machine that sends the objects under a bucket prefix to the upload queues"""
+        state_machine_name = f"{self.prefix}-{self.suffix}-backfill"
+        definition = backfill.build_definition(
+            queue_urls=[queue.queue_url for queue in upload_queues],
+            results_bucket=self.s3_bucket.bucket_name,
+            batch_size=settings["backfill_batch_size"],
+            max_concurrency=settings["backfill_max_concurrency"],
+            documents_per_minute=settings["backfill_documents_per_minute"],
+            max_backlog=settings["backfill_max_backlog"],
+        )
+
+        role = aws_iam.Role(
+            self,
+            "BackfillStateMachineRole",
+            assumed_by=aws_iam.ServicePrincipal("states.amazonaws.com"),
+        )
+        self.s3_bucket.grant_read(role)
+        self.s3_bucket.grant_put(role, objects_key_pattern=f"{backfill.RESULTS_PREFIX}/*")
+        for queue in upload_queues:
+            queue.grant_send_messages(role)
+            queue.grant(role, "sqs:GetQueueAttributes")
+
+        # The Distributed Map runs each batch as a child execution of the state machine itself
+        state_machine_arn = self.format_arn(
+            service="states",
+            resource="stateMachine",
+            resource_name=state_machine_name,
+            arn_format=ArnFormat.COLON_RESOURCE_NAME,
+        )
+        execution_arn = self.format_arn(
+            service="states",
+            resource="execution",
+            resource_name=f"{state_machine_name}/*",
+            arn_format=ArnFormat.COLON_RESOURCE_NAME,
+        )
+        role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW, actions=["states:StartExecution"], resources=[state_machine_arn]
+            )
+        )
+        role.add_to_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=["states:DescribeExecution", "states:StopExecution", "states:RedriveExecution"],
+                resources=[execution_arn],
+            )
+        )
+
+        return aws_stepfunctions.StateMachine(
+            self,
+            "BackfillStateMachine",
+            state_machine_name=state_machine_name,
+            definition_body=aws_stepfunctions.DefinitionBody.from_string(self.to_json_string(definition)),
+            role=role,
+        )
+
+    def create_concurrency_controller(self, scaling_targets: list[dict]):
+        """Create a scheduled Lambda that adjusts the SQS event source concurrency of each process to its queue"""
+        controller = aws_lambda.Function(
+            self,
+            "ConcurrencyController",
+            function_name=f"{self.prefix}-{self.suffix}-concurrency-controller",
+            runtime=aws_lambda.Runtime.PYTHON_3_13,
+            handler="index.handler",
+            code=aws_lambda.Code.from_asset(path="src/stitch_worker/handlers/concurrency_controller"),
+            logging_format=aws_lambda.LoggingFormat.JSON,
+            timeout=Duration.seconds(60),
+            environment={
+                "POWERTOOLS_SERVICE_NAME": "concurrency_controller",
+                "POWERTOOLS_LOG_LEVEL": "INFO",
+                "SCALING_TARGETS": self.to_json_string(
+                    [{key: value for key, value in target.items() if key != "queue_arn"} for target in scaling_targets]
+                ),
+            },
+        )
+
+        controller.add_to_role_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=["sqs:GetQueueAttributes"],
+                resources=[target["queue_arn"] for target in scaling_targets],
+            )
+        )
+        controller.add_to_role_policy(
+            aws_iam.PolicyStatement(
+                effect=aws_iam.Effect.ALLOW,
+                actions=["lambda:GetEventSourceMapping", "lambda:UpdateEventSourceMapping"],
+                resources=[
+                    self.format_arn(
+                        service="lambda",
+                        resource="event-source-mapping",
+                        resource_name=target["event_source_mapping_id"],
+                        arn_format=ArnFormat.COLON_RESOURCE_NAME,
+                    )
+                    for target in scaling_targets
+                ],
+            )
+        )
+        controller.add_to_role_policy(
+            aws_iam.PolicyStatement(effect=aws_iam.Effect.ALLOW, actions=["cloudwatch:GetMetricData"], resources=["*"])
+        )
+
+        # Run every minute, the resolution of the SQS metrics
+        aws_events.Rule(
+            self,
+            "ConcurrencyControllerScheduleRule",
+            rule_name=f"{self.prefix}-{self.suffix}-concurrency-controller",
+            schedule=aws_events.Schedule.rate(Duration.minutes(1)),
+            targets=[aws_events_targets.LambdaFunction(controller)],
+        )
+
+    def create_ec2_state_change_handler(self, ec2_instance: aws_ec2.Instance, database_host: str | None = None):
+        """
+        Create EventBridge rule and Lambda to publish the hub endpoint when the EC2 instance changes address.
+
+        Args:
+            ec2_instance: Hub instance
+            database_host: Address of a database that is not on the hub instance, published instead of the hub's
+        """
         # Create Lambda function to handle EC2 state changes
         state_change_handler = aws_lambda.Function(
             self,
             "EC2StateChangeHandler",
             function_name=f"{self.prefix}-{self.suffix}-ec2-state-change-handler",
             runtime=aws_lambda.Runtime.PYTHON_3_13,
-            handler="index.handler",
+            handler="handlers.ec2_state_changer.index.handler",
             code=aws_lambda.Code.from_asset(
-                path="src/stitch_worker/handlers/ec2_state_changer",
-                # bundling=aws_lambda.BundlingOptions(
-                #     image=aws_lambda.Runtime.PYTHON_3_13.bundling_image,
-                #     command=["bash", "-c", "pip install -r requirements.txt && cp -r * /asset-output/"]
-                # )
+                path="src/stitch_worker",
+                ignore_mode=IgnoreMode.GIT,
+                exclude=handler_asset_exclude("ec2_state_changer", ["runtime/hub_endpoint.py"]),
             ),
             logging_format=aws_lambda.LoggingFormat.JSON,
             timeout=Duration.seconds(300),
@@ -407,19 +1263,18 @@ class StitchWorkerStack(Stack):
                 "PREFIX": self.prefix,
                 "SUFFIX": self.suffix,
                 "EC2_INSTANCE_ID": ec2_instance.instance_id,
-            },
+                hub_endpoint.HUB_ENDPOINT_PARAMETER_ENV: self.hub_endpoint_parameter.parameter_name,
+            }
+            | ({"DATABASE_HOST": database_host} if database_host else {}),
         )
+        self.hub_endpoint_parameter.grant_read(state_change_handler)
+        self.hub_endpoint_parameter.grant_write(state_change_handler)
 
         # Grant permissions to the state change handler
         state_change_handler.add_to_role_policy(
             aws_iam.PolicyStatement(
                 effect=aws_iam.Effect.ALLOW,
-                actions=[
-                    "ec2:DescribeInstances",
-                    "lambda:GetFunctionConfiguration",
-                    "lambda:UpdateFunctionConfiguration",
-                    "lambda:ListFunctions",
-                ],
+                actions=["ec2:DescribeInstances"],
                 resources=["*"],
             )
         )
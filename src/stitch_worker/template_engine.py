@@ -0,0 +1,142 @@
+import re
+from typing import Any
+
+# "$$" escapes a literal "$", so "$${name}" renders as "${name}"
+TOKEN_PATTERN = re.compile(r"\$\$|\$\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+class Variable:
+    """Reference to a template variable inside a compiled template"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"Variable({self.name!r})"
+
+
+class Template:
+    """A string compiled once into literal parts and variable references"""
+
+    __slots__ = ("source", "parts")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.parts = _parse(source)
+
+    @property
+    def variables(self) -> frozenset[str]:
+        return frozenset(part.name for part in self.parts if isinstance(part, Variable))
+
+    def render(self, variables: dict[str, Any], undefined: list[str] | None = None) -> Any:
+        """
+        Render the template in a single pass. Substituted values are never scanned again.
+
+        Args:
+            variables: Dictionary of variable names and their values
+            undefined: List that collects the names of undefined variables. When omitted, undefined variables
+                are left in the output unchanged.
+
+        Returns:
+            The raw value when the template is exactly one variable, otherwise the rendered string
+        """
+        # A string that is exactly one variable keeps the type of its value (e.g. booleans for enable flags)
+        if len(self.parts) == 1 and isinstance(self.parts[0], Variable):
+            name = self.parts[0].name
+            if name in variables:
+                return variables[name]
+            if undefined is not None:
+                undefined.append(name)
+            return self.source
+
+        rendered = []
+        for part in self.parts:
+            if not isinstance(part, Variable):
+                rendered.append(part)
+            elif part.name in variables:
+                rendered.append(str(variables[part.name]))
+            else:
+                if undefined is not None:
+                    undefined.append(part.name)
+                rendered.append(f"${{{part.name}}}")
+        return "".join(rendered)
+
+
+def _parse(source: str) -> tuple[str | Variable, ...]:
+    """
+    Split a string into literal parts and variable references.
+
+    Args:
+        source: Template string
+
+    Returns:
+        Tuple of literal strings and Variables
+    """
+    parts: list[str | Variable] = []
+    literal = []
+    position = 0
+    for match in TOKEN_PATTERN.finditer(source):
+        literal.append(source[position : match.start()])
+        if match.group(1) is None:
+            literal.append("$")
+        else:
+            if text := "".join(literal):
+                parts.append(text)
+            literal = []
+            parts.append(Variable(match.group(1)))
+        position = match.end()
+    literal.append(source[position:])
+    if text := "".join(literal):
+        parts.append(text)
+    return tuple(parts)
+
+
+def compile_tree(obj: Any) -> Any:
+    """
+    Recursively compile every string containing a template token in a nested structure.
+
+    Args:
+        obj: Object to compile (can be dict, list, or primitive)
+
+    Returns:
+        Object with template strings replaced by Templates
+    """
+    if isinstance(obj, dict):
+        return {key: compile_tree(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [compile_tree(item) for item in obj]
+    elif isinstance(obj, str) and "$" in obj:
+        return Template(obj)
+    return obj
+
+
+def render_tree(
+    obj: Any, variables: dict[str, Any], path: tuple = (), undefined: list[tuple[tuple, str]] | None = None
+) -> Any:
+    """
+    Recursively render a structure produced by compile_tree.
+
+    Args:
+        obj: Compiled object (can be dict, list, Template or primitive)
+        variables: Dictionary of variable names and their values
+        path: Path of the object, recorded alongside undefined variables
+        undefined: List that collects the path and name of undefined variables. When omitted, undefined variables
+            are left in the output unchanged.
+
+    Returns:
+        Object with template variables substituted
+    """
+    if isinstance(obj, dict):
+        return {key: render_tree(value, variables, (*path, key), undefined) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [render_tree(item, variables, (*path, index), undefined) for index, item in enumerate(obj)]
+    elif isinstance(obj, Template):
+        if undefined is None:
+            return obj.render(variables)
+        names: list[str] = []
+        rendered = obj.render(variables, names)
+        undefined.extend((path, name) for name in names)
+        return rendered
+    return obj
@@ -0,0 +1,149 @@
+import io
+import os
+import sys
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from stitch_worker.hub_propagation import (  # noqa: E402
+    FAILED,
+    HUB_CONSUMER_TAG,
+    SKIPPED,
+    UNCHANGED,
+    UPDATED,
+    find_hub_consumers,
+    propagate,
+    summarize,
+)
+
+HUB_VALUES = {"HUB_URL": "http://10.0.0.2:8000", "DATABASE_HOST": "10.0.0.2"}
+
+
+def function_code():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("index.py", "def handler(event, context):\n    return event\n")
+    return archive.getvalue()
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "UpdateFunctionConfiguration")
+
+
+@mock_aws
+class HubPropagationTest(unittest.TestCase):
+    def setUp(self):
+        environment = {
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+        patcher = mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.role_arn = boto3.client("iam").create_role(
+            RoleName="stitch-test-lambda", AssumeRolePolicyDocument="{}", Path="/"
+        )["Role"]["Arn"]
+        self.lambda_client = boto3.client("lambda")
+        self.sleeps = []
+
+    def create_function(self, name, variables, tags=None):
+        return self.lambda_client.create_function(
+            FunctionName=name,
+            Runtime="python3.12",
+            Role=self.role_arn,
+            Handler="index.handler",
+            Code={"ZipFile": function_code()},
+            Environment={"Variables": variables},
+            Tags=tags or {},
+        )["FunctionArn"]
+
+    def variables(self, name):
+        return self.lambda_client.get_function_configuration(FunctionName=name)["Environment"]["Variables"]
+
+    def propagate(self, function_names):
+        return propagate(self.lambda_client, function_names, HUB_VALUES, sleep=self.sleeps.append)
+
+    def test_finds_the_consumers_of_the_deployment_by_tag(self):
+        consumer = self.create_function("stitch-dev-refine", {"HUB_URL": "old"}, {HUB_CONSUMER_TAG: "stitch-dev"})
+        self.create_function("stitch-prod-refine", {"HUB_URL": "old"}, {HUB_CONSUMER_TAG: "stitch-prod"})
+        self.create_function("stitch-dev-crop", {"BUCKET": "files"})
+
+        arns = find_hub_consumers(boto3.client("resourcegroupstaggingapi"), "stitch", "dev")
+
+        self.assertEqual(arns, [consumer])
+
+    def test_updates_only_the_variables_a_function_defines(self):
+        self.create_function("stale", {"HUB_URL": "http://10.0.0.1:8000", "BUCKET": "files"})
+        self.create_function("current", dict(HUB_VALUES))
+        self.create_function("unrelated", {"BUCKET": "files"})
+
+        stale, current, unrelated = self.propagate(["stale", "current", "unrelated"])
+
+        self.assertEqual(stale.status, UPDATED)
+        self.assertEqual(stale.changes, {"HUB_URL": ("http://10.0.0.1:8000", "http://10.0.0.2:8000")})
+        self.assertEqual(self.variables("stale"), {"HUB_URL": "http://10.0.0.2:8000", "BUCKET": "files"})
+        self.assertEqual(current.status, UNCHANGED)
+        self.assertEqual(unrelated.status, SKIPPED)
+        self.assertEqual(self.variables("unrelated"), {"BUCKET": "files"})
+
+    def test_retries_conflicting_updates(self):
+        self.create_function("busy", {"HUB_URL": "old"})
+        update = self.lambda_client.update_function_configuration
+        conflicts = [client_error("ResourceConflictException"), client_error("ResourceConflictException")]
+
+        def conflict_then_update(**kwargs):
+            if conflicts:
+                raise conflicts.pop()
+            return update(**kwargs)
+
+        with mock.patch.object(self.lambda_client, "update_function_configuration", side_effect=conflict_then_update):
+            [result] = self.propagate(["busy"])
+
+        self.assertEqual((result.status, result.attempts), (UPDATED, 3))
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual(self.variables("busy")["HUB_URL"], HUB_VALUES["HUB_URL"])
+
+    def test_reports_failures_per_function(self):
+        self.create_function("denied", {"HUB_URL": "old"})
+        self.create_function("allowed", {"HUB_URL": "old"})
+        update = self.lambda_client.update_function_configuration
+
+        def deny(**kwargs):
+            if kwargs["FunctionName"] == "denied":
+                raise client_error("AccessDeniedException")
+            return update(**kwargs)
+
+        with mock.patch.object(self.lambda_client, "update_function_configuration", side_effect=deny):
+            results = self.propagate(["denied", "allowed", "missing"])
+
+        self.assertEqual([result.function_name for result in results], ["denied", "allowed", "missing"])
+        self.assertEqual([result.status for result in results], [FAILED, UPDATED, FAILED])
+        self.assertIn("AccessDeniedException", results[0].error)
+        self.assertEqual(results[0].attempts, 1)
+        self.assertEqual(self.variables("denied")["HUB_URL"], "old")
+        self.assertEqual(summarize(results), {UPDATED: 1, UNCHANGED: 0, SKIPPED: 0, FAILED: 2})
+
+    def test_gives_up_after_max_attempts(self):
+        self.create_function("stuck", {"HUB_URL": "old"})
+
+        with mock.patch.object(
+            self.lambda_client, "update_function_configuration", side_effect=client_error("TooManyRequestsException")
+        ):
+            [result] = propagate(self.lambda_client, ["stuck"], HUB_VALUES, max_attempts=3, sleep=self.sleeps.append)
+
+        self.assertEqual((result.status, result.attempts), (FAILED, 3))
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual(summarize([result])[FAILED], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
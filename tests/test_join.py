@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+
+# The join handler asset bundles handlers/ and event_patterns.py at its root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "stitch_worker"))
+
+from handlers.join import index  # noqa: E402
+
+TABLE_NAME = "stitch-test-joins"
+EVENT_BUS_NAME = "stitch-test-bus"
+WAITS_FOR = [
+    "BlockCroppingCompleted",
+    "SeedQuestionsGenerated",
+    "DocumentSummarizationCompleted",
+    "FeatureExtractionCompleted",
+]
+# Patterns of the conditional producers, as resolved from processes.yaml
+BRANCHES = {
+    "SeedQuestionsGenerated": {
+        "source": ["stitch.worker"],
+        "detail-type": ["BlockVectorizationCompleted"],
+        "detail": {"metadata": {"seed_questions": [{"exists": True}]}},
+    },
+    "FeatureExtractionCompleted": {
+        "source": ["stitch.worker"],
+        "detail-type": ["BlockRefinementCompleted"],
+        "detail": {"metadata": {"feature_types_count": [{"numeric": [">", 0]}]}},
+    },
+}
+
+
+def worker_event(detail_type, document_id, metadata=None, shard=None, run_id=None):
+    detail = {"document_id": document_id, "metadata": {**(metadata or {}), **({"run_id": run_id} if run_id else {})}}
+    if shard is not None:
+        detail["shard"] = shard
+    return {"source": "stitch.worker", "detail-type": detail_type, "detail": detail}
+
+
+@mock_aws
+class DocumentCompletionJoinTest(unittest.TestCase):
+    def setUp(self):
+        environment = {
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "JOIN_TABLE_NAME": TABLE_NAME,
+            "JOIN_NAME": "document-completion",
+            "JOIN_EMITS": "DocumentProcessingCompleted",
+            "EVENT_BUS_NAME": EVENT_BUS_NAME,
+            "JOIN_WAITS_FOR": json.dumps(WAITS_FOR),
+            "JOIN_BRANCHES": json.dumps(BRANCHES),
+        }
+        patcher = mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        boto3.client("dynamodb").create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{"AttributeName": "join_key", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "join_key", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        # Capture the completion events through a queue target of the bus
+        self.sqs = boto3.client("sqs")
+        events = boto3.client("events")
+        self.queue_url = self.sqs.create_queue(QueueName="completed")["QueueUrl"]
+        queue_arn = self.sqs.get_queue_attributes(QueueUrl=self.queue_url, AttributeNames=["QueueArn"])["Attributes"][
+            "QueueArn"
+        ]
+        events.create_event_bus(Name=EVENT_BUS_NAME)
+        events.put_rule(
+            Name="completed",
+            EventBusName=EVENT_BUS_NAME,
+            EventPattern=json.dumps({"detail-type": ["DocumentProcessingCompleted"]}),
+        )
+        events.put_targets(Rule="completed", EventBusName=EVENT_BUS_NAME, Targets=[{"Id": "queue", "Arn": queue_arn}])
+
+    def deliver(self, *worker_events):
+        records = [{"messageId": f"m{number}", "body": json.dumps(event)} for number, event in enumerate(worker_events)]
+        result = index.handler({"Records": records}, None)
+        self.assertEqual(result, {"batchItemFailures": []})
+
+    def completions(self):
+        messages = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10).get("Messages", [])
+        return [json.loads(message["Body"])["detail"] for message in messages]
+
+    def test_unsharded_document_skips_conditional_branches(self):
+        self.deliver(
+            worker_event("BlockRefinementCompleted", "doc-1"),
+            worker_event("BlockVectorizationCompleted", "doc-1"),
+            worker_event("BlockCroppingCompleted", "doc-1"),
+        )
+        self.assertEqual(self.completions(), [])
+
+        self.deliver(worker_event("DocumentSummarizationCompleted", "doc-1"))
+
+        [completed] = self.completions()
+        self.assertEqual(completed["document_id"], "doc-1")
+        self.assertEqual(completed["completed"], ["BlockCroppingCompleted", "DocumentSummarizationCompleted"])
+        self.assertEqual(completed["skipped"], ["SeedQuestionsGenerated", "FeatureExtractionCompleted"])
+        self.assertNotIn("shards", completed)
+
+    def test_sharded_document_completes_once_every_shard_arrived(self):
+        metadata = {"seed_questions": True, "feature_types_count": 2}
+        shards = [{"index": index, "count": 3, "first_page": 1, "last_page": 1} for index in range(3)]
+        for shard in shards:
+            self.deliver(
+                worker_event("BlockRefinementCompleted", "doc-2", metadata, shard),
+                worker_event("BlockVectorizationCompleted", "doc-2", metadata, shard),
+                worker_event("BlockCroppingCompleted", "doc-2", metadata, shard),
+                worker_event("SeedQuestionsGenerated", "doc-2", metadata, shard),
+            )
+        self.deliver(
+            worker_event("DocumentShardsAggregated", "doc-2", metadata),
+            worker_event("DocumentSummarizationCompleted", "doc-2", metadata),
+            worker_event("FeatureExtractionCompleted", "doc-2", metadata, shards[0]),
+            worker_event("FeatureExtractionCompleted", "doc-2", metadata, shards[1]),
+        )
+        self.assertEqual(self.completions(), [])
+
+        self.deliver(worker_event("FeatureExtractionCompleted", "doc-2", metadata, shards[2]))
+
+        [completed] = self.completions()
+        self.assertEqual(completed["completed"], WAITS_FOR)
+        self.assertEqual(completed["skipped"], [])
+        self.assertEqual(completed["shards"], 3)
+
+        # A redelivered shard event does not send a second completion
+        self.deliver(worker_event("FeatureExtractionCompleted", "doc-2", metadata, shards[2]))
+        self.assertEqual(self.completions(), [])
+
+    def test_sharded_document_counts_skipped_branches_per_shard(self):
+        shards = [{"index": index, "count": 2, "first_page": 1, "last_page": 1} for index in range(2)]
+        for shard in shards:
+            self.deliver(
+                worker_event("BlockRefinementCompleted", "doc-3", shard=shard),
+                worker_event("BlockVectorizationCompleted", "doc-3", shard=shard),
+            )
+        self.deliver(worker_event("BlockCroppingCompleted", "doc-3", shard=shards[0]))
+        self.deliver(worker_event("DocumentSummarizationCompleted", "doc-3"))
+        self.assertEqual(self.completions(), [])
+
+        self.deliver(worker_event("BlockCroppingCompleted", "doc-3", shard=shards[1]))
+
+        [completed] = self.completions()
+        self.assertEqual(completed["completed"], ["BlockCroppingCompleted", "DocumentSummarizationCompleted"])
+        self.assertEqual(completed["skipped"], ["SeedQuestionsGenerated", "FeatureExtractionCompleted"])
+
+    def test_document_processed_again_completes_again(self):
+        def run(run_id):
+            return [
+                worker_event("BlockRefinementCompleted", "doc-4", run_id=run_id),
+                worker_event("BlockVectorizationCompleted", "doc-4", run_id=run_id),
+                worker_event("BlockCroppingCompleted", "doc-4", run_id=run_id),
+                worker_event("DocumentSummarizationCompleted", "doc-4", run_id=run_id),
+            ]
+
+        self.deliver(*run("run-1"))
+        [completed] = self.completions()
+        self.assertEqual(completed["metadata"], {"run_id": "run-1"})
+
+        # Redelivered events of the first run are counted once, the events of a second run complete the join again
+        self.deliver(*run("run-1"))
+        self.assertEqual(self.completions(), [])
+        self.deliver(*run("run-2"))
+
+        [completed] = self.completions()
+        self.assertEqual(completed["metadata"], {"run_id": "run-2"})
+        self.assertEqual(completed["completed"], ["BlockCroppingCompleted", "DocumentSummarizationCompleted"])
+
+
+if __name__ == "__main__":
+    unittest.main()
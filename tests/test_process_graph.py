@@ -0,0 +1,70 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from stitch_worker.process_definition import ProcessDefinition  # noqa: E402
+from stitch_worker.process_graph import ProcessGraph  # noqa: E402
+
+
+def stage(name, detail_types, emits, detail=None):
+    return ProcessDefinition.model_validate(
+        {
+            "name": name,
+            "enabled": True,
+            "module": name.replace("-", "_"),
+            "id_prefix": name.title().replace("-", ""),
+            "event_pattern": {"source": ["stitch.worker"], "detail_type": detail_types, "detail": detail},
+            "emits": emits,
+        }
+    )
+
+
+class ConditionalEdgeTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = ProcessGraph(
+            [
+                stage("block-refinement", ["DocumentExtractionCompleted"], ["BlockRefinementCompleted"]),
+                stage(
+                    "document-summarization",
+                    ["BlockRefinementCompleted"],
+                    ["DocumentSummarizationCompleted"],
+                    {"shard": {"count": [{"exists": False}]}},
+                ),
+                stage(
+                    "feature-extraction",
+                    ["BlockRefinementCompleted"],
+                    ["FeatureExtractionCompleted"],
+                    {"metadata": {"feature_types_count": [{"numeric": [">", 0]}]}},
+                ),
+            ]
+        )
+
+    def test_only_skippable_branches_are_conditional(self):
+        conditional = {edge.consumer: edge.conditional for edge in self.graph.edges}
+        self.assertEqual(conditional, {"document-summarization": False, "feature-extraction": True})
+
+    def test_shard_routing_is_not_a_join_branch(self):
+        join = ProcessDefinition.model_validate(
+            {
+                "name": "document-completion",
+                "enabled": True,
+                "id_prefix": "DocumentCompletion",
+                "event_pattern": {"source": ["stitch.worker"]},
+                "join": {
+                    "waits_for": ["DocumentSummarizationCompleted", "FeatureExtractionCompleted"],
+                    "emits": "DocumentProcessingCompleted",
+                },
+            }
+        )
+        graph = ProcessGraph([*self.graph.processes.values(), join])
+
+        waits_for, branches = graph.resolve_join("document-completion")
+
+        self.assertEqual(waits_for, ["DocumentSummarizationCompleted", "FeatureExtractionCompleted"])
+        self.assertEqual(list(branches), ["FeatureExtractionCompleted"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+
+import redrive_dlq  # noqa: E402
+from stitch_worker.runtime.priority import HIGH_PRIORITY, LOW_PRIORITY  # noqa: E402
+
+
+def worker_event(document_id, priority=None):
+    metadata = {"priority": priority} if priority else {}
+    return {
+        "source": "stitch.worker",
+        "detail-type": "BlockRefinementCompleted",
+        "detail": {"document_id": document_id, "metadata": metadata},
+    }
+
+
+@mock_aws
+class RedriveTest(unittest.TestCase):
+    def setUp(self):
+        environment = {
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+        patcher = mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.sqs = boto3.client("sqs")
+        self.dlq_url = self.sqs.create_queue(QueueName="stitch-test-block-summarization-dlq")["QueueUrl"]
+        self.target_urls = {
+            LOW_PRIORITY: self.sqs.create_queue(QueueName="stitch-test-block-summarization")["QueueUrl"],
+            HIGH_PRIORITY: self.sqs.create_queue(QueueName="stitch-test-block-summarization-high")["QueueUrl"],
+        }
+
+    def dead_letter(self, *events):
+        for event in events:
+            self.sqs.send_message(QueueUrl=self.dlq_url, MessageBody=json.dumps(event))
+
+    def documents(self, queue_url):
+        """Receive every message of a queue and return the document IDs"""
+        documents = []
+        while messages := self.sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", []):
+            documents += [redrive_dlq.extract_document_id(message["Body"]) for message in messages]
+        return sorted(documents)
+
+    def redrive(self, **kwargs):
+        return redrive_dlq.redrive(self.sqs, self.dlq_url, self.target_urls, **kwargs)
+
+    def test_redrives_in_batches(self):
+        self.dead_letter(*(worker_event(f"doc-{number:02}") for number in range(25)))
+
+        with (
+            mock.patch.object(self.sqs, "send_message_batch", wraps=self.sqs.send_message_batch) as send,
+            mock.patch.object(self.sqs, "delete_message_batch", wraps=self.sqs.delete_message_batch) as delete,
+        ):
+            stats = self.redrive(concurrency=2)
+
+        self.assertEqual((stats.received, stats.redriven, stats.skipped, stats.failed), (25, 25, 0, 0))
+        for call in send.call_args_list + delete.call_args_list:
+            self.assertLessEqual(len(call.kwargs["Entries"]), redrive_dlq.SQS_MAX_BATCH_SIZE)
+        self.assertEqual(sum(len(call.kwargs["Entries"]) for call in send.call_args_list), 25)
+        self.assertEqual(sum(len(call.kwargs["Entries"]) for call in delete.call_args_list), 25)
+        self.assertEqual(self.documents(self.target_urls[LOW_PRIORITY]), [f"doc-{number:02}" for number in range(25)])
+        self.assertEqual(self.documents(self.dlq_url), [])
+
+    def test_filters_by_document_id(self):
+        self.dead_letter(worker_event("doc-1"), worker_event("doc-2"), worker_event("doc-1"), worker_event("doc-3"))
+
+        stats = self.redrive(document_ids=["doc-1"])
+
+        self.assertEqual((stats.received, stats.redriven, stats.skipped), (4, 2, 2))
+        self.assertEqual(self.documents(self.target_urls[LOW_PRIORITY]), ["doc-1", "doc-1"])
+        # The messages of other documents are visible again in the dead-letter queue
+        self.assertEqual(self.documents(self.dlq_url), ["doc-2", "doc-3"])
+
+    def test_stops_at_max_messages(self):
+        self.dead_letter(*(worker_event(f"doc-{number:02}") for number in range(25)))
+
+        stats = self.redrive(concurrency=4, max_messages=12)
+
+        self.assertEqual((stats.received, stats.redriven), (12, 12))
+        self.assertEqual(len(self.documents(self.target_urls[LOW_PRIORITY])), 12)
+        self.assertEqual(len(self.documents(self.dlq_url)), 13)
+
+    def test_routes_messages_to_their_priority_lane(self):
+        self.dead_letter(
+            worker_event("doc-1", priority=HIGH_PRIORITY), worker_event("doc-2"), worker_event("doc-3", HIGH_PRIORITY)
+        )
+
+        self.redrive()
+
+        self.assertEqual(self.documents(self.target_urls[HIGH_PRIORITY]), ["doc-1", "doc-3"])
+        self.assertEqual(self.documents(self.target_urls[LOW_PRIORITY]), ["doc-2"])
+
+    def test_sends_every_message_to_the_given_lane(self):
+        self.dead_letter(worker_event("doc-1"), worker_event("doc-2", HIGH_PRIORITY))
+
+        self.redrive(lane=HIGH_PRIORITY)
+
+        self.assertEqual(self.documents(self.target_urls[HIGH_PRIORITY]), ["doc-1", "doc-2"])
+        self.assertEqual(self.documents(self.target_urls[LOW_PRIORITY]), [])
+
+    def test_dry_run_keeps_the_messages(self):
+        self.dead_letter(worker_event("doc-1"), worker_event("doc-2"))
+
+        stats = self.redrive(dry_run=True)
+
+        self.assertEqual(stats.redriven, 2)
+        self.assertEqual(self.documents(self.target_urls[LOW_PRIORITY]), [])
+        self.assertEqual(self.documents(self.dlq_url), ["doc-1", "doc-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
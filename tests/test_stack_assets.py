@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import aws_cdk as cdk  # noqa: E402
+from aws_cdk.assertions import Template  # noqa: E402
+
+from stitch_worker import StitchWorkerSettings  # noqa: E402
+from stitch_worker.stitch_worker_stack import StitchWorkerStack  # noqa: E402
+
+SETTINGS = {
+    "lambda_image_tag": "test",
+    "lambda_document_completion": True,
+    "create_hub_instance": True,
+    "text_extraction_notification_handler": "repo",
+}
+
+
+class HandlerAssetTest(unittest.TestCase):
+    """Synthesize the stack and check that the handler assets hold the files their handlers import"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Asset paths are relative to the repository root, as when cdk synth runs the app
+        cwd = os.getcwd()
+        os.chdir(ROOT)
+        cls.addClassCleanup(os.chdir, cwd)
+        outdir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(outdir.cleanup)
+
+        context = json.loads((ROOT / "cdk.json").read_text())["context"]
+        # The app context drops settings whose value is None, so unset settings are passed as empty strings
+        settings = StitchWorkerSettings(**SETTINGS).model_dump()
+        context["settings"] = {name: "" if value is None else value for name, value in settings.items()}
+        app = cdk.App(context=context, outdir=outdir.name)
+        environment = context["environments"]["dev"]
+        stack = StitchWorkerStack(
+            app, "StitchWorkerStack", env=cdk.Environment(account=environment["account"], region=environment["region"])
+        )
+        cls.template = Template.from_stack(stack).to_json()
+        cls.outdir = Path(outdir.name)
+
+    def asset_files(self, handler):
+        """List the files in the asset of the function whose handler lives in handlers/<handler>"""
+        for resource in self.template["Resources"].values():
+            key = (
+                resource["Properties"].get("Code", {}).get("S3Key")
+                if resource["Type"] == "AWS::Lambda::Function"
+                else None
+            )
+            if not key:
+                continue
+            asset = self.outdir / f"asset.{key.removesuffix('.zip')}"
+            if (asset / "handlers" / handler).is_dir():
+                return sorted(str(path.relative_to(asset)) for path in asset.rglob("*") if path.is_file())
+        self.fail(f"No function asset contains handlers/{handler}")
+
+    def test_join_asset(self):
+        self.assertEqual(self.asset_files("join"), ["event_patterns.py", "handlers/join/index.py"])
+
+    def test_ec2_state_changer_asset(self):
+        self.assertEqual(
+            self.asset_files("ec2_state_changer"),
+            ["handlers/ec2_state_changer/index.py", "runtime/__init__.py", "runtime/hub_endpoint.py"],
+        )
+
+    def test_text_extract_notification_asset(self):
+        self.assertEqual(
+            self.asset_files("text_extract_notification"),
+            [
+                "handlers/text_extract_notification/index.py",
+                "runtime/__init__.py",
+                "runtime/runs.py",
+                "runtime/sharding.py",
+                "runtime/textract_jobs.py",
+            ],
+        )
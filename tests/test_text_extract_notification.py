@@ -0,0 +1,155 @@
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import boto3
+from moto import mock_aws
+from moto.textract.models import TextractBackend
+
+# The handler asset bundles handlers/ and runtime/ at its root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "stitch_worker"))
+
+from handlers.text_extract_notification import index  # noqa: E402
+from runtime.textract_jobs import save_job_context  # noqa: E402
+
+BUCKET = "stitch-test-files"
+KEY_PREFIX = "textract-output"
+EVENT_BUS_NAME = "stitch-test-bus"
+BLOCKS = [{"Id": f"block-{i}", "BlockType": "LINE", "Text": f"Line {i}", "Page": i // 10 + 1} for i in range(25)]
+
+
+def notification_record(message_id, job_id, status="SUCCEEDED", job_tag=None):
+    message = {
+        "JobId": job_id,
+        "Status": status,
+        "API": "StartDocumentAnalysis",
+        "DocumentLocation": {"S3ObjectName": "uploads/policy.pdf", "S3Bucket": BUCKET},
+    }
+    if job_tag:
+        message["JobTag"] = job_tag
+    envelope = {"Type": "Notification", "Message": json.dumps(message)}
+    return {"messageId": message_id, "body": json.dumps(envelope)}
+
+
+@mock_aws
+class TextExtractNotificationTest(unittest.TestCase):
+    def setUp(self):
+        environment = {
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "TEXT_EXTRACTION_S3_BUCKET": BUCKET,
+            "TEXT_EXTRACTION_S3_KEY_PREFIX": KEY_PREFIX,
+            "EVENT_BUS_NAME": EVENT_BUS_NAME,
+        }
+        patcher = mock.patch.dict(os.environ, environment)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, value in {"BLOCKS": BLOCKS, "PAGES": 3}.items():
+            patcher = mock.patch.object(TextractBackend, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.s3 = boto3.client("s3")
+        self.s3.create_bucket(Bucket=BUCKET)
+        self.textract = boto3.client("textract")
+
+        # Capture the emitted events through a queue target of the bus
+        sqs = boto3.client("sqs")
+        events = boto3.client("events")
+        queue_url = sqs.create_queue(QueueName="emitted")["QueueUrl"]
+        queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+        events.create_event_bus(Name=EVENT_BUS_NAME)
+        events.put_rule(
+            Name="completed",
+            EventBusName=EVENT_BUS_NAME,
+            EventPattern=json.dumps({"detail-type": ["DocumentExtractionCompleted"]}),
+        )
+        events.put_targets(Rule="completed", EventBusName=EVENT_BUS_NAME, Targets=[{"Id": "queue", "Arn": queue_arn}])
+        self.sqs = sqs
+        self.queue_url = queue_url
+
+    def start_job(self):
+        return self.textract.start_document_analysis(
+            DocumentLocation={"S3Object": {"Bucket": BUCKET, "Name": "uploads/policy.pdf"}},
+            FeatureTypes=["TABLES", "FORMS"],
+        )["JobId"]
+
+    def emitted_details(self):
+        messages = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10).get("Messages", [])
+        return [json.loads(message["Body"])["detail"] for message in messages]
+
+    def test_streams_blocks_and_carries_the_triggering_detail(self):
+        job_id = self.start_job()
+        triggering_detail = {
+            "bucket": {"name": BUCKET},
+            "object": {"key": "uploads/policy.pdf"},
+            "metadata": {"seed_questions": True, "feature_types_count": 2},
+            "shard": {"index": 1, "count": 3, "first_page": 11, "last_page": 20},
+        }
+        save_job_context(self.s3, BUCKET, KEY_PREFIX, job_id, "document-42", triggering_detail)
+
+        result = index.handler({"Records": [notification_record("m1", job_id, job_tag="high")]}, None)
+
+        self.assertEqual(result, {"batchItemFailures": []})
+        key = f"{KEY_PREFIX}/{job_id}/blocks.ndjson"
+        lines = self.s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], BLOCKS)
+
+        [detail] = self.emitted_details()
+        self.assertEqual(detail["document_id"], "document-42")
+        self.assertEqual(detail["job_id"], job_id)
+        self.assertEqual(detail["blocks"], {"bucket": BUCKET, "key": key, "format": "ndjson"})
+        self.assertEqual(detail["block_count"], len(BLOCKS))
+        self.assertEqual(detail["pages"], 3)
+        self.assertEqual(detail["metadata"], {"seed_questions": True, "feature_types_count": 2, "priority": "high"})
+        self.assertEqual(detail["shard"], triggering_detail["shard"])
+        self.assertEqual(detail["object"], {"key": "uploads/policy.pdf"})
+
+    def test_unsharded_document_starts_its_run(self):
+        job_id = self.start_job()
+        save_job_context(self.s3, BUCKET, KEY_PREFIX, job_id, "document-42", {"object": {"key": "uploads/policy.pdf"}})
+
+        result = index.handler({"Records": [notification_record("m1", job_id)]}, None)
+
+        self.assertEqual(result, {"batchItemFailures": []})
+        [detail] = self.emitted_details()
+        self.assertEqual(detail["metadata"], {"run_id": job_id})
+
+    def test_retries_a_job_without_saved_context(self):
+        job_id = self.start_job()
+
+        result = index.handler({"Records": [notification_record("m1", job_id)]}, None)
+
+        self.assertEqual(result, {"batchItemFailures": [{"itemIdentifier": "m1"}]})
+        self.assertEqual(self.emitted_details(), [])
+        listing = self.s3.list_objects_v2(Bucket=BUCKET, Prefix=f"{KEY_PREFIX}/{job_id}/")
+        self.assertEqual(listing["KeyCount"], 0)
+
+    def test_reports_failed_analyses(self):
+        job_id = self.start_job()
+        save_job_context(self.s3, BUCKET, KEY_PREFIX, job_id, "document-42", {})
+
+        result = index.handler({"Records": [notification_record("m1", job_id, status="FAILED")]}, None)
+
+        self.assertEqual(result, {"batchItemFailures": [{"itemIdentifier": "m1"}]})
+        self.assertEqual(self.emitted_details(), [])
+
+    def test_multipart_writer_uploads_parts(self):
+        part_size = 5 * 1024 * 1024
+        writer = index.MultipartWriter(self.s3, BUCKET, "large.ndjson", part_size=part_size)
+        line = b"x" * 1023 + b"\n"
+        for _ in range(11 * 1024):
+            writer.write(line)
+        writer.close()
+
+        self.assertEqual(len(writer.parts), 3)
+        body = self.s3.get_object(Bucket=BUCKET, Key="large.ndjson")["Body"].read()
+        self.assertEqual(len(body), 11 * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 """
-Script to manually update Lambda environment variables with the current EC2 instance IP.
-Run this script after your EC2 instance has started to update all Lambda functions.
+Script to manually publish the hub endpoint of the current EC2 instance address.
+Run this script after your EC2 instance has started; the Lambda functions pick up the new endpoint from the hub
+endpoint parameter without being redeployed. Use --rewrite-environment for functions deployed before they read it.
 """
 
 import boto3
 import argparse
 import sys
-
-
-def get_ec2_public_ip(instance_id):
-    """Get the public IP address of an EC2 instance"""
+from urllib.parse import urlparse
+
+from stitch_worker.hub_propagation import (
+    FAILED,
+    HUB_CONSUMER_TAG,
+    SKIPPED,
+    UNCHANGED,
+    UPDATED,
+    find_hub_consumers,
+    propagate,
+    summarize,
+)
+from stitch_worker.runtime.hub_endpoint import HubEndpoint, hub_endpoint_parameter_name, publish_hub_endpoint
+
+
+def get_ec2_public_dns_name(instance_id):
+    """Get the public DNS name of an EC2 instance, the address the EC2 state change handler publishes"""
     ec2_client = boto3.client("ec2")
     try:
         response = ec2_client.describe_instances(InstanceIds=[instance_id])
@@ -18,100 +32,133 @@ def get_ec2_public_ip(instance_id):
             raise ValueError(f"No reservations found for instance {instance_id}")
 
         instance = response["Reservations"][0]["Instances"][0]
-        public_ip = instance.get("PublicIpAddress")
+        public_dns_name = instance.get("PublicDnsName")
 
-        if not public_ip:
-            raise ValueError(f"No public IP found for instance {instance_id}")
+        if not public_dns_name:
+            raise ValueError(f"No public DNS name found for instance {instance_id}")
 
-        return public_ip
+        return public_dns_name
     except Exception as e:
-        print(f"Error getting EC2 instance IP: {e}")
+        print(f"Error getting EC2 instance DNS name: {e}")
         sys.exit(1)
 
 
-def update_lambda_environment_variables(prefix, suffix, hub_url):
-    """Update all Lambda functions with the new hub URL"""
-    lambda_client = boto3.client("lambda")
-    updated_functions = []
-    skipped_functions = []
-    error_functions = []
+def resolve_database_host(ssm_client, parameter_name, hub_host):
+    """
+    Get the database host to publish with a new hub address.
 
+    The database follows the hub when it runs on the hub instance, i.e. when the published database host is the
+    host of the published hub URL, or when nothing was published yet. Otherwise, e.g. behind RDS Proxy, the
+    published database host is kept.
+    """
+    try:
+        value = ssm_client.get_parameter(Name=parameter_name)["Parameter"]["Value"]
+    except ssm_client.exceptions.ParameterNotFound:
+        return hub_host
+    current = HubEndpoint.from_json(value)
+    if current.database_host and current.database_host != urlparse(current.hub_url).hostname:
+        return current.database_host
+    return hub_host
+
+
+def publish_endpoint(prefix, suffix, hub_url, database_host=None):
+    """
+    Write the hub endpoint to the parameter the Lambda functions read it from.
+
+    Without a database host, the database host of the parameter is kept unless the database runs on the hub.
+    """
+    parameter_name = hub_endpoint_parameter_name(prefix, suffix)
+    ssm_client = boto3.client("ssm")
     try:
-        # List all Lambda functions with our prefix
-        paginator = lambda_client.get_paginator("list_functions")
-
-        for page in paginator.paginate():
-            for function in page["Functions"]:
-                if function["FunctionName"].startswith(f"{prefix}-{suffix}-"):
-                    try:
-                        # Get current configuration
-                        config_response = lambda_client.get_function_configuration(
-                            FunctionName=function["FunctionName"]
-                        )
-                        environment = config_response.get("Environment", {})
-                        variables = environment.get("Variables", {})
-
-                        # Update HUB_URL if it exists
-                        if "HUB_URL" in variables:
-                            old_url = variables["HUB_URL"]
-                            variables["HUB_URL"] = hub_url
-
-                            # Update the function
-                            lambda_client.update_function_configuration(
-                                FunctionName=function["FunctionName"], Environment={"Variables": variables}
-                            )
-                            updated_functions.append(function["FunctionName"])
-                            print(f"✅ Updated {function['FunctionName']} HUB_URL: {old_url} -> {hub_url}")
-                        else:
-                            skipped_functions.append(function["FunctionName"])
-                            print(f"⏭️  Skipped {function['FunctionName']} - no HUB_URL found")
-
-                    except Exception as e:
-                        error_functions.append(function["FunctionName"])
-                        print(f"❌ Error updating {function['FunctionName']}: {str(e)}")
-
-        # Summary
-        print("\n📊 Summary:")
-        print(f"✅ Updated: {len(updated_functions)} functions")
-        print(f"⏭️  Skipped: {len(skipped_functions)} functions")
-        print(f"❌ Errors: {len(error_functions)} functions")
-
-        if updated_functions:
-            print(f"\n🎯 New hub URL: {hub_url}")
-            print(f"📝 Updated functions: {', '.join(updated_functions)}")
-
-        return len(updated_functions) > 0
+        database_host = database_host or resolve_database_host(ssm_client, parameter_name, urlparse(hub_url).hostname)
+        changed = publish_hub_endpoint(ssm_client, parameter_name, HubEndpoint(hub_url, database_host))
+    except Exception as e:
+        print(f"Error publishing hub endpoint to {parameter_name}: {e}")
+        return False
 
+    if changed:
+        print(f"✅ Published hub URL {hub_url} and database host {database_host} to {parameter_name}")
+    else:
+        print(f"👌 Unchanged {parameter_name} - hub URL already set")
+    return True
+
+
+def update_lambda_environment_variables(prefix, suffix, hub_url, max_workers=8):
+    """Update the Lambda functions tagged as hub consumers with the new hub URL"""
+    try:
+        function_names = find_hub_consumers(boto3.client("resourcegroupstaggingapi"), prefix, suffix)
+        results = propagate(boto3.client("lambda"), function_names, {"HUB_URL": hub_url}, max_workers=max_workers)
     except Exception as e:
         print(f"Error listing/updating Lambda functions: {e}")
         return False
 
+    for result in results:
+        timing = f"{result.seconds:.2f}s, {result.attempts} attempts"
+        if result.status == UPDATED:
+            old_url, _ = result.changes["HUB_URL"]
+            print(f"✅ Updated {result.function_name} HUB_URL: {old_url} -> {hub_url} ({timing})")
+        elif result.status == UNCHANGED:
+            print(f"👌 Unchanged {result.function_name} - HUB_URL already set ({timing})")
+        elif result.status == SKIPPED:
+            print(f"⏭️  Skipped {result.function_name} - no HUB_URL found")
+        else:
+            print(f"❌ Error updating {result.function_name}: {result.error} ({timing})")
+
+    # Summary
+    counts = summarize(results)
+    print("\n📊 Summary:")
+    print(f"✅ Updated: {counts[UPDATED]} functions")
+    print(f"👌 Unchanged: {counts[UNCHANGED]} functions")
+    print(f"⏭️  Skipped: {counts[SKIPPED]} functions")
+    print(f"❌ Errors: {counts[FAILED]} functions")
+    if results:
+        slowest = max(results, key=lambda result: result.seconds)
+        print(f"⏱️  Slowest: {slowest.function_name} ({slowest.seconds:.2f}s)")
+
+    if counts[UPDATED]:
+        print(f"\n🎯 New hub URL: {hub_url}")
+
+    return counts[FAILED] == 0 and counts[UPDATED] + counts[UNCHANGED] > 0
+
 
 def main():
-    parser = argparse.ArgumentParser(description="Update Lambda environment variables with EC2 instance IP")
+    parser = argparse.ArgumentParser(description="Publish the hub endpoint of an EC2 instance")
     parser.add_argument("--instance-id", required=True, help="EC2 instance ID")
     parser.add_argument("--prefix", default="stitch", help="Lambda function name prefix")
     parser.add_argument("--suffix", default="dev", help="Lambda function name suffix")
     parser.add_argument("--port", default="5050", help="Hub port number")
     parser.add_argument("--path", default="/hub/api/v1", help="Hub API path")
+    parser.add_argument(
+        "--database-host",
+        help="Database host to publish, defaults to the published one, or the instance if the database runs on the hub",
+    )
+    parser.add_argument(
+        "--rewrite-environment",
+        action="store_true",
+        help="Also set HUB_URL in the environment of the Lambda functions, which restarts their containers",
+    )
+    parser.add_argument("--max-workers", type=int, default=8, help="Functions updated at the same time")
 
     args = parser.parse_args()
 
-    print(f"🔍 Getting public IP for instance {args.instance_id}...")
-    public_ip = get_ec2_public_ip(args.instance_id)
-    hub_url = f"http://{public_ip}:{args.port}{args.path}"
+    print(f"🔍 Getting public DNS name for instance {args.instance_id}...")
+    public_dns_name = get_ec2_public_dns_name(args.instance_id)
+    hub_url = f"http://{public_dns_name}:{args.port}{args.path}"
 
-    print(f"🌐 EC2 instance public IP: {public_ip}")
+    print(f"🌐 EC2 instance public DNS name: {public_dns_name}")
     print(f"🔗 Hub URL: {hub_url}")
-    print(f"🔧 Updating Lambda functions with prefix '{args.prefix}-{args.suffix}-'...")
+    print("📝 Publishing hub endpoint...")
+    success = publish_endpoint(args.prefix, args.suffix, hub_url, args.database_host)
 
-    success = update_lambda_environment_variables(args.prefix, args.suffix, hub_url)
+    if args.rewrite_environment:
+        print(f"\n🔧 Updating Lambda functions tagged {HUB_CONSUMER_TAG}={args.prefix}-{args.suffix}...")
+        success = update_lambda_environment_variables(args.prefix, args.suffix, hub_url, args.max_workers) and success
 
     if success:
-        print("\n🎉 Successfully updated Lambda environment variables!")
+        print("\n🎉 Successfully published the hub endpoint!")
         print("💡 You can now test your Lambda functions with the new hub URL.")
     else:
-        print("\n⚠️  No Lambda functions were updated.")
+        print("\n⚠️  The hub URL was not propagated to every Lambda function.")
         sys.exit(1)
 
 